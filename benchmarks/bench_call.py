@@ -0,0 +1,75 @@
+"""
+Benchmark the short format output of cstag.call().
+
+Compares the direct short format emission with the former two-pass path
+(generate the long format, then convert it with cstag.shorten).
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_call.py
+"""
+
+from __future__ import annotations
+
+import random
+import timeit
+
+from cstag.call import generate_cs_long, trim_clips
+from cstag.shorten import shorten
+from cstag import call
+
+READ_LENGTHS = [150, 1_000, 10_000, 100_000, 1_000_000]
+ERROR_RATE = 0.01
+
+
+def simulate_alignment(read_length: int, seed: int = 1) -> tuple[str, str, str]:
+    """Simulate CIGAR, MD and SEQ of a read with ~1% substitutions, insertions and deletions."""
+    rng = random.Random(seed)
+    cigar, md, seq = [], [], []
+    num_m, num_match = 0, 0
+    while len(seq) < read_length:
+        base = rng.choice("ACGT")
+        event = rng.random()
+        if event < ERROR_RATE / 3:
+            cigar.append(f"{num_m + 1}M")
+            md.append(f"{num_match}{rng.choice('ACGT'.replace(base, ''))}")
+            num_m, num_match = 0, 0
+            cigar.append("2I")
+            seq.extend([base, "A", "C"])
+        elif event < ERROR_RATE * 2 / 3:
+            cigar.append(f"{num_m}M2D")
+            md.append(f"{num_match}^GT")
+            num_m, num_match = 0, 0
+        elif event < ERROR_RATE:
+            md.append(f"{num_match}{rng.choice('ACGT'.replace(base, ''))}")
+            num_m, num_match = num_m + 1, 0
+            seq.append(base)
+        else:
+            num_m += 1
+            num_match += 1
+            seq.append(base)
+    cigar.append(f"{num_m}M")
+    md.append(str(num_match))
+    return "".join(cigar), "".join(md), "".join(seq)
+
+
+def two_pass(cigar: str, md: str, seq: str) -> str:
+    cigar, seq = trim_clips(cigar, seq)
+    return shorten(generate_cs_long(cigar, md, seq))
+
+
+def main() -> None:
+    print(f"{'read length':>12} {'two-pass (ms)':>14} {'direct (ms)':>12} {'speedup':>8}")
+    for read_length in READ_LENGTHS:
+        cigar, md, seq = simulate_alignment(read_length)
+        assert two_pass(cigar, md, seq) == call(cigar, md, seq)
+        number = max(1, 200_000 // read_length)
+        time_two_pass = min(timeit.repeat(lambda: two_pass(cigar, md, seq), number=number, repeat=3)) / number
+        time_direct = min(timeit.repeat(lambda: call(cigar, md, seq), number=number, repeat=3)) / number
+        print(
+            f"{read_length:>12,} {time_two_pass * 1e3:>14.3f} {time_direct * 1e3:>12.3f}"
+            f" {time_two_pass / time_direct:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark the throughput of the cs tag functions.
+
+Run it on two revisions to compare them:
+    PYTHONPATH=src python benchmarks/bench_functions.py
+"""
+
+from __future__ import annotations
+
+import random
+import timeit
+
+import cstag
+
+READ_LENGTHS = [150, 10_000, 100_000]
+ERROR_RATE = 0.01
+
+
+def simulate_cs_tag(read_length: int, seed: int = 1) -> str:
+    """Simulate a cs tag in the long format with ~1% substitutions, insertions and deletions."""
+    rng = random.Random(seed)
+    cs_tag, matches = [], []
+    for _ in range(read_length):
+        event = rng.random()
+        if event >= ERROR_RATE:
+            matches.append(rng.choice("ACGT"))
+            continue
+        if matches:
+            cs_tag.append("=" + "".join(matches))
+            matches = []
+        if event < ERROR_RATE / 3:
+            cs_tag.append("*" + rng.choice(["ac", "gt", "ca", "tg"]))
+        elif event < ERROR_RATE * 2 / 3:
+            cs_tag.append("+" + "".join(rng.choice("acgt") for _ in range(rng.randint(1, 5))))
+        else:
+            cs_tag.append("-" + "".join(rng.choice("acgt") for _ in range(rng.randint(1, 5))))
+    cs_tag.append("=" + "".join(matches) if matches else "=A")
+    return "".join(cs_tag)
+
+
+def main() -> None:
+    print(f"{'function':>12} {'read length':>12} {'reads/s':>12}")
+    for read_length in READ_LENGTHS:
+        cs_long = simulate_cs_tag(read_length)
+        cs_short = cstag.shorten(cs_long)
+        seq = cstag.to_sequence(cs_long)
+        cigar = f"{len(seq)}M"
+        qual = "".join(random.Random(1).choice("!+5?I") for _ in seq)
+        benchmarks = {
+            "shorten": lambda: cstag.shorten(cs_long),
+            "lengthen": lambda: cstag.lengthen(cs_short, cigar, seq),
+            "split": lambda: cstag.split(cs_long),
+            "revcomp": lambda: cstag.revcomp(cs_long),
+            "mask": lambda: cstag.mask(cs_long, cigar, qual),
+            "to_sequence": lambda: cstag.to_sequence(cs_long),
+            "to_html": lambda: cstag.to_html(cs_long),
+            "to_vcf": lambda: cstag.to_vcf([cs_long] * 10, ["chr1"] * 10, [1] * 10),
+            "consensus": lambda: cstag.consensus([cs_long] * 10, [1] * 10),
+        }
+        for name, function in benchmarks.items():
+            number = max(1, 100_000 // read_length)
+            elapsed = min(timeit.repeat(function, number=number, repeat=5)) / number
+            print(f"{name:>12} {read_length:>12,} {1 / elapsed:>12,.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark the grouping of overlapping reads in cstag.to_vcf().
+
+Compares the running maximum sweep with the former comparison of each read to the members of the current group.
+Reads tile the reference with a step of one base, so that a read overlaps only the latest members of its group.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_group.py
+"""
+
+from __future__ import annotations
+
+import timeit
+
+from cstag.to_vcf import CsInfo, group_by_overlapping_intervals
+
+NUM_READS = [10_000, 100_000, 1_000_000]
+READ_LENGTH = 150
+# The former grouping is quadratic, so it is timed up to this number of reads only
+MAX_NUM_READS_PAIRWISE = 10_000
+
+
+def simulate_reads(num_reads: int) -> list[CsInfo]:
+    """Simulate reads of READ_LENGTH bases starting at every position, all overlapping through their neighbours"""
+    return [CsInfo(cs_tag="", pos_start=pos, pos_end=pos + READ_LENGTH - 1) for pos in range(1, num_reads + 1)]
+
+
+def group_pairwise(cs_tags_grouped: list[CsInfo]) -> list[list[CsInfo]]:
+    sorted_data = sorted(cs_tags_grouped, key=lambda x: x.pos_start)
+    grouped_intervals = []
+    current_group = [sorted_data[0]]
+    for cs_info in sorted_data[1:]:
+        if any(cs_info.pos_start <= j.pos_end and cs_info.pos_end >= j.pos_start for j in current_group):
+            current_group.append(cs_info)
+        else:
+            grouped_intervals.append(current_group)
+            current_group = [cs_info]
+    grouped_intervals.append(current_group)
+    return grouped_intervals
+
+
+def main() -> None:
+    print(f"{'reads':>10} {'pairwise (s)':>13} {'sweep (s)':>10} {'presorted (s)':>14}")
+    for num_reads in NUM_READS:
+        reads = simulate_reads(num_reads)
+        time_sweep = min(timeit.repeat(lambda: group_by_overlapping_intervals(reads), number=1, repeat=3))
+        time_presorted = min(
+            timeit.repeat(lambda: group_by_overlapping_intervals(reads, presorted=True), number=1, repeat=3)
+        )
+        if num_reads <= MAX_NUM_READS_PAIRWISE:
+            assert group_pairwise(reads) == group_by_overlapping_intervals(reads)
+            time_pairwise = f"{min(timeit.repeat(lambda: group_pairwise(reads), number=1, repeat=3)):>13.3f}"
+        else:
+            time_pairwise = f"{'-':>13}"
+        print(f"{num_reads:>10,} {time_pairwise} {time_sweep:>10.3f} {time_presorted:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark cstag.to_vcf() and cstag.consensus_blocks() restricted to target regions.
+
+Reads tile a chromosome, and a few hundred targets cover about 1% of it.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_regions.py
+"""
+
+from __future__ import annotations
+
+import random
+import time
+
+import cstag
+
+NUM_READS = 20_000
+READ_LENGTH = 500
+STEP = 100
+ERROR_RATE = 0.01
+NUM_TARGETS = 200
+TARGET_LENGTH = 100
+
+
+def simulate_reads(seed: int = 1) -> tuple[list[str], list[int], list[tuple[str, int, int]]]:
+    """Simulate reads starting every STEP bases with ~1% substitutions, and targets spread over the reads"""
+    rng = random.Random(seed)
+    cs_tags = []
+    for _ in range(NUM_READS):
+        cs_tag, matches = [], []
+        for _ in range(READ_LENGTH):
+            base = rng.choice("ACGT")
+            if rng.random() >= ERROR_RATE:
+                matches.append(base)
+                continue
+            if matches:
+                cs_tag.append("=" + "".join(matches))
+                matches = []
+            cs_tag.append("*" + base.lower() + ("a" if base != "A" else "c"))
+        if matches:
+            cs_tag.append("=" + "".join(matches))
+        cs_tags.append("".join(cs_tag))
+    positions = [i * STEP + 1 for i in range(NUM_READS)]
+    span = NUM_READS * STEP
+    targets = [("chr1", start, start + TARGET_LENGTH - 1) for start in sorted(rng.sample(range(1, span), NUM_TARGETS))]
+    return cs_tags, positions, targets
+
+
+def main() -> None:
+    cs_tags, positions, targets = simulate_reads()
+    chroms = ["chr1"] * NUM_READS
+    intervals = [(start, end) for _, start, end in targets]
+    print(f"{NUM_READS:,} reads of {READ_LENGTH} bases, {NUM_TARGETS} targets of {TARGET_LENGTH} bases")
+    print(f"{'function':>17} {'all (s)':>8} {'targets (s)':>12}")
+    for name, run_all, run_targets in [
+        (
+            "to_vcf",
+            lambda: cstag.to_vcf(cs_tags, chroms, positions),
+            lambda: cstag.to_vcf(cs_tags, chroms, positions, regions=targets),
+        ),
+        (
+            "consensus_blocks",
+            lambda: cstag.consensus_blocks(cs_tags, positions),
+            lambda: cstag.consensus_blocks(cs_tags, positions, regions=intervals),
+        ),
+    ]:
+        start = time.perf_counter()
+        run_all()
+        time_all = time.perf_counter() - start
+        start = time.perf_counter()
+        run_targets()
+        time_targets = time.perf_counter() - start
+        print(f"{name:>17} {time_all:>8.2f} {time_targets:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark cstag.to_vcf() on an amplicon panel, over an increasing number of worker processes.
+
+Each amplicon is an independent group of overlapping reads, so the groups are spread over the workers.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_to_vcf.py
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import time
+
+import cstag
+
+NUM_AMPLICONS = 2_000
+READS_PER_AMPLICON = 50
+AMPLICON_LENGTH = 200
+ERROR_RATE = 0.01
+
+
+def simulate_panel(seed: int = 1) -> tuple[list[str], list[str], list[int]]:
+    """Simulate reads of amplicons 10 kb apart, with ~1% substitutions and deletions shared by half of the reads"""
+    rng = random.Random(seed)
+    cs_tags, chroms, positions = [], [], []
+    for amplicon in range(NUM_AMPLICONS):
+        reference = "".join(rng.choice("ACGT") for _ in range(AMPLICON_LENGTH))
+        variants = {i: rng.choice("*-") for i in range(1, AMPLICON_LENGTH - 1) if rng.random() < ERROR_RATE}
+        for read in range(READS_PER_AMPLICON):
+            cs_tag, matches = [], []
+            for i, base in enumerate(reference):
+                if i not in variants or read % 2:
+                    matches.append(base)
+                    continue
+                if matches:
+                    cs_tag.append("=" + "".join(matches))
+                    matches = []
+                if variants[i] == "*":
+                    cs_tag.append("*" + base.lower() + ("a" if base != "A" else "c"))
+                else:
+                    cs_tag.append("-" + base.lower())
+            cs_tag.append("=" + "".join(matches))
+            cs_tags.append("".join(cs_tag))
+            chroms.append(f"chr{amplicon % 22 + 1}")
+            positions.append(amplicon * 10_000 + 1)
+    return cs_tags, chroms, positions
+
+
+def main() -> None:
+    cs_tags, chroms, positions = simulate_panel()
+    print(f"{NUM_AMPLICONS:,} amplicons x {READS_PER_AMPLICON} reads, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'time (s)':>9}")
+    expected = None
+    for workers in [1, 2, 4, 8]:
+        start = time.perf_counter()
+        vcf = cstag.to_vcf(cs_tags, chroms, positions, workers=workers)
+        elapsed = time.perf_counter() - start
+        expected = expected or vcf
+        assert vcf == expected
+        print(f"{workers:>8} {elapsed:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark the depth and VAF thresholds of cstag.to_vcf() on deep, noisy reads.
+
+Each read carries ~5% substitutions of its own, seen once (AD=1), besides a few variants shared by half of the reads,
+as in nanopore reads of amplicons.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_to_vcf_filters.py
+"""
+
+from __future__ import annotations
+
+import random
+import time
+
+import cstag
+
+NUM_AMPLICONS = 10
+READS_PER_AMPLICON = 100
+AMPLICON_LENGTH = 3_000
+ERROR_RATE = 0.05
+THRESHOLDS = [{}, {"min_vaf": 0.01}, {"min_ad": 2}, {"min_ad": 5}, {"min_ad": 5, "min_vaf": 0.01}]
+
+
+def simulate_reads(seed: int = 1) -> tuple[list[str], list[str], list[int]]:
+    """Simulate reads of amplicons 10 kb apart, with errors of their own and variants shared by half of the reads"""
+    rng = random.Random(seed)
+    cs_tags, chroms, positions = [], [], []
+    for amplicon in range(NUM_AMPLICONS):
+        reference = "".join(rng.choice("ACGT") for _ in range(AMPLICON_LENGTH))
+        variants = set(rng.sample(range(AMPLICON_LENGTH), 5))
+        for read in range(READS_PER_AMPLICON):
+            cs_tag, matches = [], []
+            for i, base in enumerate(reference):
+                if not (i in variants and read % 2) and rng.random() >= ERROR_RATE:
+                    matches.append(base)
+                    continue
+                if matches:
+                    cs_tag.append("=" + "".join(matches))
+                    matches = []
+                cs_tag.append("*" + base.lower() + rng.choice([b for b in "acgt" if b != base.lower()]))
+            if matches:
+                cs_tag.append("=" + "".join(matches))
+            cs_tags.append("".join(cs_tag))
+            chroms.append("chr1")
+            positions.append(amplicon * 10_000 + 1)
+    return cs_tags, chroms, positions
+
+
+def main() -> None:
+    cs_tags, chroms, positions = simulate_reads()
+    print(f"{NUM_AMPLICONS} amplicons x {READS_PER_AMPLICON} reads of {AMPLICON_LENGTH} bases")
+    print(f"{'thresholds':>28} {'time (s)':>9} {'records':>8}")
+    for thresholds in THRESHOLDS:
+        start = time.perf_counter()
+        vcf = cstag.to_vcf(cs_tags, chroms, positions, **thresholds)
+        elapsed = time.perf_counter() - start
+        num_records = sum(not line.startswith("#") for line in vcf.split("\n"))
+        label = ", ".join(f"{key}={value}" for key, value in thresholds.items()) or "-"
+        print(f"{label:>28} {elapsed:>9.2f} {num_records:>8,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark the peak memory of cstag.to_vcf() on noisy reads, with and without a memory budget for the VCF records.
+
+Each read carries its own substitutions, so that the number of VCF records grows with the number of reads.
+The peak is measured over the call only, on top of the input cs tags.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_to_vcf_memory.py
+"""
+
+from __future__ import annotations
+
+import random
+import time
+import tracemalloc
+
+import cstag
+
+NUM_READS = 20_000
+READ_LENGTH = 200
+ERROR_RATE = 0.05
+MAX_MEMORY = [None, 10_000_000, 1_000_000]
+
+
+def simulate_reads(seed: int = 1) -> tuple[list[str], list[str], list[int]]:
+    """Simulate reads spaced 300 bases apart on chromosome 1, with ~5% substitutions of their own"""
+    rng = random.Random(seed)
+    cs_tags = []
+    for _ in range(NUM_READS):
+        cs_tag, matches = [], []
+        for _ in range(READ_LENGTH):
+            base = rng.choice("acgt")
+            if rng.random() >= ERROR_RATE:
+                matches.append(base.upper())
+                continue
+            if matches:
+                cs_tag.append("=" + "".join(matches))
+                matches = []
+            cs_tag.append("*" + base + rng.choice([b for b in "acgt" if b != base]))
+        if matches:
+            cs_tag.append("=" + "".join(matches))
+        cs_tags.append("".join(cs_tag))
+    return cs_tags, ["chr1"] * NUM_READS, [i * 300 + 1 for i in range(NUM_READS)]
+
+
+def main() -> None:
+    cs_tags, chroms, positions = simulate_reads()
+    print(f"{NUM_READS:,} reads of {READ_LENGTH} bases")
+    print(f"{'max_memory (MB)':>16} {'time (s)':>9} {'peak (MB)':>10}")
+    expected = None
+    for max_memory in MAX_MEMORY:
+        tracemalloc.start()
+        start = time.perf_counter()
+        vcf = cstag.to_vcf(cs_tags, chroms, positions, max_memory=max_memory)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        expected = expected or vcf
+        assert vcf == expected
+        label = "-" if max_memory is None else f"{max_memory / 1e6:g}"
+        print(f"{label:>16} {elapsed:>9.2f} {peak / 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,17 @@
 .. include:: ../../README.md
 """
 
-from cstag.call import call
+from cstag.call import call, call_many, set_call_cache_size, call_cache_info
+from cstag.call_sam import call_sam, write_sam
+from cstag.reference import Reference
 from cstag.shorten import shorten
 from cstag.lengthen import lengthen
-from cstag.consensus import consensus
-from cstag.mask import mask
-from cstag.split import split
+from cstag.consensus import consensus, consensus_blocks, consensus_groups, adaptive_consensus, ConsensusBuilder
+from cstag.mask import mask, mask_many
+from cstag.split import split, iter_split
+from cstag.index import CsIndex
+from cstag.slice import slice
 from cstag.revcomp import revcomp
 from cstag.to_html import to_html
-from cstag.to_vcf import to_vcf
+from cstag.to_vcf import to_vcf, iter_vcf, write_vcf
 from cstag.to_sequence import to_sequence
@@ -1,6 +1,13 @@
 from __future__ import annotations
 
-from cstag.shorten import shorten
+from itertools import islice, zip_longest
+from typing import Iterable, Iterator
+
+from cstag.reference import Reference
+from cstag.utils.cache import CacheInfo, LRUCache
+from cstag.utils.validator import validate_pos
+from cstag.utils.buffer import accept_bytes
+from cstag.utils.pool import imap_batches
 
 
 ###########################################################
@@ -51,102 +58,237 @@ def join_cigar(cigar_tuples: list[tuple[str, int]]) -> str:
     return "".join(f"{length}{operation}" for operation, length in cigar_tuples)
 
 
-def trim_clips(cigar: str, seq: str) -> tuple[str, str]:
+def clip_cigar(cigar: str) -> tuple[str, int, int]:
+    """
+    Trim soft and hard clips from a CIGAR string.
+    Return the trimmed CIGAR with the lengths of the leading and trailing soft clips.
+    """
     if all(x not in cigar for x in "SH"):
-        return cigar, seq
+        return cigar, 0, 0
     parsed_cigar = parse_cigar(cigar)
-    # trim soft clips of cigar and seq
+    length_left, length_right = 0, 0
+    # trim soft clips
     if parsed_cigar[0][0] == "S":
-        length_softclip = parsed_cigar[0][1]
-        seq = seq[length_softclip:]
+        length_left = parsed_cigar[0][1]
         parsed_cigar = parsed_cigar[1:]
     if parsed_cigar[-1][0] == "S":
-        length_softclip = parsed_cigar[-1][1]
-        seq = seq[:-length_softclip]
+        length_right = parsed_cigar[-1][1]
         parsed_cigar = parsed_cigar[:-1]
-    # trim hard clips of cigar
+    # trim hard clips
     if parsed_cigar[0][0] == "H":
         parsed_cigar = parsed_cigar[1:]
     if parsed_cigar[-1][0] == "H":
         parsed_cigar = parsed_cigar[:-1]
-    cigar = join_cigar(parsed_cigar)
-    return cigar, seq
+    return join_cigar(parsed_cigar), length_left, length_right
+
+
+def trim_clips(cigar: str, seq: str) -> tuple[str, str]:
+    cigar, length_left, length_right = clip_cache(cigar)
+    if length_right:
+        return cigar, seq[length_left:-length_right]
+    return cigar, seq[length_left:]
 
 
 ###########################################################
-# Generate cs tag in long format
+# Cache the parsed CIGAR and MD
 ###########################################################
 
 
-def expand_cigar_operations(cigar: str) -> list[str]:
-    parsed_cigar = parse_cigar(cigar)
-    expanded_list = []
-    for op, num in parsed_cigar:
-        if op in ["D", "N", "I"]:
-            expanded_list.append(op * num)
-        else:
-            expanded_list.extend([op] * num)
-    return expanded_list
-
-
-def expand_md_operations(md: str) -> list[str]:
-    parsed_md = parse_md(md)
-    expanded_list = []
-    for op, num in parsed_md:
-        if op.startswith("^"):
-            expanded_list.append(op)
-            continue
-        expanded_list.extend([op] * num)
-    return expanded_list
+def parse_cigar_runs(cigar: str) -> tuple[tuple[str, int], ...]:
+    return tuple(parse_cigar(cigar))
 
 
-def remove_consecutive_equals(cs_long: list[str]) -> list[str]:
-    if not cs_long:
-        return cs_long
-    for i, cs in enumerate(cs_long):
-        if i == 0:
-            prev_op = cs[0]
-            continue
-        curr_op = cs[0]
-        if prev_op == curr_op == "=":
-            cs_long[i] = cs[1:]
-        else:
-            prev_op = cs[0]
-    return cs_long
+def parse_md_runs(md: str) -> tuple[tuple[str, int], ...]:
+    # Zero-length matches (e.g. "0C4") carry no bases
+    return tuple((op, num) for op, num in parse_md(md) if op != "=" or num > 0)
 
 
-def generate_cs_long(cigar: str, md: str, seq: str) -> str:
-    cigar_list = expand_cigar_operations(cigar)
-    md_list = expand_md_operations(md)
-    idx_cigar, idx_md, idx_seq = 0, 0, 0
-    cs_long = []
-    while idx_seq < len(seq) and idx_cigar < len(cigar_list) and idx_md < len(md_list):
-        if cigar_list[idx_cigar] == "M":
-            if md_list[idx_md] == "=":
-                cs_long.append(f"={seq[idx_seq]}")
-            else:
-                cs_long.append(f"*{md_list[idx_md]}{seq[idx_seq]}".lower())
-            idx_cigar += 1
-            idx_md += 1
-            idx_seq += 1
-            continue
-        if cigar_list[idx_cigar][0] == "D":
-            cs_long.append(md_list[idx_md].replace("^", "-").lower())
-            idx_cigar += 1
+# A few CIGAR/MD combinations often cover most reads (e.g. amplicon sequencing).
+# Longer strings are rarely repeated, and are not cached so that the caches stay small whatever the read length.
+MAX_CACHED_LENGTH = 64
+cigar_cache = LRUCache(parse_cigar_runs, max_key_length=MAX_CACHED_LENGTH)
+md_cache = LRUCache(parse_md_runs, max_key_length=MAX_CACHED_LENGTH)
+clip_cache = LRUCache(clip_cigar, max_key_length=MAX_CACHED_LENGTH)
+
+
+def set_call_cache_size(maxsize: int) -> None:
+    """
+    Set the number of CIGAR and MD strings memoised by `cstag.call`.
+    Strings longer than 64 characters are never memoised.
+
+    Args:
+        maxsize (int): Number of entries kept in each cache. Set 0 to disable caching.
+
+    Example:
+        >>> import cstag
+        >>> cstag.set_call_cache_size(0)
+        >>> cstag.call_cache_info()["cigar"].maxsize
+        0
+        >>> cstag.set_call_cache_size(4096)
+    """
+    for cache in (cigar_cache, md_cache, clip_cache):
+        cache.set_maxsize(maxsize)
+
+
+def call_cache_info() -> dict[str, CacheInfo]:
+    """
+    Report hits, misses, evictions and sizes of the CIGAR, MD and clip-trimmed CIGAR caches used by `cstag.call`.
+
+    Returns:
+        dict[str, CacheInfo]: Statistics keyed by "cigar", "md" and "clip".
+    """
+    return {"cigar": cigar_cache.cache_info(), "md": md_cache.cache_info(), "clip": clip_cache.cache_info()}
+
+
+###########################################################
+# Walk the CIGAR and MD runs together
+###########################################################
+
+
+def iterate_cs_operations(cigar: str, md: str, seq: str) -> Iterator[tuple[str, int | str, int]]:
+    """
+    Walk the CIGAR and MD runs together and yield cs operations as `(op, payload, idx_seq)`.
+    The payload is the length for `=`, `+` and `~`, and the reference base(s) for `*` and `-`.
+    `idx_seq` is the offset in SEQ where the operation starts, so that matched bases are never copied here.
+    """
+    cigar_runs = cigar_cache(cigar)
+    md_runs = md_cache(md)
+    len_seq, len_md = len(seq), len(md_runs)
+    idx_md, idx_seq, md_consumed = 0, 0, 0
+    for op, num in cigar_runs:
+        if idx_seq >= len_seq or idx_md >= len_md:
+            break
+        if op in "M=X":
+            while num > 0 and idx_seq < len_seq and idx_md < len_md:
+                md_op, md_num = md_runs[idx_md]
+                if md_op == "=":
+                    length = min(num, md_num - md_consumed, len_seq - idx_seq)
+                    yield "=", length, idx_seq
+                    md_consumed += length
+                    if md_consumed == md_num:
+                        idx_md += 1
+                        md_consumed = 0
+                else:
+                    length = 1
+                    yield "*", md_op, idx_seq
+                    idx_md += 1
+                num -= length
+                idx_seq += length
+        elif op == "D":
+            yield "-", md_runs[idx_md][0][1:], idx_seq
             idx_md += 1
+        elif op == "I":
+            yield "+", num, idx_seq
+            idx_seq += num
+        elif op == "N":
+            yield "~", num, idx_seq
+
+
+def iterate_cs_operations_with_reference(
+    cigar: str, seq: str, reference: Reference, chrom: str, pos: int
+) -> Iterator[tuple[str, int | str, int]]:
+    """
+    Walk the CIGAR runs and yield cs operations as `iterate_cs_operations` does, taking the reference bases from a FASTA instead of MD.
+    `=` and `X` operations are trusted as they are, so the reference is only read for `M`, `X` and `D`.
+    """
+    len_seq = len(seq)
+    idx_ref, idx_seq = pos - 1, 0
+    for op, num in cigar_cache(cigar):
+        if idx_seq >= len_seq:
+            break
+        if op == "=":
+            num = min(num, len_seq - idx_seq)
+            yield "=", num, idx_seq
+        elif op == "X":
+            num = min(num, len_seq - idx_seq)
+            ref = reference.fetch(chrom, idx_ref, idx_ref + num).upper()
+            for i in range(num):
+                yield "*", ref[i], idx_seq + i
+        elif op == "M":
+            num = min(num, len_seq - idx_seq)
+            ref = reference.fetch(chrom, idx_ref, idx_ref + num).upper()
+            query = seq[idx_seq : idx_seq + num].upper()
+            if ref == query:
+                yield "=", num, idx_seq
+            else:
+                # Yield the matched stretches between mismatches as whole runs
+                idx_match = 0
+                for i in range(num):
+                    if ref[i] != query[i]:
+                        if i > idx_match:
+                            yield "=", i - idx_match, idx_seq + idx_match
+                        yield "*", ref[i], idx_seq + i
+                        idx_match = i + 1
+                if num > idx_match:
+                    yield "=", num - idx_match, idx_seq + idx_match
+        elif op == "D":
+            yield "-", reference.fetch(chrom, idx_ref, idx_ref + num).upper(), idx_seq
+        elif op == "I":
+            yield "+", num, idx_seq
+        elif op == "N":
+            yield "~", num, idx_seq
+        if op in "MX=DN":
+            idx_ref += num
+        if op in "MX=I":
+            idx_seq += num
+
+
+###########################################################
+# Generate cs tag in long and short format
+###########################################################
+
+
+def format_cs_long(operations: Iterable[tuple[str, int | str, int]], seq: str) -> str:
+    cs_long = []
+    is_match = False
+    for op, payload, idx_seq in operations:
+        if op == "=":
+            bases = seq[idx_seq : idx_seq + payload]
+            cs_long.append(bases if is_match else f"={bases}")
+            is_match = True
             continue
-        if cigar_list[idx_cigar][0] == "I":
-            num_insertion = len(cigar_list[idx_cigar])
-            seq_insertion = "".join(seq[idx_seq : idx_seq + num_insertion])
-            cs_long.append(f"+{seq_insertion}".lower())
-            idx_cigar += 1
-            idx_seq += num_insertion
-            continue
-        if cigar_list[idx_cigar][0] == "N":
-            cs_long.append(f"~nn{len(cigar_list[idx_cigar])}nn")
-            idx_cigar += 1
+        is_match = False
+        if op == "*":
+            cs_long.append(f"*{payload}{seq[idx_seq]}".lower())
+        elif op == "-":
+            cs_long.append(f"-{payload}".lower())
+        elif op == "+":
+            cs_long.append(f"+{seq[idx_seq : idx_seq + payload]}".lower())
+        elif op == "~":
+            cs_long.append(f"~nn{payload}nn")
+    return "".join(cs_long)
+
+
+def format_cs_short(operations: Iterable[tuple[str, int | str, int]], seq: str) -> str:
+    """SEQ is only read for substitutions and insertions; matches are written as run lengths."""
+    cs_short = []
+    num_match = 0
+    for op, payload, idx_seq in operations:
+        if op == "=":
+            num_match += payload
             continue
-    return "".join(remove_consecutive_equals(cs_long))
+        if num_match:
+            cs_short.append(f":{num_match}")
+            num_match = 0
+        if op == "*":
+            cs_short.append(f"*{payload}{seq[idx_seq]}".lower())
+        elif op == "-":
+            cs_short.append(f"-{payload}".lower())
+        elif op == "+":
+            cs_short.append(f"+{seq[idx_seq : idx_seq + payload]}".lower())
+        elif op == "~":
+            cs_short.append(f"~nn{payload}nn")
+    if num_match:
+        cs_short.append(f":{num_match}")
+    return "".join(cs_short)
+
+
+def generate_cs_long(cigar: str, md: str, seq: str) -> str:
+    return format_cs_long(iterate_cs_operations(cigar, md, seq), seq)
+
+
+def generate_cs_short(cigar: str, md: str, seq: str) -> str:
+    return format_cs_short(iterate_cs_operations(cigar, md, seq), seq)
 
 
 def add_prefix(cs_tag: str) -> str:
@@ -158,16 +300,29 @@ def add_prefix(cs_tag: str) -> str:
 ###########################################################
 
 
-def call(cigar: str, md: str, seq: str, long: bool = False, prefix: bool = False) -> str:
+@accept_bytes
+def call(
+    cigar: str,
+    md: str | None,
+    seq: str,
+    long: bool = False,
+    prefix: bool = False,
+    reference: Reference | None = None,
+    chrom: str | None = None,
+    pos: int | None = None,
+) -> str:
     """
     Generate a cs tag based on CIGAR, MD, and SEQ information.
 
     Args:
         cigar (str): CIGAR string representing the alignment.
-        md (str): MD tag representing mismatching positions/base.
+        md (str | None): MD tag representing mismatching positions/base. Set `None` to use `reference` instead.
         seq (str): The sequence of the read.
         long (bool, optional): Whether to return the cs tag in long format. Defaults to False.
         prefix (bool, optional): Whether to add the prefix 'cs:Z:' to the cs tag. Defaults to False
+        reference (Reference, optional): Indexed reference FASTA used when MD is missing.
+        chrom (str, optional): Reference sequence name (3rd column in SAM file). Required with `reference`.
+        pos (int, optional): 1-based leftmost mapping position (4th column in SAM file). Required with `reference`.
 
     Returns:
         str: A cs tag representing the alignment and differences.
@@ -181,9 +336,78 @@ def call(cigar: str, md: str, seq: str, long: bool = False, prefix: bool = False
         '=AC*ag=TACGT-ag=ACGT+ac~nn3nn=G'
     """
     cigar, seq = trim_clips(cigar, seq)
-    cs_tag = generate_cs_long(cigar, md, seq)
-    if long is False:
-        cs_tag = shorten(cs_tag)
+    if md is not None:
+        operations = iterate_cs_operations(cigar, md, seq)
+    elif reference is not None and chrom is not None and pos is not None:
+        validate_pos(pos)
+        operations = iterate_cs_operations_with_reference(cigar, seq, reference, chrom, pos)
+    else:
+        raise ValueError("reference, chrom and pos are required when md is None")
+    if long is True:
+        cs_tag = format_cs_long(operations, seq)
+    else:
+        cs_tag = format_cs_short(operations, seq)
     if prefix is True:
         cs_tag = add_prefix(cs_tag)
     return cs_tag
+
+
+###########################################################
+# Batch
+###########################################################
+
+
+def call_chunk(chunk: list[tuple[str, str, str]], long: bool = False, prefix: bool = False) -> list[str]:
+    return [call(cigar, md, seq, long=long, prefix=prefix) for cigar, md, seq in chunk]
+
+
+def iterate_chunks(cigars: Iterable[str], mds: Iterable[str], seqs: Iterable[str], chunksize: int) -> Iterator[list]:
+    sentinel = object()
+    records = zip_longest(cigars, mds, seqs, fillvalue=sentinel)
+    while True:
+        chunk = list(islice(records, chunksize))
+        if not chunk:
+            return
+        if any(sentinel in record for record in chunk):
+            raise ValueError("Element numbers of each argument must be the same")
+        yield chunk
+
+
+def call_many(
+    cigars: Iterable[str],
+    mds: Iterable[str],
+    seqs: Iterable[str],
+    long: bool = False,
+    prefix: bool = False,
+    workers: int | None = None,
+    chunksize: int = 1000,
+) -> Iterator[str]:
+    """
+    Generate cs tags for many reads, spreading the work over a process pool.
+
+    Args:
+        cigars (Iterable[str]): CIGAR strings of the reads.
+        mds (Iterable[str]): MD tags of the reads.
+        seqs (Iterable[str]): Sequences of the reads.
+        long (bool, optional): Whether to return the cs tags in long format. Defaults to False.
+        prefix (bool, optional): Whether to add the prefix 'cs:Z:' to the cs tags. Defaults to False
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        chunksize (int, optional): Number of reads sent to a worker at once. Defaults to 1000.
+
+    Yields:
+        str: cs tags in the same order as the input reads.
+
+    Example:
+        >>> import cstag
+        >>> cigars = ["5M", "5M1D4M"]
+        >>> mds = ["3C1", "5^A4"]
+        >>> seqs = ["ACGTG", "ACGTGGCTA"]
+        >>> list(cstag.call_many(cigars, mds, seqs))
+        [':3*ct:1', ':5-a:4']
+    """
+    if chunksize < 1:
+        raise ValueError(f"chunksize must be a positive integer, but got {chunksize}")
+
+    chunks = iterate_chunks(cigars, mds, seqs, chunksize)
+    for cs_tags in imap_batches(call_chunk, chunks, workers, long, prefix):
+        yield from cs_tags
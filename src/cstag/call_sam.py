@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import sys
+from typing import IO, Iterable, Iterator
+
+from cstag.call import call
+from cstag.reference import Reference
+
+
+###########################################################
+# Add a cs tag to a SAM record
+###########################################################
+
+
+def extract_md(line: str) -> str | None:
+    """Extract the value of the MD:Z: tag without splitting the optional fields"""
+    idx_start = line.find("\tMD:Z:")
+    if idx_start == -1:
+        return None
+    idx_start += 6
+    idx_end = line.find("\t", idx_start)
+    return line[idx_start:] if idx_end == -1 else line[idx_start:idx_end]
+
+
+def add_cs_tag(line: str, long: bool = False, reference: Reference | None = None) -> str:
+    """Append a cs tag to a SAM record. Headers and records without CIGAR, SEQ or MD (and no reference) are returned untouched."""
+    if line.startswith("@") or "\tcs:Z:" in line:
+        return line
+    record = line.rstrip("\r\n")
+    # The mandatory fields up to SEQ are split, and QUAL and the optional fields are kept together
+    fields = record.split("\t", 10)
+    if len(fields) < 11:
+        return line
+    cigar, seq = fields[5], fields[9]
+    if cigar == "*" or seq == "*":
+        return line
+    md = extract_md(fields[10])
+    newline = line[len(record) :]
+    if md is not None:
+        cs_tag = call(cigar, md, seq, long=long)
+    elif reference is not None:
+        cs_tag = call(cigar, None, seq, long=long, reference=reference, chrom=fields[2], pos=int(fields[3]))
+    else:
+        return line
+    return f"{record}\tcs:Z:{cs_tag}{newline}"
+
+
+###########################################################
+# main
+###########################################################
+
+
+def call_sam(
+    sam: Iterable[str] | None = None, long: bool = False, reference: Reference | None = None
+) -> Iterator[str]:
+    """
+    Add cs tags to SAM records, one line at a time.
+
+    Args:
+        sam (Iterable[str], optional): Lines of a SAM file, such as an opened file handle. Defaults to the standard input.
+        long (bool, optional): Whether to add the cs tags in long format. Defaults to False.
+        reference (Reference, optional): Indexed reference FASTA used for records without MD.
+
+    Yields:
+        str: SAM lines with a `cs:Z:` tag appended. Header lines and records without CIGAR, SEQ or MD are passed through untouched.
+
+    Example:
+        >>> import cstag
+        >>> sam = ["@SQ\\tSN:chr1\\tLN:100\\n", "read1\\t0\\tchr1\\t1\\t60\\t5M\\t*\\t0\\t0\\tACGTG\\tIIIII\\tMD:Z:3C1\\n"]
+        >>> for line in cstag.call_sam(sam):
+        ...     print(line, end="")
+        @SQ	SN:chr1	LN:100
+        read1	0	chr1	1	60	5M	*	0	0	ACGTG	IIIII	MD:Z:3C1	cs:Z::3*ct:1
+    """
+    if sam is None:
+        sam = sys.stdin
+    for line in sam:
+        yield add_cs_tag(line, long=long, reference=reference)
+
+
+def write_sam(
+    sam: Iterable[str] | None = None,
+    output: IO[str] | None = None,
+    long: bool = False,
+    reference: Reference | None = None,
+    buffer_lines: int = 10000,
+) -> None:
+    """
+    Add cs tags to SAM records and write them out with buffered bulk writes.
+
+    Args:
+        sam (Iterable[str], optional): Lines of a SAM file, such as an opened file handle. Defaults to the standard input.
+        output (IO[str], optional): File handle to write to. Defaults to the standard output.
+        long (bool, optional): Whether to add the cs tags in long format. Defaults to False.
+        reference (Reference, optional): Indexed reference FASTA used for records without MD.
+        buffer_lines (int, optional): Number of lines written at once. Defaults to 10000.
+    """
+    if output is None:
+        output = sys.stdout
+    buffer = []
+    for line in call_sam(sam, long=long, reference=reference):
+        buffer.append(line)
+        if len(buffer) >= buffer_lines:
+            output.write("".join(buffer))
+            buffer.clear()
+    if buffer:
+        output.write("".join(buffer))
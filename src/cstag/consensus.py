@@ -1,26 +1,81 @@
 from __future__ import annotations
 
+import json
+import os
 import re
-from itertools import chain
+import zlib
 from collections import deque, Counter
+from operator import itemgetter
+from typing import Hashable, Iterable, Iterator, Mapping
 
-from cstag.utils.validator import validate_cs_tag, validate_long_format
+from cstag.slice import iterate_slices
+from cstag.utils.regions import RegionIndex
+from cstag.utils.tokenizer import split_tokens
+from cstag.utils.validator import validate_cs_tag, validate_same_format, is_short_format
+from cstag.utils.buffer import accept_bytes
+from cstag.utils.pool import map_largest_first
 
 
-def split_deletion(cs_tag: str) -> list[str]:
-    match = re.match(r"-(?P<nucleotides>[acgtn]+)$", cs_tag)
-    if match:
-        nucleotides = match.group("nucleotides")
-        return [f"-{n}" for n in nucleotides]
-    return [cs_tag]
-
+def split_cs_tag(cs_tag: str) -> list[str]:
+    """
+    Split a cs tag into reference positions.
 
-def expand_deletion_tags(tags_combined: list[str]) -> list[str]:
-    cs_tags_expand_deletion = []
-    for tag in tags_combined:
-        for tag_splitted in split_deletion(tag):
-            cs_tags_expand_deletion.append(tag_splitted)
-    return cs_tags_expand_deletion
+    Matched bases and substitutions take one position each, and each deleted base takes its own position.
+    An insertion (`+`) is not observed in the reference, so it is attached to the preceding position;
+    a deletion followed by an insertion is kept as a single position. `N` is attached to the preceding base.
+    The matches of the short format (`:n`) take `n` positions of `=`, without the bases.
+    """
+    return split_tokens_into_positions(split_tokens(cs_tag))
+
+
+def split_tokens_into_positions(tokens: list[str]) -> list[str]:
+    cs_tag_split = []
+    is_deletion = False
+    for cs in tokens:
+        op = cs[0]
+        if op == "+":
+            # Insertions before the first reference position are ignored
+            if cs_tag_split:
+                cs_tag_split[-1] += cs
+                is_deletion = False
+            continue
+        if is_deletion and len(cs_tag_split[-1]) > 2:
+            deletion = cs_tag_split.pop()
+            cs_tag_split.extend(f"-{nucleotide}" for nucleotide in deletion[1:])
+        is_deletion = op == "-"
+        if op == ":":
+            # Matches in the short format are kept as "=" without expanding the bases
+            cs_tag_split.extend("=" * int(cs[1:]))
+        elif op == "=":
+            if "N" not in cs:
+                cs_tag_split.extend(cs[1:])
+            else:
+                cs_tag_split.extend(tag for tag in re.split(r"(?=[ACGT])", cs[1:]) if tag)
+        else:
+            cs_tag_split.append(cs)
+    if is_deletion and len(cs_tag_split[-1]) > 2:
+        deletion = cs_tag_split.pop()
+        cs_tag_split.extend(f"-{nucleotide}" for nucleotide in deletion[1:])
+    return cs_tag_split
+
+
+def count_positions(tokens: list[str]) -> int:
+    """Count the reference positions that `split_tokens_into_positions` would return, without building them"""
+    n_positions = 0
+    for i, cs in enumerate(tokens):
+        op = cs[0]
+        if op == "=":
+            # `N` is attached to the preceding base, unless it leads the run
+            n_positions += len(cs) - 1 - cs.count("N") + (cs[1] == "N")
+        elif op == ":":
+            n_positions += int(cs[1:])
+        elif op == "-":
+            # A deletion followed by an insertion is kept as a single position
+            is_followed_by_insertion = i + 1 < len(tokens) and tokens[i + 1][0] == "+"
+            n_positions += 1 if is_followed_by_insertion else len(cs) - 1
+        elif op != "+":
+            n_positions += 1
+    return n_positions
 
 
 def split_cs_tags(cs_tags: list[str]) -> list[list[str]]:
@@ -33,28 +88,7 @@ def split_cs_tags(cs_tags: list[str]) -> list[list[str]]:
     Returns:
         list[list[str]]: list of processed cs tags.
     """
-    cs_tags_splitted = []
-    for cs_tag in cs_tags:
-        # Remove the prefix "cs:Z:" if present
-        cs_tag = cs_tag.replace("cs:Z:", "")
-
-        # Split the cs tag using special symbols (-, *, ~, =)
-        # insertion symbol (+) is ignored because it is not observed in reference sequence
-        tags_splitted = re.split(r"([-*~=])", cs_tag)[1:]
-        # Combine the symbol with the corresponding sequence
-        tags_combined = [symbol + seq for symbol, seq in zip(tags_splitted[0::2], tags_splitted[1::2])]
-        tags_combined = expand_deletion_tags(tags_combined)
-
-        # Remove the "=" symbols, as they are not needed for further processing
-        cleaned_tags = [tag.replace("=", "") for tag in tags_combined]
-        # Further split the tags by the base letters (A, C, G, T)
-        further_tags_splitted = [re.split(r"(?=[ACGT])", tag) for tag in cleaned_tags]
-        # Remove any empty strings generated by the split
-        non_empty_tags = [[elem for elem in tag if elem] for tag in further_tags_splitted]
-        # Flatten the list of lists into a single list
-        flat_tags = list(chain.from_iterable(non_empty_tags))
-        cs_tags_splitted.append(flat_tags)
-    return cs_tags_splitted
+    return [split_cs_tag(cs_tag) for cs_tag in cs_tags]
 
 
 def normalize_positions(positions: list[int]) -> list[int]:
@@ -104,59 +138,466 @@ def condense_deletions(s: str) -> str:
     return re.sub(pattern, replacement, s)
 
 
-def get_consensus(cs_tags: list[list[str]]) -> str:
+BATCH_SIZE = 256
+WINDOW_SIZE = 4096
+
+
+def count_states(
+    cs_tags_split: list[list[str]], positions: list[int], columns: dict[int, Counter] | None = None
+) -> dict[int, Counter]:
+    """
+    Count the states (base, substitution, deletion, insertion, splice...) observed at each reference position.
+
+    Reads are padded and transposed a batch at a time, over fixed-size windows of the reference that the batch covers,
+    and each column is counted in C by `Counter.update`.
+    Only covered positions are kept, so memory grows with covered positions × states (plus one window of a batch),
+    regardless of the number of reads and of the distance between them.
+    A counter keeps the order of first appearance, which breaks ties in the same way as counting all reads at once.
+
+    Args:
+        cs_tags_split (list[list[str]]): cs tags split by `split_cs_tags`. `None` or empty states are ignored.
+        positions (list[int]): Starting positions of each read.
+        columns (dict[int, Counter], optional): Counts to add to. Defaults to new counts.
+
+    Returns:
+        dict[int, Counter]: Counts of the states at each covered position.
+    """
+    if columns is None:
+        columns = {}
+    for i in range(0, len(cs_tags_split), BATCH_SIZE):
+        batch = [(cs, pos, pos + len(cs)) for cs, pos in zip(cs_tags_split[i : i + BATCH_SIZE], positions[i : i + BATCH_SIZE]) if cs]
+        windows = sorted({w for _, start, end in batch for w in range(start // WINDOW_SIZE, (end - 1) // WINDOW_SIZE + 1)})
+        for w in windows:
+            reads = [(cs, start, end) for cs, start, end in batch if start < (w + 1) * WINDOW_SIZE and end > w * WINDOW_SIZE]
+            window_start = max(w * WINDOW_SIZE, min(start for _, start, _ in reads))
+            window_end = min((w + 1) * WINDOW_SIZE, max(end for _, _, end in reads))
+            rows = [
+                [None] * max(0, start - window_start)
+                + cs[max(0, window_start - start) : window_end - start]
+                + [None] * max(0, window_end - end)
+                for cs, start, end in reads
+            ]
+            for pos, column in enumerate(zip(*rows), window_start):
+                counter = columns.get(pos)
+                if counter is not None:
+                    counter.update(filter(None, column))
+                    continue
+                counter = Counter(filter(None, column))
+                if counter:
+                    columns[pos] = counter
+    return columns
+
+
+def call_consensus_state(counter: Counter) -> list[str]:
+    """Take the most common state at a position. If the most common state is not unique, take all *mutated* states."""
+    most_common_tags = counter.most_common()
+    if not most_common_tags:
+        return []
+    # If there's a unique most common tag, take it
+    most_common_tag, _ = most_common_tags[0]
+    if len(most_common_tags) == 1 or most_common_tags[0][1] != most_common_tags[1][1]:
+        return [most_common_tag]
+    # If the most common tag is not unique (multimodal), take the *mutated* modes
+    return [tag for tag, _ in most_common_tags if not re.search(r"[ACGT=]", tag)]
+
+
+def call_consensus_states(columns: dict[int, Counter]) -> list[str]:
     cs_consensus = []
-    for cs in zip(*cs_tags):
-        # Remove the None that is compensating for the insufficient lead length.
-        cs = [c for c in cs if c]
-        # Get the most common cs tag(s)
-        most_common_tags = Counter(cs).most_common()
-
-        # If there's a unique most common tag, return it
-        most_common_tag, _ = most_common_tags[0]
-        if len(most_common_tags) == 1 or most_common_tags[0][1] != most_common_tags[1][1]:
-            cs_consensus.append(most_common_tag)
+    for pos in sorted(columns):
+        cs_consensus.extend(call_consensus_state(columns[pos]))
+    return cs_consensus
+
+
+def call_consensus_blocks(
+    columns: dict[int, Counter], calls: dict[int, list[str]] | None = None
+) -> list[tuple[int, list[str]]]:
+    """
+    Call the consensus states of each block of contiguous covered positions, with the first position of the block.
+    Positions in `calls` take the states already called there.
+    """
+    if calls is None:
+        calls = {}
+    blocks = []
+    pos_prev = None
+    for pos in sorted(columns):
+        if not columns[pos]:
             continue
-        # If the most common tag is not unique (multimodal), return the first *mutated* mode
-        for tag, _ in most_common_tags:
-            if not re.search(r"[ACGT]", tag):
-                cs_consensus.append(tag)
+        if pos_prev is None or pos != pos_prev + 1:
+            blocks.append((pos, []))
+        blocks[-1][1].extend(calls[pos] if pos in calls else call_consensus_state(columns[pos]))
+        pos_prev = pos
+    return blocks
+
+
+def format_consensus_blocks(blocks: list[tuple[int, list[str]]], prefix: bool = False) -> list[tuple[int, str]]:
+    cs_blocks = []
+    for pos, cs_consensus in blocks:
+        cs_consensus = format_consensus(cs_consensus)
+        cs_blocks.append((pos, f"cs:Z:{cs_consensus}" if prefix else cs_consensus))
+    return cs_blocks
+
+
+def format_single_block(blocks: list[tuple[int, list[str]]], prefix: bool = False) -> str:
+    if len(blocks) > 1:
+        raise ValueError(
+            f"The cs tags cover {len(blocks)} separate regions starting at {[pos for pos, _ in blocks]}. "
+            "Use consensus_blocks() to get a consensus for each region"
+        )
+    cs_consensus = format_consensus(blocks[0][1]) if blocks else ""
+    return f"cs:Z:{cs_consensus}" if prefix else cs_consensus
 
+
+def format_consensus(cs_consensus: list[str]) -> str:
     cs_consensus = "".join(cs_consensus)
     cs_consensus = condense_deletions(cs_consensus)
+    # Condense the matches of the short format to ":n"
+    cs_consensus = re.sub(r"=+", lambda match: f":{len(match.group(0))}", cs_consensus)
     # Append "=" to [ACGTN]
     return re.sub(r"([ACGTN]+)", r"=\1", cs_consensus)
 
 
+def get_consensus(cs_tags: list[list[str]]) -> str:
+    columns = count_states(cs_tags, [0] * len(cs_tags))
+    return format_consensus(call_consensus_states(columns))
+
+
+###########################################################
+# Incremental consensus
+###########################################################
+
+
+class ConsensusBuilder:
+    """
+    Accumulate the consensus of cs tags one read at a time.
+
+    Only the counts of the states at each covered position are kept (plus a batch of pending reads),
+    so memory depends on the covered span, not on the number of reads.
+    Builders over shards of the reads can be merged, or serialized with `to_bytes` and restored with `from_bytes`.
+    The result is the same as `consensus()` over the reads in the order they were added and merged;
+    the order only matters when several *mutated* states tie at a position.
+
+    Example:
+        >>> import cstag
+        >>> builder = cstag.ConsensusBuilder()
+        >>> for cs_tag, pos in [("=ACGT", 1), ("=AC*gt=T", 1), ("=C*gt=T", 2)]:
+        ...     builder.add(cs_tag, pos)
+        >>> other = cstag.ConsensusBuilder()
+        >>> other.add("=C*gt=T", 2)
+        >>> builder.merge(other)
+        >>> builder.finalize()
+        '=AC*gt=T'
+    """
+
+    def __init__(self) -> None:
+        self.columns: dict[int, Counter] = {}
+        self._pending_tags: list[list[str]] = []
+        self._pending_positions: list[int] = []
+        # "long" or "short" once a cs tag with matches has been added, to keep all cs tags in the same format
+        self.format: str | None = None
+
+    def _set_format(self, cs_format: str | None) -> None:
+        if cs_format is None:
+            return
+        if self.format is None:
+            self.format = cs_format
+        elif self.format != cs_format:
+            raise ValueError("cs tags must be all in the long format or all in the short format")
+
+    @accept_bytes
+    def add(self, cs_tag: str, pos: int) -> None:
+        """Add a cs tag starting at `pos`. All cs tags must be in the same format, either **long** or **short**"""
+        validate_cs_tag(cs_tag)
+        validate_same_format([cs_tag])
+        if "=" in cs_tag:
+            self._set_format("long")
+        elif is_short_format(cs_tag):
+            self._set_format("short")
+        self._pending_tags.append(split_cs_tag(cs_tag))
+        self._pending_positions.append(pos)
+        if len(self._pending_tags) >= BATCH_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._pending_tags:
+            count_states(self._pending_tags, self._pending_positions, self.columns)
+            self._pending_tags.clear()
+            self._pending_positions.clear()
+
+    def merge(self, other: ConsensusBuilder) -> None:
+        """Add the reads accumulated by another builder, as if they were added after the reads of this builder"""
+        self._set_format(other.format)
+        self._flush()
+        other._flush()
+        for pos, counter in other.columns.items():
+            if pos in self.columns:
+                self.columns[pos].update(counter)
+            else:
+                self.columns[pos] = counter.copy()
+
+    def to_bytes(self) -> bytes:
+        """Serialize the accumulated counts and the format of the cs tags"""
+        self._flush()
+        columns = [[pos, list(counter.items())] for pos, counter in self.columns.items()]
+        data = {"format": self.format, "columns": columns}
+        return zlib.compress(json.dumps(data, separators=(",", ":")).encode("ascii"))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> ConsensusBuilder:
+        """Restore a builder serialized by `to_bytes`"""
+        builder = cls()
+        data = json.loads(zlib.decompress(data))
+        builder.format = data["format"]
+        for pos, counts in data["columns"]:
+            builder.columns[pos] = Counter(dict(counts))
+        return builder
+
+    def finalize(self, prefix: bool = False) -> str:
+        """
+        Return the consensus of the reads added so far.
+        Args:
+            prefix (bool, optional): Whether to add the prefix 'cs:Z:' to the cs tag. Defaults to False
+        Return:
+            str: a consensus of cs tag in the same format as the cs tags
+        """
+        self._flush()
+        if not self.columns:
+            raise ValueError("No cs tags have been added")
+        return format_single_block(call_consensus_blocks(self.columns), prefix)
+
+    def finalize_blocks(self, prefix: bool = False) -> list[tuple[int, str]]:
+        """Return the consensus of each block of contiguous covered positions, with the first position of the block"""
+        self._flush()
+        return format_consensus_blocks(call_consensus_blocks(self.columns), prefix)
+
+
 ###########################################################
 # main
 ###########################################################
 
 
-def consensus(cs_tags: list[str], positions: list[int], prefix: bool = False) -> str:
+def validate_consensus_inputs(cs_tags: list[str], positions: list[int]) -> None:
+    if not (len(cs_tags) == len(positions) > 0):
+        raise ValueError("Element numbers of each argument must be the same")
+
+    for cs_tag in cs_tags:
+        validate_cs_tag(cs_tag)
+    validate_same_format(cs_tags)
+
+
+def slice_to_regions(
+    cs_tags: list[str], positions: list[int], regions: str | os.PathLike | Iterable[tuple]
+) -> tuple[list[str], list[int]]:
+    """
+    Slice each cs tag to each region it overlaps, and drop the cs tags that overlap no region.
+    The cs tags must have been validated. The operations of each cs tag are read once for all the regions,
+    and the operations after the last region it overlaps are not read.
+    The slices are returned region by region.
+    """
+    regions = RegionIndex(regions)
+    if len(regions.chroms) > 1:
+        raise ValueError(f"regions must be on a single chromosome, but got {regions.chroms}")
+    chrom = regions.chroms[0] if regions.chroms else None
+
+    slices = []
+    for cs_tag, pos in zip(cs_tags, positions):
+        for start, _, cs_slice in iterate_slices(cs_tag, regions.iter_regions_from(chrom, pos), pos):
+            slices.append((start, cs_slice, max(start, pos)))
+    # Order the slices by region, so that the batches of `count_states` cover a few regions rather than all of them.
+    # The sort is stable and the regions do not overlap, so the reads keep their order at each position.
+    slices.sort(key=itemgetter(0))
+    return [cs_slice for _, cs_slice, _ in slices], [pos for _, _, pos in slices]
+
+
+@accept_bytes
+def consensus(
+    cs_tags: list[str],
+    positions: list[int],
+    prefix: bool = False,
+    regions: str | os.PathLike | list[tuple] | None = None,
+) -> str:
     """generate consensus of cs tags
     Args:
-        cs_tags (list): cs tags in the **long** format
+        cs_tags (list): cs tags, all in the **long** format or all in the **short** format
         positions (list): 1-based leftmost mapping position (4th column in SAM file)
         prefix (bool, optional): Whether to add the prefix 'cs:Z:' to the cs tag. Defaults to False
+        regions (str | os.PathLike | list[tuple], optional): Target regions on the reference of the cs tags, as a BED file
+            or as `(start, end)` tuples in 1-based inclusive coordinates. The cs tags are sliced to the regions (see `slice`)
+            before the consensus. Defaults to None (the whole cs tags)
     Return:
-        str: a consensus of cs tag in the **long** format
+        str: a consensus of cs tag in the same format as the cs tags
+    Raises:
+        ValueError: if the cs tags do not cover a contiguous region (see `consensus_blocks`)
     Example:
         >>> import cstag
         >>> cs_tags = ["=ACGT", "=AC*gt=T", "=C*gt=T", "=C*gt=T", "=ACT+ccc=T"]
         >>> positions = [1,1,1,2,1]
         >>> cstag.consensus(cs_tags, positions)
         '=AC*gt=T'
+        >>> cstag.consensus(cs_tags, positions, regions=[(3, 4)])
+        '*gt=T'
+    """
+    validate_consensus_inputs(cs_tags, positions)
+    if regions is not None:
+        cs_tags, positions = slice_to_regions(cs_tags, positions, regions)
+
+    columns = count_states(split_cs_tags(cs_tags), positions)
+
+    return format_single_block(call_consensus_blocks(columns), prefix)
+
+
+@accept_bytes
+def consensus_blocks(
+    cs_tags: list[str],
+    positions: list[int],
+    prefix: bool = False,
+    regions: str | os.PathLike | list[tuple] | None = None,
+) -> list[tuple[int, str]]:
+    """generate a consensus of cs tags for each contiguous region covered by the reads
+    Args:
+        cs_tags (list): cs tags, all in the **long** format or all in the **short** format
+        positions (list): 1-based leftmost mapping position (4th column in SAM file)
+        prefix (bool, optional): Whether to add the prefix 'cs:Z:' to the cs tag. Defaults to False
+        regions (str | os.PathLike | list[tuple], optional): Target regions, as in `consensus`. Defaults to None
+    Return:
+        list[tuple[int, str]]: the first position and the consensus cs tag in the same format as `cs_tags` of each region
+    Example:
+        >>> import cstag
+        >>> cs_tags = ["=ACGT", "=ACGT", "=AC*gt=T", "=AC"]
+        >>> positions = [1, 1, 1, 5000001]
+        >>> cstag.consensus_blocks(cs_tags, positions)
+        [(1, '=ACGT'), (5000001, '=AC')]
+    """
+    validate_consensus_inputs(cs_tags, positions)
+    if regions is not None:
+        cs_tags, positions = slice_to_regions(cs_tags, positions, regions)
+
+    columns = count_states(split_cs_tags(cs_tags), positions)
+
+    return format_consensus_blocks(call_consensus_blocks(columns), prefix)
+
+
+###########################################################
+# Adaptive consensus
+###########################################################
+
+
+def settle_columns(
+    columns: dict[int, Counter],
+    calls: dict[int, list[str]],
+    settled: bytearray,
+    pos_min: int,
+    n_remaining: int,
+    min_margin: int | None,
+) -> None:
+    """
+    Call the positions whose leading state can no longer be overtaken by the remaining reads,
+    or leads the runner-up by at least `min_margin` reads, and flag them in `settled` (indexed from `pos_min`).
+    """
+    for pos in columns.keys() - calls.keys():
+        most_common_tags = columns[pos].most_common(2)
+        margin = most_common_tags[0][1] - (most_common_tags[1][1] if len(most_common_tags) > 1 else 0)
+        if margin > n_remaining or (min_margin is not None and margin >= min_margin):
+            calls[pos] = [most_common_tags[0][0]]
+            idx = pos - pos_min
+            if idx >= len(settled):
+                settled.extend(bytes(idx + 1 - len(settled)))
+            settled[idx] = 1
+
+
+@accept_bytes
+def adaptive_consensus(
+    cs_tags: list[str], positions: list[int], min_margin: int | None = None, prefix: bool = False
+) -> tuple[str, list[int]]:
+    """generate consensus of cs tags, stopping to count the reads at positions whose consensus is settled
+    Args:
+        cs_tags (list): cs tags, all in the **long** format or all in the **short** format
+        positions (list): 1-based leftmost mapping position (4th column in SAM file)
+        min_margin (int, optional): Settle a position once its most common state leads the runner-up by this many reads.
+            By default, a position is settled only when the remaining reads can no longer overtake its most common state,
+            and the consensus is the same as `consensus()`.
+        prefix (bool, optional): Whether to add the prefix 'cs:Z:' to the cs tag. Defaults to False
+    Return:
+        tuple[str, list[int]]: a consensus of cs tag in the same format as `cs_tags`, and the positions settled before all reads were counted.
+            All reads are validated, but the reads that only cover settled positions are not counted.
+    Example:
+        >>> import cstag
+        >>> cs_tags = ["=ACGT"] * 1000 + ["=AC*gt=T"] * 10
+        >>> positions = [1] * 1010
+        >>> cs_consensus, early_stopped = cstag.adaptive_consensus(cs_tags, positions, min_margin=100)
+        >>> cs_consensus
+        '=ACGT'
+        >>> early_stopped
+        [1, 2, 3, 4]
     """
     if not (len(cs_tags) == len(positions) > 0):
         raise ValueError("Element numbers of each argument must be the same")
+    if min_margin is not None and (not isinstance(min_margin, int) or min_margin < 1):
+        raise ValueError(f"min_margin must be a positive integer, but got {min_margin}")
 
-    for cs_tag in cs_tags:
+    validate_same_format(cs_tags)
+
+    pos_min = min(positions)
+    columns, calls = {}, {}
+    settled = bytearray()
+    batch_tags, batch_positions = [], []
+    for i, (cs_tag, pos) in enumerate(zip(cs_tags, positions)):
+        # Validate every read, so that an invalid read raises wherever it comes in the order of the reads
         validate_cs_tag(cs_tag)
-        validate_long_format(cs_tag)
+        tokens = split_tokens(cs_tag)
+        start = pos - pos_min
+        end = start + count_positions(tokens)
+        if end <= len(settled) and settled.find(0, start, end) == -1:
+            continue
+        batch_tags.append(split_tokens_into_positions(tokens))
+        batch_positions.append(pos)
+        if len(batch_tags) == BATCH_SIZE:
+            count_states(batch_tags, batch_positions, columns)
+            batch_tags.clear()
+            batch_positions.clear()
+            n_remaining = len(cs_tags) - i - 1
+            if n_remaining:
+                settle_columns(columns, calls, settled, pos_min, n_remaining, min_margin)
+    count_states(batch_tags, batch_positions, columns)
 
-    cs_tags_normalized_length = normalize_read_lengths(cs_tags, positions)
+    cs_consensus = format_single_block(call_consensus_blocks(columns, calls), prefix)
+    return cs_consensus, sorted(calls)
 
-    cs_consensus = get_consensus(cs_tags_normalized_length)
 
-    return f"cs:Z:{cs_consensus}" if prefix else cs_consensus
+###########################################################
+# Grouped consensus
+###########################################################
+
+
+def consensus_batch(batch: list[tuple[Hashable, list[str], list[int]]], prefix: bool = False) -> list[tuple[Hashable, str]]:
+    return [(group, consensus(cs_tags, positions, prefix)) for group, cs_tags, positions in batch]
+
+
+def consensus_groups(
+    groups: Mapping[Hashable, tuple[list[str], list[int]]],
+    prefix: bool = False,
+    workers: int | None = None,
+    batch_size: int = 1000,
+) -> Iterator[tuple[Hashable, str]]:
+    """
+    Generate a consensus for each group of reads (UMI family, barcode, amplicon...), spreading the groups over a process pool.
+
+    Args:
+        groups (Mapping): Group names mapped to a tuple of their cs tags (all **long** or all **short**) and their 1-based leftmost mapping positions.
+        prefix (bool, optional): Whether to add the prefix 'cs:Z:' to the cs tags. Defaults to False
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        batch_size (int, optional): Number of reads sent to a worker at once. Small groups are packed together up to this size. Defaults to 1000.
+
+    Yields:
+        tuple[Hashable, str]: the group and its consensus, in the order of `groups` with a single worker,
+            and largest groups first otherwise.
+
+    Example:
+        >>> import cstag
+        >>> groups = {"UMI1": (["=ACGT", "=AC*gt=T", "=AC*gt=T"], [1, 1, 1]), "UMI2": (["=CGT"], [2])}
+        >>> sorted(cstag.consensus_groups(groups, workers=1))
+        [('UMI1', '=AC*gt=T'), ('UMI2', '=CGT')]
+    """
+    items = [(group, cs_tags, positions) for group, (cs_tags, positions) in groups.items()]
+    sizes = [len(cs_tags) for _, cs_tags, _ in items]
+    for _, result in map_largest_first(consensus_batch, items, sizes, batch_size, workers, prefix):
+        yield result
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_right
+from typing import Iterable
+
+from cstag.utils.tokenizer import tokenize, get_softclip
+from cstag.utils.validator import validate_cs_tag
+from cstag.utils.buffer import decode
+
+
+class CsIndex:
+    """
+    An index of the operations of a cs tag, to lift coordinates over between the reference and the query.
+
+    The reference and query offsets at the start of each operation are accumulated once,
+    so that each lookup is a binary search over the operations instead of a scan of the cs tag.
+
+    Args:
+        cs_tag (str): cs tag in the **long** or **short** format
+        pos (int, optional): Reference position of the first aligned base, such as the 1-based leftmost mapping position (4th column in SAM file). Defaults to 1, as in `slice`.
+        cigar (str, optional): cigar strings (6th column in SAM file). With a leading soft clip, query offsets are indices into SEQ. Defaults to None.
+
+    Example:
+        >>> import cstag
+        >>> index = cstag.CsIndex("=AC+gg=T-cc=GT", pos=1)
+        >>> index.ref_to_query(3)
+        4
+        >>> index.ref_to_query(4) is None  # deleted base
+        True
+        >>> index.query_to_ref(2) is None  # inserted base
+        True
+        >>> index.query_to_ref(5)
+        6
+        >>> index.ref_span(1, 6)  # spans the deleted bases
+        (2, 7)
+        >>> index.ref_span()
+        (1, 8)
+    """
+
+    def __init__(self, cs_tag: str, pos: int = 1, cigar: str | None = None) -> None:
+        cs_tag, _ = decode(cs_tag)
+        cigar, _ = decode(cigar)
+        validate_cs_tag(cs_tag)
+        softclip = get_softclip(cigar)
+        ops = []
+        self.ref_starts = array("q")
+        self.query_starts = array("q")
+        ref_end, query_end = 0, 0
+        for op, payload, ref_offset, query_offset in tokenize(cs_tag):
+            ops.append(op)
+            self.ref_starts.append(pos + ref_offset)
+            self.query_starts.append(softclip + query_offset)
+            if op == "=" or op == "*":
+                length = len(payload) if op == "=" else 1
+                ref_end, query_end = ref_offset + length, query_offset + length
+            elif op == ":":
+                ref_end, query_end = ref_offset + payload, query_offset + payload
+            elif op == "+":
+                ref_end, query_end = ref_offset, query_offset + len(payload)
+            elif op == "-":
+                ref_end, query_end = ref_offset + len(payload), query_offset
+            elif op == "~":
+                ref_end, query_end = ref_offset + int(payload[2:-2]), query_offset
+        self.ops = "".join(ops)
+        self.ref_start, self.ref_end = pos, pos + ref_end
+        self.query_start, self.query_end = softclip, softclip + query_end
+
+    def __len__(self) -> int:
+        return len(self.ops)
+
+    def ref_to_query(self, ref_pos: int) -> int | None:
+        """Return the query offset aligned to a reference position, or None if the reference base is deleted or spliced"""
+        if not self.ref_start <= ref_pos < self.ref_end:
+            raise ValueError(f"Reference position {ref_pos} is out of the alignment [{self.ref_start}, {self.ref_end})")
+        i = bisect_right(self.ref_starts, ref_pos) - 1
+        op = self.ops[i]
+        if op == "-" or op == "~":
+            return None
+        return self.query_starts[i] + ref_pos - self.ref_starts[i]
+
+    def query_to_ref(self, query_offset: int) -> int | None:
+        """Return the reference position aligned to a query offset, or None if the query base is inserted"""
+        if not self.query_start <= query_offset < self.query_end:
+            raise ValueError(
+                f"Query offset {query_offset} is out of the alignment [{self.query_start}, {self.query_end})"
+            )
+        i = bisect_right(self.query_starts, query_offset) - 1
+        if self.ops[i] == "+":
+            return None
+        return self.ref_starts[i] + query_offset - self.query_starts[i]
+
+    def ref_span(self, query_start: int | None = None, query_end: int | None = None) -> tuple[int, int]:
+        """
+        Return the half-open reference interval spanned by the query bases in [query_start, query_end),
+        including the deleted bases between them. Defaults to the whole alignment.
+        """
+        if query_start is None:
+            query_start = self.query_start
+        if query_end is None:
+            query_end = self.query_end
+        if not self.query_start <= query_start < query_end <= self.query_end:
+            raise ValueError(
+                f"Query interval [{query_start}, {query_end}) is empty or out of the alignment [{self.query_start}, {self.query_end})"
+            )
+        # The first reference base at or after the query start
+        i = bisect_right(self.query_starts, query_start) - 1
+        ref_start = self.ref_starts[i]
+        if self.ops[i] != "+":
+            ref_start += query_start - self.query_starts[i]
+        # One past the last reference base at or before the query end
+        i = bisect_right(self.query_starts, query_end - 1) - 1
+        ref_end = self.ref_starts[i]
+        if self.ops[i] != "+":
+            ref_end += query_end - self.query_starts[i]
+        return ref_start, max(ref_start, ref_end)
+
+    def ref_to_query_many(self, ref_positions: Iterable[int]) -> list[int | None]:
+        """Return the query offsets aligned to many reference positions, the same as `ref_to_query` for each position"""
+        return list(map(self.ref_to_query, ref_positions))
+
+    def query_to_ref_many(self, query_offsets: Iterable[int]) -> list[int | None]:
+        """Return the reference positions aligned to many query offsets, the same as `query_to_ref` for each offset"""
+        return list(map(self.query_to_ref, query_offsets))
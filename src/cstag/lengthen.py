@@ -1,9 +1,30 @@
 from __future__ import annotations
 
-import re
+from typing import Iterable
+
+from cstag.utils.tokenizer import iter_tokens, get_softclip
 from cstag.utils.validator import validate_cs_tag, validate_short_format
+from cstag.utils.buffer import accept_bytes
+
+
+def expand_short_tokens(tokens: Iterable[str], seq: str, idx: int = 0) -> list[str]:
+    """Replace the matches (`:`) with the bases of SEQ, starting from the query index `idx`"""
+    cslong = []
+    for cs in tokens:
+        if cs[0] == ":":
+            length = int(cs[1:])
+            cslong.append("=" + seq[idx : idx + length])
+            idx += length
+            continue
+        cslong.append(cs)
+        if cs[0] == "*":
+            idx += 1
+        elif cs[0] == "+":
+            idx += len(cs) - 1
+    return cslong
 
 
+@accept_bytes
 def lengthen(cs_tag: str, cigar: str, seq: str, prefix: bool = False) -> str:
     """Convert short format of cs tag into long format
     Args:
@@ -26,26 +47,6 @@ def lengthen(cs_tag: str, cigar: str, seq: str, prefix: bool = False) -> str:
     validate_cs_tag(cs_tag)
     validate_short_format(cs_tag)
 
-    cs_tag_split = re.split(r"([-+*~:])", cs_tag.replace("cs:Z:", ""))[1:]
-    cs_tag_split = [i + j for i, j in zip(cs_tag_split[0::2], cs_tag_split[1::2])]
-
-    softclip = re.sub(r"^([0-9]+)S.*", r"\1", cigar)
-    idx = int(softclip) if softclip.isdigit() else 0
-
-    cslong = []
-    for cs in cs_tag_split:
-        if cs == "":
-            continue
-        if cs[0] == ":":
-            cs = int(cs[1:]) + idx
-            cslong.append(":" + seq[idx:cs])
-            idx = cs
-            continue
-        cslong.append(cs)
-        if cs[0] == "*":
-            idx += 1
-        if cs[0] == "+":
-            idx += len(cs) - 1
-    cslong = "".join(cslong).replace(":", "=")
+    cslong = "".join(expand_short_tokens(iter_tokens(cs_tag), seq, get_softclip(cigar)))
 
     return f"cs:Z:{cslong}" if prefix else cslong
@@ -1,20 +1,91 @@
 from __future__ import annotations
 
 import re
+from functools import lru_cache
+from itertools import zip_longest
+from typing import Iterable, Iterator
 
-from cstag.utils.validator import validate_cs_tag, validate_long_format, validate_threshold
+from cstag.utils.tokenizer import iter_tokens, tokenize, get_softclip
+from cstag.utils.validator import validate_cs_tag, validate_seq, validate_threshold
+from cstag.utils.buffer import accept_bytes, decode, encode
 
 
-def mask(cs_tag: str, cigar: str, qual: str, threshold: int = 10, prefix: bool = False) -> str:
+@lru_cache(maxsize=None)
+def make_quality_table(threshold: int) -> bytes:
+    """Translate the quality characters less than or equal to the threshold to 0xFF, and the others to 0x00"""
+    low_quality = range(33, threshold + 34)
+    return bytes(0xFF if q in low_quality else 0x00 for q in range(256))
+
+
+def mask_run(payload: str, mask_op: bytes, n: bytes) -> str:
+    """Replace the bases of a run under the 0xFF bytes of `mask_op` with `n`, as a bitwise select over the whole run"""
+    length = len(payload)
+    bases = int.from_bytes(payload.encode("ascii"), "big")
+    masked = int.from_bytes(n * length, "big")
+    mask_bits = int.from_bytes(mask_op, "big")
+    return (bases ^ ((bases ^ masked) & mask_bits)).to_bytes(length, "big").decode("ascii")
+
+
+def mask_match_run(bases: str, mask_op: bytes) -> str:
+    """Split a match of the short format at the low-quality bases, which become substitutions to `n`"""
+    cs_masked = []
+    for match in re.finditer(rb"\xff+|\x00+", mask_op):
+        start, end = match.span()
+        if match.group()[0]:
+            cs_masked.extend(f"*{base}n" for base in bases[start:end].lower())
+        else:
+            cs_masked.append(f":{end - start}")
+    return "".join(cs_masked)
+
+
+def mask_low_quality(cs_tag: str, cigar: str, qual: str, threshold: int, seq: str | None = None) -> str:
+    """
+    Turn QUAL into a byte mask of low-quality bases with a single `bytes.translate`, and only rewrite the operations that contain them.
+    Operations without low-quality bases are copied as they are, so the matches of the short format are expanded from SEQ
+    only where they contain low-quality bases.
+    """
+    softclip = get_softclip(cigar)
+    qual_mask = qual[softclip:].encode("ascii").translate(make_quality_table(threshold))
+    if qual_mask.find(0xFF) == -1:
+        return "".join(iter_tokens(cs_tag))
+
+    cs_masked = []
+    for op, payload, _, idx in tokenize(cs_tag):
+        if op == ":":
+            mask_op = qual_mask[idx : idx + payload]
+            if mask_op.find(0xFF) == -1:
+                cs_masked.append(f":{payload}")
+            else:
+                bases = seq[softclip + idx : softclip + idx + len(mask_op)]
+                cs_masked.append(mask_match_run(bases, mask_op))
+                if payload > len(mask_op):
+                    cs_masked.append(f":{payload - len(mask_op)}")
+            continue
+        if op == "*":
+            if qual_mask[idx]:
+                payload = payload[0] + "n"
+        elif op == "=" or op == "+":
+            mask_op = qual_mask[idx : idx + len(payload)]
+            if mask_op.find(0xFF) != -1:
+                payload = mask_run(payload[: len(mask_op)], mask_op, b"N" if op == "=" else b"n") + payload[len(mask_op) :]
+        cs_masked.append(op + payload)
+    return "".join(cs_masked)
+
+
+@accept_bytes
+def mask(
+    cs_tag: str, cigar: str, qual: str, threshold: int = 10, prefix: bool = False, seq: str | None = None
+) -> str:
     """Mask low-quality bases to 'N'
     Args:
-        cs_tag (str): cs tag in the **long** format
+        cs_tag (str): cs tag in the **long** or **short** format
         cigar (str): cigar strings (6th column in SAM file)
         qual (str): ASCII of Phred-scaled base quaiity+33 (11th column in SAM file)
         threshold (int, optional): Phred Quality Score (defalt = 10). The low-quality bases are defined as 'less than or equal to the threshold'
         prefix (bool, optional): Whether to add the prefix 'cs:Z:' to the cs tag. Defaults to False
+        seq (str, optional): the segment sequence (10th column in SAM file), required for a cs tag in the **short** format
     Return:
-        str: Masked cs tag
+        str: Masked cs tag in the same format as `cs_tag`. In the **short** format, low-quality matched bases become substitutions to `n`.
     Example:
         >>> import cstag
         >>> cs_tag = "=ACGT*ac+gg-cc=T"
@@ -22,36 +93,68 @@ def mask(cs_tag: str, cigar: str, qual: str, threshold: int = 10, prefix: bool =
         >>> qual = "AA!!!!AA"
         >>> cstag.mask(cs_tag, cigar, qual)
         '=ACNN*an+ng-cc=T'
+        >>> cstag.mask(":4*ac+gg-cc:1", cigar, qual, seq="ACGTCGGT")
+        ':2*gn*tn*an+ng-cc:1'
     """
     validate_cs_tag(cs_tag)
-    validate_long_format(cs_tag)
+    validate_seq(cs_tag, seq)
     validate_threshold(threshold)
 
-    mask_symbols = [chr(th + 33) for th in range(threshold + 1)]
-    mask_symbols = set(mask_symbols)
+    cs_masked = mask_low_quality(cs_tag, cigar, qual, threshold, seq)
 
-    cs = cs_tag.replace("cs:Z:", "")
-    list_cs = re.split(r"([-+*~=])", cs)[1:]
-    list_cs = [i + j for i, j in zip(list_cs[0::2], list_cs[1::2])]
+    return f"cs:Z:{cs_masked}" if prefix else cs_masked
 
-    if cigar.split("S")[0].isdigit():
-        softclip = int(cigar.split("S")[0])
-        qual = qual[softclip:]
 
-    cs_masked = []
-    idx = 0
-    for cs in list_cs:
-        cs = list(cs)
-        if cs[0] == "*":
-            if qual[idx] in mask_symbols:
-                cs[-1] = "n"
-            idx += 1
-        elif cs[0] == "=" or cs[0] == "+":
-            for i in range(len(cs) - 1):
-                if qual[idx + i] in mask_symbols:
-                    cs[i + 1] = "N" if cs[0] == "=" else "n"
-            idx += i + 1
-        cs_masked.append("".join(cs))
-    cs_masked = "".join(cs_masked)
+###########################################################
+# Batch
+###########################################################
 
-    return f"cs:Z:{cs_masked}" if prefix else cs_masked
+
+def mask_many(
+    cs_tags: Iterable[str],
+    cigars: Iterable[str],
+    quals: Iterable[str],
+    threshold: int | Iterable[int] = 10,
+    prefix: bool = False,
+    seqs: Iterable[str] | None = None,
+) -> Iterator[str]:
+    """Mask low-quality bases to 'N' in many cs tags
+    Args:
+        cs_tags (Iterable[str]): cs tags in the **long** or **short** format
+        cigars (Iterable[str]): cigar strings (6th column in SAM file)
+        quals (Iterable[str]): ASCII of Phred-scaled base quaiity+33 (11th column in SAM file)
+        threshold (int | Iterable[int], optional): Phred Quality Score for all reads, or for each read (defalt = 10).
+        prefix (bool, optional): Whether to add the prefix 'cs:Z:' to the cs tags. Defaults to False
+        seqs (Iterable[str], optional): the segment sequences (10th column in SAM file), required for cs tags in the **short** format
+    Yield:
+        str: Masked cs tags, the same as `mask()` for each read
+    Example:
+        >>> import cstag
+        >>> cs_tags = ["=ACGT*ac+gg-cc=T", "=ACGT"]
+        >>> cigars = ["5M2I2D1M", "4M"]
+        >>> quals = ["AA!!!!AA", "!!AA"]
+        >>> list(cstag.mask_many(cs_tags, cigars, quals))
+        ['=ACNN*an+ng-cc=T', '=NNGT']
+    """
+    is_threshold_per_read = not isinstance(threshold, int)
+    if not is_threshold_per_read:
+        validate_threshold(threshold)
+    columns = [cs_tags, cigars, quals]
+    if is_threshold_per_read:
+        columns.append(threshold)
+    if seqs is not None:
+        columns.append(seqs)
+    for record in zip_longest(*columns, fillvalue=None):
+        if None in record:
+            raise ValueError("Element numbers of each argument must be the same")
+        record, kind = decode(record)
+        cs_tag, cigar, qual = record[:3]
+        if is_threshold_per_read:
+            threshold = record[3]
+            validate_threshold(threshold)
+        seq = record[-1] if seqs is not None else None
+        validate_cs_tag(cs_tag)
+        validate_seq(cs_tag, seq)
+        cs_masked = mask_low_quality(cs_tag, cigar, qual, threshold, seq)
+        cs_masked = f"cs:Z:{cs_masked}" if prefix else cs_masked
+        yield cs_masked if kind is None else encode(cs_masked, kind)
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import mmap
+from pathlib import Path
+from typing import NamedTuple
+
+
+class FaiRecord(NamedTuple):
+    length: int
+    offset: int
+    line_bases: int
+    line_width: int
+
+
+def read_fai(path_fai: str | Path) -> dict[str, FaiRecord]:
+    """Read a samtools faidx index (.fai)"""
+    fai = {}
+    with open(path_fai) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            name, length, offset, line_bases, line_width = line.split("\t")[:5]
+            fai[name] = FaiRecord(int(length), int(offset), int(line_bases), int(line_width))
+    return fai
+
+
+class Reference:
+    """
+    A reference FASTA indexed by samtools faidx, read through a memory map.
+
+    Sequences are sliced straight out of the mapped file, so fetching a window does not issue any file reads.
+
+    Args:
+        path_fasta (str | Path): Path to the reference FASTA (uncompressed).
+        path_fai (str | Path, optional): Path to the .fai index. Defaults to `path_fasta` + ".fai".
+
+    Example:
+        >>> import cstag
+        >>> reference = cstag.Reference("genome.fa")  # doctest: +SKIP
+        >>> reference.fetch("chr1", 0, 4)  # doctest: +SKIP
+        'ACGT'
+    """
+
+    def __init__(self, path_fasta: str | Path, path_fai: str | Path | None = None) -> None:
+        if path_fai is None:
+            path_fai = f"{path_fasta}.fai"
+        self.fai = read_fai(path_fai)
+        self._file = open(path_fasta, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self) -> Reference:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._mmap.close()
+        self._file.close()
+
+    def fetch(self, chrom: str, start: int, end: int) -> str:
+        """Return the reference bases in the 0-based, half-open interval [start, end)"""
+        if chrom not in self.fai:
+            raise ValueError(f"Unknown chromosome: {chrom}")
+        record = self.fai[chrom]
+        if not 0 <= start <= end <= record.length:
+            raise ValueError(f"Interval {chrom}:{start}-{end} is out of range (length: {record.length})")
+        offset_start = record.offset + start // record.line_bases * record.line_width + start % record.line_bases
+        offset_end = record.offset + end // record.line_bases * record.line_width + end % record.line_bases
+        window = self._mmap[offset_start:offset_end]
+        if record.line_width != record.line_bases:
+            window = window.replace(b"\n", b"").replace(b"\r", b"")
+        return window.decode("ascii")
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-import re
+from cstag.utils.tokenizer import split_tokens
+from cstag.utils.buffer import accept_bytes
 
 map_revcomp = {
     "A": "T",
@@ -15,13 +16,10 @@ map_revcomp = {
     "n": "n",
 }
 
-
-def _extract_numbers(strings: str) -> list[str]:
-    # Using regular expression to find all numbers in the strings: st
-    numbers = re.findall(r"\d+", strings)
-    return numbers
+table_revcomp = str.maketrans(map_revcomp)
 
 
+@accept_bytes
 def revcomp(cs_tag: str, prefix: bool = False) -> str:
     """Converts a cs tag into its reverse complement.
     Args:
@@ -37,25 +35,18 @@ def revcomp(cs_tag: str, prefix: bool = False) -> str:
         >>> cstag.revcomp(cs)
         '=CAG*tc=TTTT'
     """
-    pattern = r"(\=[ACGTN]+|:[0-9]+|\*[acgtn][acgtn]|\+[acgtn]+|\-[acgtn]+|\~[acgtn]{2}[0-9]+[acgtn]{2})"
     cs_tag_revcomp = []
-    cs_tag = cs_tag.replace("cs:Z:", "")
-    for cs in re.split(pattern, cs_tag)[::-1]:
-        if cs == "":
-            continue
-        elif cs[0] == ":":
+    for cs in reversed(split_tokens(cs_tag)):
+        if cs[0] == ":":
             cs_tag_revcomp.append(cs)
         elif cs[0] == "*":
             cs_tag_revcomp.append(f"*{map_revcomp[cs[1]]}{map_revcomp[cs[2]]}")
         elif cs[0] == "~":
-            numbers = _extract_numbers(cs)
             cs_tag_revcomp.append(
-                f"~{map_revcomp[cs[-1]]}{map_revcomp[cs[-2]]}{numbers[0]}{map_revcomp[cs[2]]}{map_revcomp[cs[1]]}"
+                f"~{map_revcomp[cs[-1]]}{map_revcomp[cs[-2]]}{cs[3:-2]}{map_revcomp[cs[2]]}{map_revcomp[cs[1]]}"
             )
         else:
-            op = cs[0]
-            cs_revcomp = "".join([map_revcomp[c] for c in cs[1:]])[::-1]
-            cs_tag_revcomp.append(f"{op}{cs_revcomp}")
+            cs_tag_revcomp.append(cs[0] + cs[:0:-1].translate(table_revcomp))
     cs_tag_revcomp = "".join(cs_tag_revcomp)
 
     if prefix is True:
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
-import re
+from cstag.utils.tokenizer import split_tokens
+from cstag.utils.buffer import accept_bytes
 
 
+@accept_bytes
 def shorten(cs_tag: str, prefix: bool = False) -> str:
     """Convert long format of cs tag into short format
     Args:
@@ -16,13 +18,10 @@ def shorten(cs_tag: str, prefix: bool = False) -> str:
         >>> cstag.shorten(cs, prefix=True)
         'cs:Z::4*ag:3'
     """
-    cstags = re.split(r"([-+*~=])", cs_tag.replace("cs:Z:", ""))[1:]
-    cstags = [i + j for i, j in zip(cstags[0::2], cstags[1::2])]
-
     csshort = []
-    for cs in cstags:
+    for cs in split_tokens(cs_tag):
         if cs[0] == "=":
-            csshort.append(":" + str(len(cs) - 1))
+            csshort.append(f":{len(cs) - 1}")
             continue
         csshort.append(cs)
     csshort = "".join(csshort)
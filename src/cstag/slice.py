@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Iterable, Iterator
+
+from cstag.utils.tokenizer import tokenize
+from cstag.utils.validator import validate_pos
+from cstag.utils.buffer import accept_bytes
+
+
+@accept_bytes
+def slice(cs_tag: str, start: int, end: int, pos: int = 1, prefix: bool = False) -> str:
+    """Extract the part of a cs tag that aligns to a reference interval
+
+    Matches, deletions and splices crossing the interval are trimmed to the bases inside it;
+    a trimmed splice loses its donor and acceptor motifs, which are reported as `nn`.
+    Insertions are kept if they lie between two reference bases of the interval.
+    The operations after the interval are not read, nor validated: only the operations up to the end of the interval
+    are checked to be valid.
+
+    Args:
+        cs_tag (str): cs tag in the **long** or **short** format
+        start (int): 1-based first reference position of the interval
+        end (int): 1-based last reference position of the interval (inclusive)
+        pos (int, optional): 1-based leftmost mapping position (4th column in SAM file). Defaults to 1
+        prefix (bool, optional): Whether to add the prefix 'cs:Z:' to the cs tag. Defaults to False
+    Return:
+        str: cs tag aligned from the reference position `max(start, pos)`, or an empty string if the cs tag does not overlap the interval
+
+    Example:
+        >>> import cstag
+        >>> cs_tag = "=ACGT*ag=CGT-aaa=C"
+        >>> cstag.slice(cs_tag, 3, 10)
+        '=GT*ag=CGT-aa'
+        >>> cstag.slice(":4*ag:3~gt10ag:1", 103, 110, pos=100)
+        ':1*ag:3~nn3nn'
+    """
+    validate_pos(pos)
+    if start > end:
+        raise ValueError(f"start must not be greater than end, but got {start} > {end}")
+
+    cs_slice = next((cs_slice for _, _, cs_slice in iterate_slices(cs_tag, [(start, end)], pos, validate=True)), "")
+    return f"cs:Z:{cs_slice}" if prefix and cs_slice else cs_slice
+
+
+def iterate_slices(
+    cs_tag: str, intervals: Iterable[tuple[int, int]], pos: int = 1, validate: bool = False
+) -> Iterator[tuple[int, int, str]]:
+    """
+    Yield `(start, end, cs_slice)` for each interval that the cs tag overlaps, as `slice` would slice it,
+    reading the operations of the cs tag once for all the intervals.
+    The intervals must be sorted and must not overlap. The operations after the last interval are not read.
+    """
+    intervals = iter(intervals)
+    next_interval = next(intervals, None)
+    # Intervals reached by the operations read so far, with the operations sliced to them
+    active: deque[tuple[int, int, list[str]]] = deque()
+    for op, payload, ref_offset, _ in tokenize(cs_tag, validate=validate):
+        ref_start = pos + ref_offset
+        if op == "=" or op == "-":
+            ref_length = len(payload)
+        elif op == ":":
+            ref_length = payload
+        elif op == "*":
+            ref_length = 1
+        elif op == "~":
+            ref_length = int(payload[2:-2])
+        else:
+            ref_length = 0
+        ref_end = ref_start + ref_length - 1
+        while next_interval is not None and next_interval[0] <= ref_end:
+            active.append((*next_interval, []))
+            next_interval = next(intervals, None)
+        while active and active[0][1] < ref_start:
+            start, end, cs_slice = active.popleft()
+            if cs_slice:
+                yield start, end, "".join(cs_slice)
+        if not active:
+            if next_interval is None:
+                break
+            continue
+
+        for start, end, cs_slice in active:
+            # An insertion is kept if it lies after a reference base of the interval
+            if op == "+":
+                cs_slice.append(f"+{payload}")
+                continue
+            # Trim the operation to the reference bases [left, right] inside the interval
+            left, right = max(ref_start, start), min(ref_end, end)
+            if op == "=" or op == "-":
+                cs_slice.append(op + payload[left - ref_start : right - ref_start + 1])
+            elif op == ":":
+                cs_slice.append(f":{right - left + 1}")
+            elif op == "*":
+                cs_slice.append(f"*{payload}")
+            elif left == ref_start and right == ref_end:
+                cs_slice.append(f"~{payload}")
+            else:
+                cs_slice.append(f"~nn{right - left + 1}nn")
+
+    for start, end, cs_slice in active:
+        if cs_slice:
+            yield start, end, "".join(cs_slice)
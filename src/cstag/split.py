@@ -1,8 +1,13 @@
 from __future__ import annotations
 
 import re
+from typing import Iterator
 
+from cstag.utils.tokenizer import split_tokens, iter_tokens, iter_token_matches
+from cstag.utils.buffer import accept_bytes
 
+
+@accept_bytes
 def split(cs_tag: str, prefix: bool = False) -> list[str]:
     """Split a cs tag
     Args:
@@ -17,12 +22,30 @@ def split(cs_tag: str, prefix: bool = False) -> list[str]:
         >>> cstag.split(cs)
         [':4', '*ag', ':3']
     """
-    cs_tag = cs_tag.replace("cs:Z:", "")
-
-    pattern = r"(\=[ACGTN]+|:[0-9]+|\*[acgtn][acgtn]|\+[acgtn]+|\-[acgtn]+|\~[acgtn]{2}[0-9]+[acgtn]{2})"
-    cs_split = [cs for cs in re.split(pattern, cs_tag) if cs]
+    cs_split = split_tokens(cs_tag)
 
     if prefix is True:
         return ["cs:Z:"] + cs_split
     else:
         return cs_split
+
+
+def iter_split(cs_tag: str, spans: bool = False) -> Iterator[str] | Iterator[tuple[int, int]]:
+    """Split a cs tag lazily, one operation at a time
+    Args:
+        cs_tag (str): a cs tag. A `bytes`, `bytearray` or `memoryview` tag is scanned in place and yields `bytes`.
+        spans (bool, optional): Whether to yield the `(start, end)` span of each operation in `cs_tag`, instead of copying the operation. Defaults to False
+    Yield:
+        str | tuple[int, int]: the operations of the cs tag, or their spans
+
+    Example:
+        >>> import cstag
+        >>> cs = "cs:Z::4*ag:3"
+        >>> list(cstag.iter_split(cs))
+        [':4', '*ag', ':3']
+        >>> list(cstag.iter_split(cs, spans=True))
+        [(5, 7), (7, 10), (10, 12)]
+    """
+    if spans:
+        return map(re.Match.span, iter_token_matches(cs_tag))
+    return iter_tokens(cs_tag)
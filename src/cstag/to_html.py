@@ -1,9 +1,12 @@
 from __future__ import annotations
 
 import re
+from typing import Iterator
 
-from cstag.split import split
-from cstag.utils.validator import validate_cs_tag, validate_long_format
+from cstag.lengthen import expand_short_tokens
+from cstag.utils.tokenizer import iter_tokens, get_softclip
+from cstag.utils.validator import validate_cs_tag, validate_seq, is_short_format
+from cstag.utils.buffer import accept_bytes
 
 HTML_HEADER = """<!DOCTYPE html>
     <html>
@@ -82,64 +85,66 @@ HTML_FOOTER = """
 """
 
 
-def append_mark_to_n(cs_tag: str) -> str:
-    """Process each cs tag by adding specific markers `@` to `N`."""
-
-    def append_mark(cs: str) -> str:
-        if cs.startswith("N"):
-            return "@" + cs
-        elif re.match(r"^[ACGT]", cs):
-            return "=" + cs
-        return cs
-
-    cs_tag = cs_tag.replace("=N", "N")
-    cs_tag_processed = [append_mark(cs) for cs in re.split(r"(N+)", cs_tag) if cs and cs != "="]
-
-    return "".join(cs_tag_processed)
-
-
 def build_html_parts(cs: str, css_class: str) -> str:
     return f"<span class='{css_class}'>{cs.upper()}</span>"
 
 
-def process_cs_tag(cs_tag: str) -> str:
-    # Format cs_tag
-    cs_tag = cs_tag.replace("cs:Z:", "")
-    cs_tag_marked = append_mark_to_n(cs_tag)
-    cs_tag_split = split(cs_tag_marked)
-    # Build html
-    html_parts = []
-    idx = 0
-    while idx < len(cs_tag_split):
-        cs = cs_tag_split[idx]
-        if cs.startswith("="):
-            html_parts.append(cs[1:])
-        elif cs.startswith("@"):
-            html_parts.append(build_html_parts(cs[1:], "Unknown"))
-        elif cs.startswith("*"):
-            substitutions = [cs[2]]
-            while idx < len(cs_tag_split) - 1 and cs_tag_split[idx + 1].startswith("*"):
-                substitutions.append(cs_tag_split[idx + 1][2])
-                idx += 1
-            html_parts.append(build_html_parts("".join(substitutions), "Sub"))
-        elif cs.startswith("+"):
-            html_parts.append(build_html_parts(cs[1:], "Ins"))
-        elif cs.startswith("-"):
-            html_parts.append(build_html_parts(cs[1:], "Del"))
-        elif cs.startswith("~"):
+def iterate_html_parts(cs_tag: str) -> Iterator[str]:
+    """Yield the HTML of a cs tag piece by piece, merging consecutive substitutions and consecutive `N`."""
+    # Bases of consecutive substitutions or `N`, waiting to be merged into a single span
+    merged_class, merged = None, []
+    for cs in iter_tokens(cs_tag):
+        op = cs[0]
+        if op == "*":
+            css_class, bases = "Sub", cs[2]
+        elif op == "=" and "N" in cs:
+            for bases in re.findall(r"N+|[^N]+", cs[1:]):
+                if bases[0] == "N":
+                    if merged and merged_class != "Unknown":
+                        yield build_html_parts("".join(merged), merged_class)
+                        merged.clear()
+                    merged_class = "Unknown"
+                    merged.append(bases)
+                else:
+                    if merged:
+                        yield build_html_parts("".join(merged), merged_class)
+                        merged.clear()
+                    yield bases
+            continue
+        else:
+            css_class = None
+        if merged and merged_class != css_class:
+            yield build_html_parts("".join(merged), merged_class)
+            merged.clear()
+        if css_class is not None:
+            merged_class = css_class
+            merged.append(bases)
+        elif op == "=":
+            yield cs[1:]
+        elif op == "+":
+            yield build_html_parts(cs[1:], "Ins")
+        elif op == "-":
+            yield build_html_parts(cs[1:], "Del")
+        elif op == "~":
             left, right = cs[1:3], cs[-2:]
             splice = "-" * (int(cs[3:-2]) - 4)
-            html_parts.append(build_html_parts(f"{left}{splice}{right}", "Splice"))
-        idx += 1
+            yield build_html_parts(f"{left}{splice}{right}", "Splice")
+    if merged:
+        yield build_html_parts("".join(merged), merged_class)
 
-    return f"<p class='p_seq'>{''.join(html_parts)}</p>"
+
+def process_cs_tag(cs_tag: str) -> str:
+    return f"<p class='p_seq'>{''.join(iterate_html_parts(cs_tag))}</p>"
 
 
-def to_html(cs_tag: str, description: str = "") -> str:
+@accept_bytes
+def to_html(cs_tag: str, description: str = "", seq: str | None = None, cigar: str | None = None) -> str:
     """Output HTML string showing a sequence with mutations colored
     Args:
-        cs_tag (str): cs tag in the **long** format
+        cs_tag (str): cs tag in the **long** or **short** format
         description (str): (optional) header information in the output string
+        seq (str): (optional) the segment sequence (10th column in SAM file), required for a cs tag in the **short** format
+        cigar (str): (optional) cigar strings (6th column in SAM file), to skip the soft-clipped bases of `seq`
     Return:
         HTML string
     Example:
@@ -149,7 +154,9 @@ def to_html(cs_tag: str, description: str = "") -> str:
         >>> html_string = cstag.to_html(cs_tag, description)
     """
     validate_cs_tag(cs_tag)
-    validate_long_format(cs_tag)
+    validate_seq(cs_tag, seq)
+    if is_short_format(cs_tag):
+        cs_tag = "".join(expand_short_tokens(iter_tokens(cs_tag), seq, get_softclip(cigar)))
     description_str = f"<h1>{description}</h1>" if description else ""
     html_parts = process_cs_tag(cs_tag)
     report = "\n".join(
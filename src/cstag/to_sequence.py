@@ -1,14 +1,18 @@
 from __future__ import annotations
 
-from cstag.split import split
-from cstag.utils.validator import validate_cs_tag, validate_long_format
+from cstag.utils.tokenizer import iter_tokens, get_softclip
+from cstag.utils.validator import validate_cs_tag, validate_seq
+from cstag.utils.buffer import accept_bytes
 
 
-def to_sequence(cs_tag: str) -> str:
+@accept_bytes
+def to_sequence(cs_tag: str, seq: str | None = None, cigar: str | None = None) -> str:
     """Reconstruct the reference subsequence in the alignment
 
     Args:
-        cs_tag (str): cs tag in the **long** format
+        cs_tag (str): cs tag in the **long** or **short** format
+        seq (str, optional): the segment sequence (10th column in SAM file), required for a cs tag in the **short** format
+        cigar (str, optional): cigar strings (6th column in SAM file), to skip the soft-clipped bases of `seq`
 
     Returns:
         str: The sequence string derived from the cs tag.
@@ -18,18 +22,24 @@ def to_sequence(cs_tag: str) -> str:
         >>> cs_tag = "=AC*gt=T-gg=C+tt=A"
         >>> cstag.to_sequence(cs_tag)
         'ACTTCTTA'
+        >>> cstag.to_sequence(":2*gt:1-gg:1+tt:1", seq="ACTTCTTA")
+        'ACTTCTTA'
     """
     validate_cs_tag(cs_tag)
-    validate_long_format(cs_tag)
+    validate_seq(cs_tag, seq)
 
-    cs_tag = cs_tag.replace("cs:Z:", "")
     sequence = []
-    for cs in split(cs_tag):
-        if cs.startswith("="):
-            sequence.append(cs[1:].upper())
-        elif cs.startswith("+"):
-            sequence.append(cs[1:].upper())
-        elif cs.startswith("*"):
-            sequence.append(cs[-1].upper())
-
-    return "".join(sequence)
+    idx = get_softclip(cigar)
+    for cs in iter_tokens(cs_tag):
+        if cs[0] == ":":
+            length = int(cs[1:])
+            sequence.append(seq[idx : idx + length])
+            idx += length
+        elif cs[0] == "=" or cs[0] == "+":
+            sequence.append(cs[1:])
+            idx += len(cs) - 1
+        elif cs[0] == "*":
+            sequence.append(cs[-1])
+            idx += 1
+
+    return "".join(sequence).upper()
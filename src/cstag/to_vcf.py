@@ -1,14 +1,22 @@
 from __future__ import annotations
 
+import heapq
+import os
 import re
+import sys
+import tempfile
 from itertools import chain
-from collections import deque, defaultdict, Counter
+from collections import defaultdict, Counter
+from operator import attrgetter
+from typing import IO, Iterable, Iterator
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
-from cstag.split import split
-from cstag.consensus import normalize_read_lengths
-from cstag.utils.validator import validate_cs_tag, validate_long_format, validate_pos
+from cstag.utils.tokenizer import split_tokens, iter_tokens, get_reference_length, get_softclip
+from cstag.utils.validator import validate_cs_tag, validate_pos
+from cstag.utils.buffer import accept_bytes, decode
+from cstag.utils.pool import map_largest_first
+from cstag.utils.regions import RegionIndex
 
 
 @dataclass(frozen=True)
@@ -17,6 +25,13 @@ class CsInfo:
     pos_start: int
     pos_end: int
     chrom: str | None = None
+    # Operations of cs_tag, kept so that the tag is tokenized only once
+    cs_tag_split: tuple[str, ...] = field(default=(), compare=False, repr=False)
+
+    def __reduce__(self):
+        # Pickle the fields positionally: the default pickling of frozen dataclasses sets each field through
+        # object.__setattr__, which dominates the cost of sending reads to worker processes
+        return CsInfo, (self.cs_tag, self.pos_start, self.pos_end, self.chrom, self.cs_tag_split)
 
 
 @dataclass(frozen=True)
@@ -45,50 +60,66 @@ def remove_spaces_around_newlines(text: str) -> str:
 ###########################################################
 
 
-def find_ref_for_insertion(cs_tag_split: list[str], idx: int) -> str | None:
-    idx_ref = idx - 1
-    while idx_ref >= 0:
-        cs = cs_tag_split[idx_ref]
-        if cs[0] in ["=", "-"]:
-            return cs[-1].upper()
-        if cs.startswith("*"):
-            return cs[1].upper()
-        idx_ref -= 1
-    return None
-
-
-def find_ref_for_deletion(cs_tag_split: list[str], idx: int) -> str:
-    ref = deque([cs_tag_split[idx][1:].upper()])
-    idx_ref = idx - 1
-    while idx_ref >= 0:
-        cs = cs_tag_split[idx_ref]
-        if cs.startswith("="):
-            ref.appendleft(cs[-1].upper())
-            break
-        if cs.startswith("*"):
-            ref.appendleft(cs[1].upper())
-            break
-        idx_ref -= 1
-    return "".join(ref)
+def expand_anchor_bases(cs_tag_split: Iterable[str], seq: str | None, idx: int = 0) -> Iterator[str]:
+    """
+    Expand the last base of the matches of the short format (`:n`) that anchor an insertion or a deletion,
+    taking it from SEQ at the query index. The other matches are kept as they are.
+    """
+    match_length = 0
+    for cs in cs_tag_split:
+        # A match is held back until the next operation tells whether it anchors an indel
+        if match_length:
+            if cs[0] in {"+", "-"}:
+                if seq is None:
+                    raise ValueError("seq is required to call insertions and deletions from a cs tag in the short format")
+                if match_length > 1:
+                    yield f":{match_length - 1}"
+                yield "=" + seq[idx - 1]
+            else:
+                yield f":{match_length}"
+            match_length = 0
+        if cs[0] == ":":
+            match_length = int(cs[1:])
+            idx += match_length
+            continue
+        elif cs[0] == "=" or cs[0] == "+":
+            idx += len(cs) - 1
+        elif cs[0] == "*":
+            idx += 1
+        yield cs
+    if match_length:
+        yield f":{match_length}"
 
 
-def get_variant_annotations(cs_tag_split: list[str], position: int) -> list[Vcf]:
+def get_variant_annotations(cs_tag_split: Iterable[str], position: int) -> list[Vcf]:
+    """
+    Call the variants of a cs tag in a single pass over its operations.
+    An insertion is anchored to the last reference base before it, including a deleted base,
+    and a deletion to the last matched or substituted base before it.
+    """
     variant_annotations = []
     pos = position
-    for idx, cs in enumerate(cs_tag_split):
+    ref_insertion = ref_deletion = None
+    for cs in cs_tag_split:
         if cs.startswith("="):
             pos += len(cs) - 1
+            ref_insertion = ref_deletion = cs[-1].upper()
+        elif cs.startswith(":"):
+            pos += int(cs[1:])
         elif cs.startswith("*"):
             ref, alt = cs[1].upper(), cs[2].upper()
             variant_annotations.append(Vcf(pos=pos, ref=ref, alt=alt))
             pos += 1
+            ref_insertion = ref_deletion = ref
         elif cs.startswith("+"):
-            ref = find_ref_for_insertion(cs_tag_split, idx)
+            ref = ref_insertion
             alt = ref + cs[1:].upper()
             variant_annotations.append(Vcf(pos=pos - 1, ref=ref, alt=alt))
         elif cs.startswith("-"):
-            ref = find_ref_for_deletion(cs_tag_split, idx)
+            ref = (ref_deletion or "") + cs[1:].upper()
             variant_annotations.append(Vcf(pos=pos - 1, ref=ref, alt=ref[0]))
+            pos += len(cs) - 1
+            ref_insertion = cs[-1].upper()
         elif cs.startswith("~"):
             continue
 
@@ -102,18 +133,26 @@ def get_variant_annotations(cs_tag_split: list[str], position: int) -> list[Vcf]
 
 def get_pos_end(cs_tag: str, pos: int) -> int:
     """Get 1-index end positions"""
-    pos_end = pos - 1
-    for cs in split(cs_tag):
-        if cs[0] in ["=", "-"]:
-            pos_end += len(cs) - 1
-        if cs[0] == "*":
-            pos_end += 1
-        else:
-            continue
-    return pos_end
+    return pos - 1 + get_reference_length(iter_tokens(cs_tag))
 
 
-def format_cs_tags(cs_tags: list[str], chroms: list[str] | list[int], positions: list[int]) -> list[CsInfo]:
+def get_pos_end_bound(cs_tag: str, pos: int) -> int:
+    """
+    Get an upper bound of the 1-index end position, without tokenizing the cs tag unless it has `:` or `~`:
+    the other operations take at least one character per reference base.
+    """
+    if ":" in cs_tag or "~" in cs_tag:
+        return get_pos_end(cs_tag, pos)
+    return pos - 1 + len(cs_tag)
+
+
+def format_cs_tags(
+    cs_tags: list[str],
+    chroms: list[str] | list[int],
+    positions: list[int],
+    seqs: list[str] | None = None,
+    cigars: list[str] | None = None,
+) -> list[CsInfo]:
     """Format and filter cs_tags, and create a list of CsInfo objects.
 
     This function takes lists of cs_tags, chromosomes, and positions. It filters
@@ -123,23 +162,44 @@ def format_cs_tags(cs_tags: list[str], chroms: list[str] | list[int], positions:
         cs_tags (list[str]): List of cs_tags as strings.
         chroms (list[str] | list[int]): List of chromosomes as strings or integers.
         positions (list[int]): List of starting positions as integers.
+        seqs (list[str], optional): List of segment sequences, to take the anchor bases of the cs tags in the short format.
+        cigars (list[str], optional): List of cigar strings, to skip the soft-clipped bases of `seqs`.
 
     Returns:
         list[CsInfo]: A list of CsInfo objects, each containing information about
         a cs_tag, its chromosome, and its start and end positions.
     """
 
-    # Convert all chromosomes to string type
-    chroms = [str(chrom) for chrom in chroms]
-    # Create a list of CsInfo objects, filtering out any with a splicing ("~") in the cs_tag
-    cs_info_list = [
-        CsInfo(cs_tag=cs, chrom=chrom, pos_start=pos, pos_end=get_pos_end(cs, pos))
-        for cs, chrom, pos in zip(cs_tags, chroms, positions)
-        if "~" not in cs
-    ]
+    if seqs is None:
+        seqs = [None] * len(cs_tags)
+    if cigars is None:
+        cigars = [None] * len(cs_tags)
+
+    cs_info_list = []
+    for cs, chrom, pos, seq, cigar in zip(cs_tags, chroms, positions, seqs, cigars):
+        cs_info = format_cs_tag(cs, chrom, pos, seq, cigar)
+        if cs_info is not None:
+            cs_info_list.append(cs_info)
     return cs_info_list
 
 
+def format_cs_tag(
+    cs_tag: str, chrom: str | int, pos: int, seq: str | None = None, cigar: str | None = None
+) -> CsInfo | None:
+    """Create a CsInfo object of a cs tag, or return None if the cs tag has a splicing ("~")"""
+    if "~" in cs_tag:
+        return None
+    tokens = split_tokens(cs_tag)
+    return CsInfo(
+        cs_tag=cs_tag,
+        # Convert all chromosomes to string type
+        chrom=str(chrom),
+        pos_start=pos,
+        pos_end=pos - 1 + get_reference_length(tokens),
+        cs_tag_split=tuple(expand_anchor_bases(tokens, seq, get_softclip(cigar))),
+    )
+
+
 ###########################################################
 # Group by chrom and overlapping intervals
 ###########################################################
@@ -149,37 +209,40 @@ def group_by_chrom(cs_tags_formatted: list[tuple]) -> dict[str, tuple]:
     """Group cs tags by chromosomes"""
     cs_tags_grouped = defaultdict(list)
     for cs in cs_tags_formatted:
-        cs_tags_grouped[cs.chrom].append(
-            CsInfo(cs_tag=cs.cs_tag, pos_start=cs.pos_start, pos_end=cs.pos_end, chrom=cs.chrom)
-        )
+        cs_tags_grouped[cs.chrom].append(cs)
     return dict(cs_tags_grouped)
 
 
-def group_by_overlapping_intervals(cs_tags_grouped: CsInfo) -> list[CsInfo]:
-    # Sort the list by the starting point
-    sorted_data = sorted(cs_tags_grouped, key=lambda x: x.pos_start)
-    # Initialize the list of grouped intervals
+def group_by_overlapping_intervals(cs_tags_grouped: Iterable[CsInfo], presorted: bool = False) -> list[list[CsInfo]]:
+    """
+    Group cs tags whose reference intervals overlap, directly or through other cs tags of the group.
+
+    The cs tags are swept once in order of their start positions, keeping the largest end position of the current group,
+    so that each cs tag is compared to the group once instead of to each of its members.
+
+    Args:
+        cs_tags_grouped (Iterable[CsInfo]): cs tags of a chromosome
+        presorted (bool, optional): Whether the cs tags are already sorted by `pos_start`, to skip sorting them. Defaults to False
+    Returns:
+        list[list[CsInfo]]: Groups of overlapping cs tags, in order of their start positions
+    """
+    if not presorted:
+        cs_tags_grouped = sorted(cs_tags_grouped, key=attrgetter("pos_start"))
     grouped_intervals = []
-    # Initialize the first group with the first element
-    current_group = [sorted_data[0]]
-    # Loop through the sorted list starting from the second element
-    for i in range(1, len(sorted_data)):
-        overlaps = False
-        for j in current_group:
-            # Check if the intervals overlap
-            if sorted_data[i].pos_start <= j.pos_end and sorted_data[i].pos_end >= j.pos_start:
-                overlaps = True
-                break
-        if overlaps:
-            # Add the interval to the current group
-            current_group.append(sorted_data[i])
+    current_group = []
+    current_end = 0
+    for cs_info in cs_tags_grouped:
+        if current_group and cs_info.pos_start <= current_end:
+            current_group.append(cs_info)
+            if cs_info.pos_end > current_end:
+                current_end = cs_info.pos_end
         else:
-            # Add the current group to the list of grouped intervals
-            grouped_intervals.append(current_group)
-            # Start a new group
-            current_group = [sorted_data[i]]
-    # Add the last group to the list of grouped intervals
-    grouped_intervals.append(current_group)
+            if current_group:
+                grouped_intervals.append(current_group)
+            current_group = [cs_info]
+            current_end = cs_info.pos_end
+    if current_group:
+        grouped_intervals.append(current_group)
 
     return grouped_intervals
 
@@ -189,35 +252,125 @@ def group_by_overlapping_intervals(cs_tags_grouped: CsInfo) -> list[CsInfo]:
 ###########################################################
 
 
-def replace_mutation_to_atmark(cs_tags: str) -> str:
-    """Replaces mutations with '@'."""
-    return "".join(cs if cs in {"A", "C", "G", "T"} else "@" for cs in cs_tags)
+def iter_match_runs(cs_tag_split: Iterable[str], position: int = 0) -> Iterator[tuple[int, int]]:
+    """
+    Yield the reference interval `[start, end)` of each run of consecutive matched bases of a cs tag starting at `position`,
+    in a single pass over its operations.
 
+    A matched base followed by an insertion, and `N`, are not matches, so that a run never spans a variant.
+    The matches of the long and the short format make the same runs.
+    """
+    run_start, pos = None, position
+    for cs in cs_tag_split:
+        op = cs[0]
+        if op == "=" or op == ":":
+            if op == ":" or "N" not in cs:
+                if run_start is None:
+                    run_start = pos
+                pos += int(cs[1:]) if op == ":" else len(cs) - 1
+                continue
+            for bases in re.findall(r"N+|[ACGT]+", cs[1:]):
+                if bases[0] != "N":
+                    if run_start is None:
+                        run_start = pos
+                elif run_start is not None:
+                    yield run_start, pos
+                    run_start = None
+                pos += len(bases)
+            continue
+        if op == "+":
+            # An insertion is attached to the preceding base, which is no longer a match
+            if run_start is not None and pos - 1 > run_start:
+                yield run_start, pos - 1
+            run_start = None
+            continue
+        # A zero-length match (e.g. ":0") makes no run
+        if run_start is not None and pos > run_start:
+            yield run_start, pos
+        run_start = None
+        if op == "-":
+            pos += len(cs) - 1
+        elif op == "~":
+            pos += int(cs[3:-2])
+        else:
+            pos += 1
+    if run_start is not None and pos > run_start:
+        yield run_start, pos
+
+
+def count_runs_covering(runs: list[tuple[int, int]], windows: list[tuple[int, int]]) -> list[int]:
+    """
+    Count the runs `[start, end)` that cover each window `[start, end)`.
 
-def call_reference_depth(variant_annotations, cs_tags_list, positions_list) -> dict[tuple[str, int], int]:
-    cs_tags_normalized_length = normalize_read_lengths(cs_tags_list, positions_list)
-    cs_replaced = [replace_mutation_to_atmark(cs_tags) for cs_tags in cs_tags_normalized_length]
+    Runs and windows are swept once in order of their starts: the runs starting at or before a window
+    are added to a Fenwick tree of their ends, and the window counts those that end at or after its end.
+    The tree is 1-based: the end `e` is stored at index `e + 1`, so that an end of 0 is counted too.
+    """
+    size = max((end for _, end in chain(runs, windows)), default=0) + 1
+    tree = [0] * (size + 1)
+    counts = [0] * len(windows)
+    runs = sorted(runs)
+    i = 0
+    for w in sorted(range(len(windows)), key=lambda w: windows[w][0]):
+        window_start, window_end = windows[w]
+        while i < len(runs) and runs[i][0] <= window_start:
+            k = runs[i][1] + 1
+            while k <= size:
+                tree[k] += 1
+                k += k & -k
+            i += 1
+        # The runs added so far, less those ending before the window end
+        count, k = i, window_end
+        while k > 0:
+            count -= tree[k]
+            k -= k & -k
+        counts[w] = count
+    return counts
+
+
+def call_reference_depth(
+    variant_annotations, cs_tags_list, positions_list, ref_alleles: set[tuple[str, int]] | None = None
+) -> dict[tuple[str, int], int]:
+    """
+    Count the reads that match the REF allele of each variant over its whole length.
+    If `ref_alleles` is given, only its `(REF, POS)` are counted.
+
+    The runs of matched bases of each read are collected in one pass over its operations,
+    and every REF allele is then a range query over the runs, instead of a comparison with each read.
+    """
+    pos_min = min(positions_list)
+    runs = []
+    for cs_tag, pos in zip(cs_tags_list, positions_list):
+        runs.extend(iter_match_runs(split_tokens(cs_tag), pos - pos_min))
+
+    # Each variant with the same REF allele at a position adds its reference depth again
+    n_variants = Counter((v.ref, v.pos) for v in set(variant_annotations))
+    if ref_alleles is None:
+        ref_alleles = list(n_variants)
+    else:
+        ref_alleles = [ref_pos for ref_pos in n_variants if ref_pos in ref_alleles]
+    windows = [(pos - pos_min, pos - pos_min + len(ref)) for ref, pos in ref_alleles]
 
-    reference_depth = defaultdict(int)
-    unique_variants = set(variant_annotations)
-    for v in unique_variants:
-        v_idx = v.pos - min(positions_list)
-        for cs in cs_replaced:
-            if v.ref == cs[v_idx : v_idx + len(v.ref)]:
-                reference_depth[(v.ref, v.pos)] += 1
+    reference_depth = {}
+    for ref_pos, depth in zip(ref_alleles, count_runs_covering(runs, windows)):
+        if depth:
+            reference_depth[ref_pos] = depth * n_variants[ref_pos]
 
-    return dict(reference_depth)
+    return reference_depth
 
 
 def add_vcf_fields(
-    variant_annotations: list[Vcf], chrom: str, reference_depth: dict[tuple[str, int], int]
+    variant_annotations: Iterable[Vcf], chrom: str, reference_depth: dict[tuple[str, int], int]
 ) -> list[Vcf]:
-    """Add Chrom and VCF info (AD, RD, DP, and VAF) to immutable Vcf dataclass"""
-    variant_counter = Counter((v.pos, v.ref, v.alt) for v in variant_annotations)
+    """
+    Add Chrom and VCF info (AD, RD, DP, and VAF) to immutable Vcf dataclass.
+    `variant_annotations` may also be a Counter of the variants, which is taken as it is.
+    """
+    # Unique variants in order of their first appearance, so that variants at the same position are written in a fixed order
+    variant_counter = Counter(variant_annotations)
 
     updated_annotations = []
-    for v in set(variant_annotations):
-        ad = variant_counter[(v.pos, v.ref, v.alt)]
+    for v, ad in variant_counter.items():
         rd = reference_depth.get((v.ref, v.pos), 0)
         dp = rd + ad
         vaf = round(ad / dp, 3) if dp else 0
@@ -238,16 +391,24 @@ def add_vcf_fields(
 ###########################################################
 
 
-def process_cs_tag(cs_tag: str, chrom: str | int, pos: int) -> str:
+def process_cs_tag(
+    cs_tag: str,
+    chrom: str | int,
+    pos: int,
+    seq: str | None = None,
+    cigar: str | None = None,
+    regions: RegionIndex | None = None,
+) -> str:
     validate_cs_tag(cs_tag)
-    validate_long_format(cs_tag)
     validate_pos(pos)
     chrom = str(chrom)
 
-    cs_tag_split = split(cs_tag)
+    cs_tag_split = expand_anchor_bases(iter_tokens(cs_tag), seq, get_softclip(cigar))
 
     # Call POS, REF, ALT
     variants = get_variant_annotations(cs_tag_split, pos)
+    if regions is not None:
+        variants = [v for v in variants if regions.contains(chrom, v.pos)]
 
     # Write VCF
     HEADER = "##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
@@ -262,54 +423,365 @@ def process_cs_tag(cs_tag: str, chrom: str | int, pos: int) -> str:
 # Process cs tags (Many)
 ###########################################################
 
+VCF_HEADER = remove_spaces_around_newlines(
+    """##fileformat=VCFv4.2
+    ##INFO=<ID=DP,Number=1,Type=Integer,Description="Total Depth">
+    ##INFO=<ID=RD,Number=1,Type=Integer,Description="Depth of Ref allele">
+    ##INFO=<ID=AD,Number=1,Type=Integer,Description="Depth of Alt allele">
+    ##INFO=<ID=VAF,Number=1,Type=Float,Description="Variant allele frequency (AD/DP)">
+    #CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO"""
+)
+
+
+def format_vcf_record(v: Vcf) -> str:
+    return f"{v.chrom}\t{v.pos}\t.\t{v.ref}\t{v.alt}\t.\t.\tDP={v.info.dp};RD={v.info.rd};AD={v.info.ad};VAF={v.info.vaf}"
+
+
+def call_vcf_records(
+    variant_annotations: list[Vcf],
+    cs_infos: list[CsInfo],
+    chrom: str,
+    min_ad: int = 1,
+    min_dp: int = 1,
+    min_vaf: float = 0.0,
+) -> list[Vcf]:
+    """
+    Count the reference depth of the variants over the overlapping cs tags, and add the VCF fields.
+    Only the variants with an AD, DP and VAF of at least `min_ad`, `min_dp` and `min_vaf` are returned.
+
+    AD is known before the reference depth, and DP is at most AD plus the reference depth of every cs tag,
+    so the variants that fail `min_ad`, or `min_dp` whatever their reference depth, are dropped before counting it.
+    """
+    variant_counter = Counter(variant_annotations)
+    # Each variant with the same REF allele at a position adds its reference depth again (see call_reference_depth)
+    n_variants = Counter((v.ref, v.pos) for v in variant_counter)
+    variants_kept = {
+        v
+        for v, ad in variant_counter.items()
+        if ad >= min_ad and ad + len(cs_infos) * n_variants[(v.ref, v.pos)] >= min_dp
+    }
+    if not variants_kept:
+        return []
+
+    cs_tags_list = [cs.cs_tag for cs in cs_infos]
+    positions_list = [cs.pos_start for cs in cs_infos]
+    ref_alleles = None
+    if len(variants_kept) < len(variant_counter):
+        ref_alleles = {(v.ref, v.pos) for v in variants_kept}
+    reference_depth = call_reference_depth(variant_counter, cs_tags_list, positions_list, ref_alleles)
+    if ref_alleles is not None:
+        variant_counter = Counter({v: ad for v, ad in variant_counter.items() if v in variants_kept})
+    vcf_records = add_vcf_fields(variant_counter, chrom, reference_depth)
+    if min_dp > 1 or min_vaf > 0:
+        vcf_records = [v for v in vcf_records if v.info.dp >= min_dp and v.info.vaf >= min_vaf]
+    return vcf_records
+
 
 def chrom_sort_key(chrom: str) -> int:
     """Convert a chromosome string to an integer for sorting."""
     return int(chrom.replace("chr", ""))
 
 
-def process_cs_tags(cs_tags: list[str], chroms: list[str], positions: list[int]) -> str:
+def call_group_variants(
+    cs_infos: list[CsInfo],
+    chrom: str,
+    min_ad: int = 1,
+    min_dp: int = 1,
+    min_vaf: float = 0.0,
+    regions: RegionIndex | None = None,
+) -> list[Vcf]:
+    """
+    Call the variants of a group of overlapping cs tags, with their VCF fields.
+    The variants whose position is outside the `regions` are dropped before their reference depth is counted.
+    """
+    variant_annotations = [get_variant_annotations(cs.cs_tag_split, cs.pos_start) for cs in cs_infos]
+    variant_annotations = list(chain.from_iterable(variant_annotations))
+    if regions is not None:
+        variant_annotations = [v for v in variant_annotations if regions.contains(chrom, v.pos)]
+    if not variant_annotations:
+        return []
+    return call_vcf_records(variant_annotations, cs_infos, chrom, min_ad, min_dp, min_vaf)
+
+
+def call_batch_variants(
+    batch: list[tuple[str, list[CsInfo]]],
+    min_ad: int = 1,
+    min_dp: int = 1,
+    min_vaf: float = 0.0,
+    regions: RegionIndex | None = None,
+) -> list[list[Vcf]]:
+    return [call_group_variants(cs_infos, chrom, min_ad, min_dp, min_vaf, regions) for chrom, cs_infos in batch]
+
+
+def iterate_groups_variants(
+    groups: list[tuple[str, list[CsInfo]]],
+    workers: int | None,
+    batch_size: int,
+    min_ad: int = 1,
+    min_dp: int = 1,
+    min_vaf: float = 0.0,
+    regions: RegionIndex | None = None,
+) -> Iterator[Vcf]:
+    """
+    Call the variants of the overlap groups, spreading batches of groups over a process pool.
+    The variants are yielded in the order of the groups, as soon as all the groups before them are called,
+    whatever the order in which the batches complete.
+    """
+    sizes = [len(cs_infos) for _, cs_infos in groups]
+    results = map_largest_first(call_batch_variants, groups, sizes, batch_size, workers, min_ad, min_dp, min_vaf, regions)
+    variants_by_group, next_group = {}, 0
+    for i, variants in results:
+        variants_by_group[i] = variants
+        while next_group in variants_by_group:
+            yield from variants_by_group.pop(next_group)
+            next_group += 1
+
+
+###########################################################
+# Sort VCF records (Out-of-core)
+###########################################################
+
+# Maximum number of sorted runs merged at once, to bound the number of open temporary files
+MERGE_FAN_IN = 64
+# Bytes taken by a VCF line held in memory on top of the string: its list slot, and its sort key while sorting
+LINE_OVERHEAD = 160
+
+
+def vcf_line_sort_key(line: str) -> tuple[int, int]:
+    chrom, pos, _ = line.split("\t", 2)
+    return chrom_sort_key(chrom), int(pos)
+
+
+def spill_sorted_run(lines: Iterable[str]) -> IO[str]:
+    """Write VCF lines to an anonymous temporary file, rewound for reading"""
+    run = tempfile.TemporaryFile("w+")
+    run.writelines(f"{line}\n" for line in lines)
+    run.seek(0)
+    return run
+
+
+def merge_sorted_runs(runs: list[IO[str]], lines: list[str] = ()) -> Iterator[str]:
+    """
+    Merge the sorted runs of VCF lines, followed by the sorted `lines` held in memory, and close the runs.
+    On a tie, the line of the earliest run comes first.
+    """
+    try:
+        # Each line of a run ends with a newline, which is removed
+        runs_lines = [(line[:-1] for line in run) for run in runs]
+        yield from heapq.merge(*runs_lines, lines, key=vcf_line_sort_key)
+    finally:
+        for run in runs:
+            run.close()
+
+
+def iterate_sorted_vcf_records(variants: Iterable[Vcf], max_memory: int) -> Iterator[str]:
+    """
+    Sort the VCF lines of the variants by chromosome and position, holding at most about `max_memory` bytes of them.
+    Beyond that budget, the lines held are sorted and spilled to a temporary file, and the sorted runs are
+    k-way merged at the end. Both the sort and the merge are stable, so the lines come out in the same order as with `sorted`.
+    """
+    if max_memory < 1:
+        raise ValueError(f"max_memory must be a positive integer, but got {max_memory}")
+
+    runs, lines, lines_size = [], [], 0
+    try:
+        for v in variants:
+            line = format_vcf_record(v)
+            lines.append(line)
+            lines_size += sys.getsizeof(line) + LINE_OVERHEAD
+            if lines_size < max_memory:
+                continue
+            lines.sort(key=vcf_line_sort_key)
+            runs.append(spill_sorted_run(lines))
+            lines, lines_size = [], 0
+            if len(runs) >= MERGE_FAN_IN:
+                runs = [spill_sorted_run(merge_sorted_runs(runs))]
+    except BaseException:
+        for run in runs:
+            run.close()
+        raise
+
+    lines.sort(key=vcf_line_sort_key)
+    yield from merge_sorted_runs(runs, lines)
+
+
+def process_cs_tags(
+    cs_tags: list[str],
+    chroms: list[str],
+    positions: list[int],
+    seqs: list[str] | None = None,
+    cigars: list[str] | None = None,
+    workers: int | None = 1,
+    batch_size: int = 1000,
+    max_memory: int | None = None,
+    min_ad: int = 1,
+    min_dp: int = 1,
+    min_vaf: float = 0.0,
+    regions: RegionIndex | None = None,
+) -> str:
     # validate inputs
-    _ = [validate_cs_tag(cs_tag) for cs_tag in cs_tags]
-    _ = [validate_long_format(cs_tag) for cs_tag in cs_tags]
     _ = [validate_pos(pos) for pos in positions]
 
-    cs_tags_formatted = format_cs_tags(cs_tags, chroms, positions)
+    if regions is not None:
+        # The cs tags outside the regions are skipped on a bound of their end before they are validated,
+        # and only the cs tags kept are tokenized to check their exact end
+        kept = [
+            i
+            for i, (cs_tag, chrom, pos) in enumerate(zip(cs_tags, chroms, positions))
+            if regions.overlaps(str(chrom), pos, get_pos_end_bound(cs_tag, pos))
+        ]
+        _ = [validate_cs_tag(cs_tags[i]) for i in kept]
+        kept = [i for i in kept if regions.overlaps(str(chroms[i]), positions[i], get_pos_end(cs_tags[i], positions[i]))]
+        cs_tags, chroms, positions = ([values[i] for i in kept] for values in (cs_tags, chroms, positions))
+        seqs, cigars = (None if values is None else [values[i] for i in kept] for values in (seqs, cigars))
+    else:
+        _ = [validate_cs_tag(cs_tag) for cs_tag in cs_tags]
+
+    cs_tags_formatted = format_cs_tags(cs_tags, chroms, positions, seqs, cigars)
     cs_tags_grouped_by_chrom = group_by_chrom(cs_tags_formatted)
 
-    vcf_info = []
-    for chrom, cs_tags_grouped in cs_tags_grouped_by_chrom.items():
-        for csinfo in group_by_overlapping_intervals(cs_tags_grouped):
-            cs_tags_list = [cs.cs_tag for cs in csinfo]
-            positions_list = [cs.pos_start for cs in csinfo]
-            variant_annotations = [
-                get_variant_annotations(split(cs), pos) for cs, pos in zip(cs_tags_list, positions_list)
-            ]
-            variant_annotations = list(chain.from_iterable(variant_annotations))
-            if not variant_annotations:
-                continue
-            reference_depth = call_reference_depth(variant_annotations, cs_tags_list, positions_list)
-            vcf_info += add_vcf_fields(variant_annotations, chrom, reference_depth)
+    groups = [
+        (chrom, csinfo)
+        for chrom, cs_tags_grouped in cs_tags_grouped_by_chrom.items()
+        for csinfo in group_by_overlapping_intervals(cs_tags_grouped)
+    ]
+    vcf_info = iterate_groups_variants(groups, workers, batch_size, min_ad, min_dp, min_vaf, regions)
 
     # Sort by chrom and pos
-    variants = sorted(vcf_info, key=lambda x: (chrom_sort_key(x.chrom), x.pos))
+    if max_memory is None:
+        variants = sorted(vcf_info, key=lambda x: (chrom_sort_key(x.chrom), x.pos))
+        records = map(format_vcf_record, variants)
+    else:
+        records = iterate_sorted_vcf_records(vcf_info, max_memory)
 
-    # Write VCF
-    HEADER = """##fileformat=VCFv4.2
-    ##INFO=<ID=DP,Number=1,Type=Integer,Description="Total Depth">
-    ##INFO=<ID=RD,Number=1,Type=Integer,Description="Depth of Ref allele">
-    ##INFO=<ID=AD,Number=1,Type=Integer,Description="Depth of Alt allele">
-    ##INFO=<ID=VAF,Number=1,Type=Float,Description="Variant allele frequency (AD/DP)">
-    #CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n
-    """
+    vcf = VCF_HEADER.split("\n")
+    vcf.extend(records)
 
-    vcf = remove_spaces_around_newlines(HEADER).strip().split("\n")
+    return "\n".join(vcf)
+
+
+###########################################################
+# Process cs tags (Stream)
+###########################################################
+
+# Number of pending variants that triggers writing the variants that no later read can change
+FLUSH_VARIANTS = 10_000
+
+
+def flush_variants(pending: Counter, cs_infos: list[CsInfo], chrom: str, pos_before: int | None = None) -> list[Vcf]:
+    """
+    Remove the pending variants before `pos_before` (all if None), and return them with their VCF fields, sorted by position.
+    `pending` counts each variant in order of its first appearance.
+    """
+    variants = [v for v in pending if pos_before is None or v.pos < pos_before]
+    if not variants:
+        return []
+    variant_annotations = []
     for v in variants:
-        vcf.append(
-            f"{v.chrom}\t{v.pos}\t.\t{v.ref}\t{v.alt}\t.\t.\tDP={v.info.dp};RD={v.info.rd};AD={v.info.ad};VAF={v.info.vaf}"
-        )
+        variant_annotations += [v] * pending.pop(v)
+    pos_min = min(v.pos for v in variants)
+    cs_infos = [cs for cs in cs_infos if cs.pos_end >= pos_min]
+    return sorted(call_vcf_records(variant_annotations, cs_infos, chrom), key=attrgetter("pos"))
 
-    return "\n".join(vcf)
+
+def iter_vcf(records: Iterable[tuple]) -> Iterator[str]:
+    """
+    Call variants from coordinate-sorted cs tags, and yield the VCF lines as soon as no later cs tag can change them.
+
+    Only the cs tags overlapping the pending variants are kept, so the memory is bounded by the depth of the reads
+    around the current position, not by the number of reads or variants of the genome.
+    The fields and the order of the variants are the same as `to_vcf` with lists, except that chromosomes are written in input order.
+
+    Args:
+        records (Iterable[tuple]): `(cs_tag, chrom, pos)` or `(cs_tag, chrom, pos, seq, cigar)` of each read,
+            sorted by chromosome and by position, such as the records of a coordinate-sorted BAM file.
+            cs tags with a splicing ("~") are skipped.
+
+    Yields:
+        str: The VCF header and records, each ending with a newline.
+
+    Example:
+        >>> import cstag
+        >>> records = [("=ACGT", "chr1", 2), ("=AC*gt=T", "chr1", 2), ("=C*gt=T", "chr1", 3), ("=AC*gt=T", "chr2", 100)]
+        >>> for line in cstag.iter_vcf(records):
+        ...     print(line, end="")
+        ##fileformat=VCFv4.2
+        ##INFO=<ID=DP,Number=1,Type=Integer,Description="Total Depth">
+        ##INFO=<ID=RD,Number=1,Type=Integer,Description="Depth of Ref allele">
+        ##INFO=<ID=AD,Number=1,Type=Integer,Description="Depth of Alt allele">
+        ##INFO=<ID=VAF,Number=1,Type=Float,Description="Variant allele frequency (AD/DP)">
+        #CHROM	POS	ID	REF	ALT	QUAL	FILTER	INFO
+        chr1	4	.	G	T	.	.	DP=3;RD=1;AD=2;VAF=0.667
+        chr2	102	.	G	T	.	.	DP=1;RD=0;AD=1;VAF=1.0
+    """
+    for line in VCF_HEADER.split("\n"):
+        yield line + "\n"
+
+    chrom, chroms_done, pos_last = None, set(), 0
+    # The reads that may cover a pending or a later variant, and the end of the reads overlapping them
+    cs_infos, group_end = [], 0
+    pending = Counter()
+    flush_at, prune_at = FLUSH_VARIANTS, FLUSH_VARIANTS
+    for record in records:
+        (cs_tag, chrom_record, pos, *seq_cigar), _ = decode(record)
+        validate_cs_tag(cs_tag)
+        validate_pos(pos)
+        cs_info = format_cs_tag(cs_tag, chrom_record, pos, *seq_cigar)
+        if cs_info is None:
+            continue
+        if cs_info.chrom != chrom:
+            for v in flush_variants(pending, cs_infos, chrom):
+                yield format_vcf_record(v) + "\n"
+            if cs_info.chrom in chroms_done:
+                raise ValueError(f"records must be sorted by chromosome, but {cs_info.chrom} appears again")
+            chroms_done.add(cs_info.chrom)
+            chrom, cs_infos, group_end, pos_last = cs_info.chrom, [], 0, pos
+        elif pos < pos_last:
+            raise ValueError(f"records must be sorted by position, but {pos} follows {pos_last} on {chrom}")
+        pos_last = pos
+
+        if pos > group_end:
+            # No read overlaps both the pending variants and this read
+            for v in flush_variants(pending, cs_infos, chrom):
+                yield format_vcf_record(v) + "\n"
+            cs_infos = []
+        elif len(pending) >= flush_at:
+            # Later reads call variants from `pos - 1` on, and cover none of the bases before `pos`
+            for v in flush_variants(pending, cs_infos, chrom, pos - 1):
+                yield format_vcf_record(v) + "\n"
+            flush_at = len(pending) + FLUSH_VARIANTS
+        if len(cs_infos) >= prune_at:
+            pos_min = min((v.pos for v in pending), default=pos - 1)
+            cs_infos = [cs for cs in cs_infos if cs.pos_end >= min(pos_min, pos - 1)]
+            prune_at = max(FLUSH_VARIANTS, 2 * len(cs_infos))
+
+        cs_infos.append(cs_info)
+        group_end = max(group_end, cs_info.pos_end)
+        pending.update(get_variant_annotations(cs_info.cs_tag_split, pos))
+
+    for v in flush_variants(pending, cs_infos, chrom):
+        yield format_vcf_record(v) + "\n"
+
+
+def write_vcf(records: Iterable[tuple], output: IO[str] | None = None, buffer_lines: int = 10000) -> None:
+    """
+    Call variants from coordinate-sorted cs tags, and write the VCF lines with buffered bulk writes.
+
+    Args:
+        records (Iterable[tuple]): `(cs_tag, chrom, pos)` or `(cs_tag, chrom, pos, seq, cigar)` of each read, sorted by chromosome and by position.
+        output (IO[str], optional): File handle to write to. Defaults to the standard output.
+        buffer_lines (int, optional): Number of lines written at once. Defaults to 10000.
+    """
+    if output is None:
+        output = sys.stdout
+    buffer = []
+    for line in iter_vcf(records):
+        buffer.append(line)
+        if len(buffer) >= buffer_lines:
+            output.write("".join(buffer))
+            buffer.clear()
+    if buffer:
+        output.write("".join(buffer))
 
 
 ###########################################################
@@ -317,14 +789,44 @@ def process_cs_tags(cs_tags: list[str], chroms: list[str], positions: list[int])
 ###########################################################
 
 
-def to_vcf(cs_tags: str | list[str], chroms: str | int | list[str] | list[int], positions: int | list[int]) -> str:
+@accept_bytes
+def to_vcf(
+    cs_tags: str | list[str],
+    chroms: str | int | list[str] | list[int],
+    positions: int | list[int],
+    seqs: str | list[str] | None = None,
+    cigars: str | list[str] | None = None,
+    workers: int | None = 1,
+    batch_size: int = 1000,
+    max_memory: int | None = None,
+    min_ad: int = 1,
+    min_dp: int = 1,
+    min_vaf: float = 0.0,
+    regions: str | os.PathLike | list[tuple] | None = None,
+) -> str:
     """
     Convert cs tag(s) to VCF (Variant Call Format) string.
 
     Args:
-        cs_tag (str | list[str]): The cs tag representing the sequence alignment.
+        cs_tag (str | list[str]): The cs tag representing the sequence alignment, in the **long** or **short** format.
         chrom (str | list[str]): The chromosome name.
         pos (int | list[int]): The starting position for the sequence.
+        seqs (str | list[str], optional): The segment sequence (10th column in SAM file). Required for cs tags in the **short** format
+            with insertions or deletions, whose anchor bases are taken from it. The other matches are never expanded.
+        cigars (str | list[str], optional): The cigar strings (6th column in SAM file), to skip the soft-clipped bases of `seqs`.
+        workers (int, optional): Number of worker processes over which the groups of overlapping cs tags are spread.
+            None uses all CPUs. The output is the same for any number of workers. Defaults to 1.
+        batch_size (int, optional): Number of reads sent to a worker at once. Small groups are packed together up to this size. Defaults to 1000.
+        max_memory (int, optional): Approximate number of bytes of VCF records held in memory before sorting them.
+            Beyond it, sorted runs of records are spilled to temporary files and merged. Defaults to None (no limit).
+        min_ad (int, optional): Minimum depth of the ALT allele (AD) of the variants written. Defaults to 1.
+        min_dp (int, optional): Minimum total depth (DP) of the variants written. Defaults to 1.
+        min_vaf (float, optional): Minimum variant allele frequency (VAF) of the variants written. Defaults to 0.0.
+            The variants that fail `min_ad` or `min_dp` are dropped before their reference depth is counted.
+            The thresholds apply to lists of cs tags only, since a single cs tag has no VCF fields.
+        regions (str | os.PathLike | list[tuple], optional): Target regions, as a BED file or as `(chrom, start, end)` tuples
+            in 1-based inclusive coordinates. Only the variants whose position lies in a region are written,
+            and the cs tags that overlap no region are skipped without being validated. Defaults to None (the whole genome).
 
     Returns:
         str: The VCF-formatted string.
@@ -338,11 +840,23 @@ def to_vcf(cs_tags: str | list[str], chroms: str | int | list[str] | list[int],
         #CHROM	POS	ID	REF	ALT	QUAL	FILTER	INFO
         chr1	3	.	G	T	.	.	.
         chr1	4	.	TGG	T	.	.	.
-        chr1	5	.	C	CTT	.	.	.
+        chr1	7	.	C	CTT	.	.	.
+        >>> print(cstag.to_vcf(":2*gt:1-gg:1+tt:1", chrom, pos, seqs="ACTTCTTA"))
+        ##fileformat=VCFv4.2
+        #CHROM	POS	ID	REF	ALT	QUAL	FILTER	INFO
+        chr1	3	.	G	T	.	.	.
+        chr1	4	.	TGG	T	.	.	.
+        chr1	7	.	C	CTT	.	.	.
     """
+    if regions is not None:
+        regions = RegionIndex(regions)
+        if None in regions.chroms:
+            raise ValueError("regions of to_vcf must be given as (chrom, start, end), but got a region without chromosome")
     if isinstance(cs_tags, str):
-        return process_cs_tag(cs_tags, chroms, positions)
+        return process_cs_tag(cs_tags, chroms, positions, seqs, cigars, regions)
     elif isinstance(cs_tags, list):
-        return process_cs_tags(cs_tags, chroms, positions)
+        return process_cs_tags(
+            cs_tags, chroms, positions, seqs, cigars, workers, batch_size, max_memory, min_ad, min_dp, min_vaf, regions
+        )
     else:
         raise TypeError(f"cs_tags must be str or list, not {type(cs_tags)}")
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from functools import wraps
+from typing import Any, Callable, TypeVar, Union
+
+BytesLike = Union[bytes, bytearray, memoryview]
+BYTES_TYPES = (bytes, bytearray, memoryview)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def decode(value: Any) -> tuple[Any, type | None]:
+    """Decode a bytes-like value (or a list/tuple of them) as ASCII, and report the bytes-like type that was found"""
+    if isinstance(value, BYTES_TYPES):
+        return str(value, "ascii"), type(value)
+    if isinstance(value, (list, tuple)) and any(isinstance(v, BYTES_TYPES) for v in value):
+        kind = next(type(v) for v in value if isinstance(v, BYTES_TYPES))
+        return [str(v, "ascii") if isinstance(v, BYTES_TYPES) else v for v in value], kind
+    return value, None
+
+
+def encode(value: Any, kind: type) -> Any:
+    """Encode strings (or a list or tuple of them, recursively) back into the bytes-like type given as `kind`"""
+    if isinstance(value, str):
+        if kind is bytearray:
+            return bytearray(value, "ascii")
+        if kind is memoryview:
+            return memoryview(value.encode("ascii"))
+        return value.encode("ascii")
+    if isinstance(value, list):
+        return [encode(v, kind) for v in value]
+    if isinstance(value, tuple):
+        return tuple(encode(v, kind) for v in value)
+    return value
+
+
+def accept_bytes(function: F) -> F:
+    """
+    Let a function that takes cs tags, CIGAR, SEQ or QUAL as `str` also take `bytes`, `bytearray` or `memoryview`.
+
+    Bytes-like arguments are decoded once as ASCII, and the string results are returned as the type of the
+    first bytes-like argument. Calls with `str` only are passed through unchanged.
+    """
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        kind = None
+        if any(isinstance(arg, (BYTES_TYPES, list, tuple)) for arg in args) or kwargs:
+            decoded_args = []
+            for arg in args:
+                arg, kind_arg = decode(arg)
+                decoded_args.append(arg)
+                kind = kind or kind_arg
+            args = tuple(decoded_args)
+            for key, value in kwargs.items():
+                kwargs[key], kind_arg = decode(value)
+                kind = kind or kind_arg
+        result = function(*args, **kwargs)
+        return result if kind is None else encode(result, kind)
+
+    return wrapper  # type: ignore[return-value]
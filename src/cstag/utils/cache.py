@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, NamedTuple, TypeVar
+
+T = TypeVar("T")
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    maxsize: int
+    currsize: int
+
+
+class LRUCache(Generic[T]):
+    """
+    Memoise a single-argument function with a size-bounded, least-recently-used cache.
+    Unlike `functools.lru_cache`, the capacity can be changed at runtime (0 disables caching) and evictions are counted.
+    Keys longer than `max_key_length` are passed through without being cached (nor counted), so that a few long,
+    unique keys (e.g. the CIGAR strings of long reads) do not keep large values alive.
+    """
+
+    def __init__(
+        self, function: Callable[[Hashable], T], maxsize: int = 4096, max_key_length: int | None = None
+    ) -> None:
+        self.function = function
+        self.maxsize = maxsize
+        self.max_key_length = max_key_length
+        self._data: OrderedDict[Hashable, T] = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def __call__(self, key: Hashable) -> T:
+        if self.maxsize == 0 or (self.max_key_length is not None and len(key) > self.max_key_length):
+            return self.function(key)
+        data = self._data
+        if key in data:
+            self.hits += 1
+            data.move_to_end(key)
+            return data[key]
+        self.misses += 1
+        value = self.function(key)
+        data[key] = value
+        if len(data) > self.maxsize:
+            data.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self._data))
+
+    def cache_clear(self) -> None:
+        self._data.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def set_maxsize(self, maxsize: int) -> None:
+        if not isinstance(maxsize, int) or maxsize < 0:
+            raise ValueError(f"maxsize must be a non-negative integer, but got {maxsize}")
+        self.maxsize = maxsize
+        while len(self._data) > maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+from typing import Callable, Iterable, Iterator, Sequence, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def get_workers(workers: int | None) -> int:
+    """Number of worker processes, the number of CPUs by default"""
+    if workers is None:
+        return os.cpu_count() or 1
+    return workers
+
+
+def imap_batches(function: Callable[..., R], batches: Iterable, workers: int | None, *args) -> Iterator[R]:
+    """
+    Yield `function(batch, *args)` for each batch, in the order of the batches, spreading them over a process pool.
+
+    Only a few batches per worker are in flight, so that the batches can be read lazily from a large input.
+    The batches are run in this process with a single worker, or when there are fewer than two batches.
+    """
+    workers = get_workers(workers)
+    batches = iter(batches)
+    # Inputs that fit in a single batch are not worth starting worker processes for
+    head = list(islice(batches, 2))
+    if workers <= 1 or len(head) < 2:
+        for batch in chain(head, batches):
+            yield function(batch, *args)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for batch in chain(head, batches):
+            pending.append(executor.submit(function, batch, *args))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iterate_largest_first_batches(sizes: Sequence[int], batch_size: int) -> Iterator[list[int]]:
+    """
+    Pack the indices of items of the given sizes into batches of about `batch_size`.
+    The largest items come first and are batched alone, so that the slowest tasks start first and small items
+    do not pay the cost of a task each.
+    """
+    batch, size_batch = [], 0
+    for i in sorted(range(len(sizes)), key=sizes.__getitem__, reverse=True):
+        batch.append(i)
+        size_batch += sizes[i]
+        if size_batch >= batch_size:
+            yield batch
+            batch, size_batch = [], 0
+    if batch:
+        yield batch
+
+
+def map_largest_first(
+    function: Callable[..., list[R]],
+    items: Sequence[T],
+    sizes: Sequence[int],
+    batch_size: int,
+    workers: int | None,
+    *args,
+) -> Iterator[tuple[int, R]]:
+    """
+    Yield `(i, result)` for each item, where `function(batch, *args)` returns the results of a batch of items.
+
+    Over a process pool, the items are packed by `iterate_largest_first_batches`, and the results come batch by batch.
+    With a single worker, the items are run one by one in their order.
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be a positive integer, but got {batch_size}")
+    if get_workers(workers) <= 1:
+        for i, item in enumerate(items):
+            yield i, function([item], *args)[0]
+        return
+
+    batches = list(iterate_largest_first_batches(sizes, batch_size))
+    results = imap_batches(function, ([items[i] for i in batch] for batch in batches), workers, *args)
+    for batch, results_batch in zip(batches, results):
+        yield from zip(batch, results_batch)
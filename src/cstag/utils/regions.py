@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import os
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Iterable, Iterator
+
+
+def read_bed(path: str | os.PathLike) -> list[tuple[str, int, int]]:
+    """Read the regions of a BED file as `(chrom, start, end)`, converted to 1-based inclusive coordinates"""
+    regions = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip() or line.startswith(("#", "track", "browser")):
+                continue
+            chrom, start, end = line.split()[:3]
+            regions.append((chrom, int(start) + 1, int(end)))
+    return regions
+
+
+class RegionIndex:
+    """
+    Index of target regions, merged and sorted per chromosome, to find the regions around a position by binary search.
+
+    The regions are read from a BED file (0-based, half-open), or given as `(chrom, start, end)` or `(start, end)`
+    in 1-based inclusive coordinates. The regions given as `(start, end)` are on the chromosome `None`.
+    Overlapping and adjacent regions are merged.
+    """
+
+    def __init__(self, regions: str | os.PathLike | Iterable[tuple]) -> None:
+        if isinstance(regions, (str, os.PathLike)):
+            regions = read_bed(regions)
+        intervals_by_chrom = defaultdict(list)
+        for *chrom, start, end in regions:
+            if start > end:
+                raise ValueError(f"start must not be greater than end, but got {start} > {end}")
+            # Convert all chromosomes to string type, as to_vcf does
+            intervals_by_chrom[str(chrom[0]) if chrom else None].append((start, end))
+
+        self.starts: dict[str | None, list[int]] = {}
+        self.ends: dict[str | None, list[int]] = {}
+        for chrom, intervals in intervals_by_chrom.items():
+            starts, ends = [], []
+            for start, end in sorted(intervals):
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            self.starts[chrom], self.ends[chrom] = starts, ends
+
+    @property
+    def chroms(self) -> list[str | None]:
+        return list(self.starts)
+
+    def overlaps(self, chrom: str | None, start: int, end: int) -> bool:
+        """Whether a region of `chrom` overlaps the interval [start, end]"""
+        ends = self.ends.get(chrom)
+        if ends is None:
+            return False
+        i = bisect_left(ends, start)
+        return i < len(ends) and self.starts[chrom][i] <= end
+
+    def contains(self, chrom: str | None, pos: int) -> bool:
+        """Whether a region of `chrom` contains the position `pos`"""
+        return self.overlaps(chrom, pos, pos)
+
+    def iter_regions_from(self, chrom: str | None, pos: int) -> Iterator[tuple[int, int]]:
+        """Yield the regions of `chrom` that end at or after `pos`, in order"""
+        ends = self.ends.get(chrom)
+        if ends is None:
+            return
+        starts = self.starts[chrom]
+        for i in range(bisect_left(ends, pos), len(ends)):
+            yield starts[i], ends[i]
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import re
+from typing import Iterator
+
+# One scan splits a cs tag of either format into its operations.
+# Text that is not a valid operation is kept as a token that runs up to the next operator.
+CS_TOKEN = re.compile(r"=[ACGTN]+|:[0-9]+|\*[acgtn]{2}|[+-][acgtn]+|~[acgtn]{2}[0-9]+[acgtn]{2}|.[^-+*~=:]*")
+CS_TOKEN_BYTES = re.compile(CS_TOKEN.pattern.encode("ascii"))
+# A token is an operation if it is matched by one of the alternatives of CS_TOKEN before the last one
+CS_OPERATION = re.compile(CS_TOKEN.pattern.rsplit("|", 1)[0])
+# Every operation starts with an operator, so a tag can be cut before any operator without splitting an operation
+CS_OPERATOR = re.compile(r"[-+*~=:]")
+CS_OPERATOR_BYTES = re.compile(CS_OPERATOR.pattern.encode("ascii"))
+# Number of characters split at once by `iter_tokens`
+TOKEN_CHUNK_SIZE = 1 << 16
+
+
+def split_tokens(cs_tag: str) -> list[str]:
+    """Split a cs tag into its operations in a single scan, skipping the prefix 'cs:Z:' without copying the tag."""
+    return CS_TOKEN.findall(cs_tag, 5 if cs_tag.startswith("cs:Z:") else 0)
+
+
+def get_patterns(cs_tag: str | bytes | bytearray | memoryview) -> tuple[re.Pattern, re.Pattern, int]:
+    """Return the token and operator patterns matching the type of a cs tag, and the start of its operations after the prefix 'cs:Z:'"""
+    if isinstance(cs_tag, str):
+        return CS_TOKEN, CS_OPERATOR, 5 if cs_tag.startswith("cs:Z:") else 0
+    return CS_TOKEN_BYTES, CS_OPERATOR_BYTES, 5 if cs_tag[:5] == b"cs:Z:" else 0
+
+
+def iter_token_matches(cs_tag: str | bytes | bytearray | memoryview) -> Iterator[re.Match]:
+    """Scan a cs tag lazily, one operation at a time. Bytes-like tags are scanned in place, without decoding them."""
+    cs_token, _, start = get_patterns(cs_tag)
+    return cs_token.finditer(cs_tag, start)
+
+
+def iter_tokens(cs_tag: str) -> Iterator[str]:
+    """
+    Yield the operations of a cs tag, the same as `split_tokens`, splitting `TOKEN_CHUNK_SIZE` characters at a time
+    so that the memory does not grow with the length of the tag. Bytes-like tags yield `bytes`.
+    """
+    cs_token, cs_operator, start = get_patterns(cs_tag)
+    length = len(cs_tag)
+    while start < length:
+        cut = cs_operator.search(cs_tag, start + TOKEN_CHUNK_SIZE)
+        end = cut.start() if cut else length
+        yield from cs_token.findall(cs_tag, start, end)
+        start = end
+
+
+def tokenize(cs_tag: str, validate: bool = False) -> Iterator[tuple[str, str | int, int, int]]:
+    """
+    Yield `(op, payload, ref_offset, query_offset)` for each operation of a cs tag.
+
+    The payload is the run length for `:` and the string following the operator otherwise.
+    The offsets are 0-based and point to the start of the operation in the reference and in the query.
+    With `validate`, each token is checked as it is read, and a ValueError is raised on the first one
+    that is not an operation, so that a caller that stops early does not scan the rest of the tag.
+
+    Example:
+        >>> from cstag.utils.tokenizer import tokenize
+        >>> list(tokenize("=AC*ag+t-cc:2~gt10ag=T"))
+        [('=', 'AC', 0, 0), ('*', 'ag', 2, 2), ('+', 't', 3, 3), ('-', 'cc', 3, 4), (':', 2, 5, 4), ('~', 'gt10ag', 7, 6), ('=', 'T', 17, 6)]
+    """
+    ref_offset, query_offset = 0, 0
+    for token in iter_tokens(cs_tag):
+        if validate and not CS_OPERATION.fullmatch(token):
+            raise ValueError(f"Invalid cs tag: {cs_tag}")
+        op = token[0]
+        if op == "=":
+            length = len(token) - 1
+            yield op, token[1:], ref_offset, query_offset
+            ref_offset += length
+            query_offset += length
+        elif op == ":":
+            length = int(token[1:])
+            yield op, length, ref_offset, query_offset
+            ref_offset += length
+            query_offset += length
+        elif op == "*":
+            yield op, token[1:], ref_offset, query_offset
+            ref_offset += 1
+            query_offset += 1
+        elif op == "+":
+            yield op, token[1:], ref_offset, query_offset
+            query_offset += len(token) - 1
+        elif op == "-":
+            yield op, token[1:], ref_offset, query_offset
+            ref_offset += len(token) - 1
+        elif op == "~":
+            yield op, token[1:], ref_offset, query_offset
+            ref_offset += int(token[3:-2])
+        else:
+            yield op, token[1:], ref_offset, query_offset
+
+
+def get_reference_length(tokens: list[str]) -> int:
+    """Return the number of reference bases spanned by the operations of a cs tag"""
+    length = 0
+    for token in tokens:
+        op = token[0]
+        if op == "=" or op == "-":
+            length += len(token) - 1
+        elif op == ":":
+            length += int(token[1:])
+        elif op == "*":
+            length += 1
+        elif op == "~":
+            length += int(token[3:-2])
+    return length
+
+
+def get_softclip(cigar: str | None) -> int:
+    """Return the length of the leading soft clip of a CIGAR string"""
+    if not cigar:
+        return 0
+    softclip = cigar.split("S")[0]
+    return int(softclip) if softclip.isdigit() else 0
@@ -1,14 +1,22 @@
 from __future__ import annotations
 
 import re
+import sys
 
-
-def validate_cs_tag(cs_tag: str) -> None:
-    pattern = re.compile(
-        r"^(=[ACGTN]+|:[0-9]+|\*[acgtn][acgtn]|\+[acgtn]+|\-[acgtn]+|\~[acgtn][acgtn][0-9]+[acgtn][acgtn])*$"
+# Possessive quantifiers (Python 3.11+) keep no backtracking state per operation,
+# so validating a megabase-scale cs tag does not grow the memory with the tag length
+if sys.version_info >= (3, 11):
+    CS_TAG_PATTERN = re.compile(
+        r"(?:=[ACGTN]++|:[0-9]++|\*[acgtn][acgtn]|\+[acgtn]++|\-[acgtn]++|\~[acgtn][acgtn][0-9]++[acgtn][acgtn])*+"
+    )
+else:
+    CS_TAG_PATTERN = re.compile(
+        r"(?:=[ACGTN]+|:[0-9]+|\*[acgtn][acgtn]|\+[acgtn]+|\-[acgtn]+|\~[acgtn][acgtn][0-9]+[acgtn][acgtn])*"
     )
 
-    if not pattern.fullmatch(cs_tag.replace("cs:Z:", "")):
+
+def validate_cs_tag(cs_tag: str) -> None:
+    if not CS_TAG_PATTERN.fullmatch(cs_tag, 5 if cs_tag.startswith("cs:Z:") else 0):
         raise ValueError(f"Invalid cs tag: {cs_tag}")
 
 
@@ -22,6 +30,20 @@ def validate_long_format(cs_tag: str) -> None:
         raise ValueError("cs tag must be in long format")
 
 
+def is_short_format(cs_tag: str) -> bool:
+    return re.search(r":[0-9]", cs_tag) is not None
+
+
+def validate_seq(cs_tag: str, seq: str | None) -> None:
+    if seq is None and is_short_format(cs_tag):
+        raise ValueError("seq is required to process a cs tag in the short format")
+
+
+def validate_same_format(cs_tags: list[str]) -> None:
+    if any("=" in cs_tag for cs_tag in cs_tags) and any(is_short_format(cs_tag) for cs_tag in cs_tags):
+        raise ValueError("cs tags must be all in the long format or all in the short format")
+
+
 def validate_threshold(threshold: int) -> None:
     if not isinstance(threshold, int):
         raise ValueError("threshold must be an integer")
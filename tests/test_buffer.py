@@ -0,0 +1,89 @@
+import pytest
+from src.cstag.utils.buffer import accept_bytes
+from src.cstag import (
+    CsIndex,
+    ConsensusBuilder,
+    adaptive_consensus,
+    call,
+    consensus,
+    consensus_blocks,
+    iter_vcf,
+    lengthen,
+    mask,
+    mask_many,
+    revcomp,
+    shorten,
+    split,
+    to_sequence,
+    to_vcf,
+)
+
+
+@pytest.mark.parametrize("kind", [bytes, bytearray])
+def test_accept_bytes_returns_input_type(kind):
+    function = accept_bytes(lambda cs_tag, prefix=False: cs_tag.upper())
+    result = function(kind(b"=acgt"))
+    assert type(result) is kind
+    assert result == kind(b"=ACGT")
+
+
+def test_accept_bytes_memoryview():
+    buffer = b"read1\t=ACGT*ac+gg-cc=T\t"
+    result = shorten(memoryview(buffer)[6:22])
+    assert isinstance(result, memoryview)
+    assert result.tobytes() == b":4*ac+gg-cc:1"
+
+
+def test_accept_bytes_passes_str_through():
+    assert shorten("=ACGT*ac+gg-cc=T") == ":4*ac+gg-cc:1"
+
+
+def test_accept_bytes_non_ascii():
+    with pytest.raises(UnicodeDecodeError):
+        shorten("=ACGTé".encode())
+
+
+@pytest.mark.parametrize(
+    "function, args, kwargs, expected",
+    [
+        (call, (b"8M", b"4C3", b"ACGTACGT"), {"long": True}, b"=ACGT*ca=CGT"),
+        (shorten, (b"=ACGT*ag=CGT",), {"prefix": True}, b"cs:Z::4*ag:3"),
+        (lengthen, (b":4*ag:3", b"8M", b"ACGTACGT"), {}, b"=ACGT*ag=CGT"),
+        (mask, (b"=ACGT*ac+gg-cc=T", b"5M2I2D1M", b"AA!!!!AA"), {}, b"=ACNN*an+ng-cc=T"),
+        (revcomp, (bytearray(b"=ACGT*ac+gg-cc=T"),), {}, bytearray(b"=A-gg+cc*tg=ACGT")),
+        (split, (b"=ACGT*ac+gg-cc=T",), {}, [b"=ACGT", b"*ac", b"+gg", b"-cc", b"=T"]),
+        (to_sequence, (b"=AC*gt=T-gg=C+tt=A",), {}, b"ACTTCTTA"),
+        (consensus, ([b"=ACGT", b"=AC*gt=T", b"=AC*gt=T"], [1, 1, 1]), {}, b"=AC*gt=T"),
+        (consensus_blocks, ((b"=ACGT", b"=ACGT"), [1, 101]), {}, [(1, b"=ACGT"), (101, b"=ACGT")]),
+        (adaptive_consensus, ([b"=ACGT", b"=ACGT", b"=AC*gt=T"], [1, 1, 1]), {}, (b"=ACGT", [])),
+    ],
+)
+def test_functions_accept_bytes(function, args, kwargs, expected):
+    result = function(*args, **kwargs)
+    assert result == expected
+    assert type(result) is type(expected)
+
+
+def test_to_vcf_accepts_bytes():
+    assert to_vcf([b"=AC*gt=T"], [b"chr1"], [1]) == to_vcf(["=AC*gt=T"], ["chr1"], [1]).encode()
+
+
+def test_mask_many_accepts_bytes():
+    cs_tags = [b"=ACGT*ac+gg-cc=T", "=ACGT"]
+    assert list(mask_many(cs_tags, [b"5M2I2D1M", "4M"], [b"AA!!!!AA", "!!AA"])) == [b"=ACNN*an+ng-cc=T", "=NNGT"]
+
+
+def test_cs_index_accepts_bytes():
+    index = CsIndex(b"=AC+gg=T-cc=GT", pos=1, cigar=b"6M2D2M")
+    assert index.ref_span() == CsIndex("=AC+gg=T-cc=GT", pos=1).ref_span()
+
+
+def test_iter_vcf_accepts_bytes():
+    records = [(b"=AC*gt=T", b"chr1", 1), (b":2*gt:1", "chr1", 1, b"ACTT", b"4M")]
+    assert list(iter_vcf(records)) == list(iter_vcf([("=AC*gt=T", "chr1", 1), (":2*gt:1", "chr1", 1, "ACTT", "4M")]))
+
+
+def test_consensus_builder_accepts_bytes():
+    builder = ConsensusBuilder()
+    builder.add(b"=ACGT", 1)
+    assert builder.finalize() == "=ACGT"
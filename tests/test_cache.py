@@ -0,0 +1,54 @@
+import pytest
+from src.cstag.utils.cache import CacheInfo, LRUCache
+
+
+def test_lru_cache_hits_and_misses():
+    cache = LRUCache(len, maxsize=2)
+    assert cache("A") == 1
+    assert cache("A") == 1
+    assert cache("AC") == 2
+    assert cache.cache_info() == CacheInfo(hits=1, misses=2, evictions=0, maxsize=2, currsize=2)
+
+
+def test_lru_cache_evicts_least_recently_used():
+    calls = []
+
+    def function(key):
+        calls.append(key)
+        return key.lower()
+
+    cache = LRUCache(function, maxsize=2)
+    cache("A")
+    cache("C")
+    cache("A")  # "C" becomes the least recently used
+    cache("G")
+    cache("A")
+    cache("C")
+    assert calls == ["A", "C", "G", "C"]
+    assert cache.cache_info() == CacheInfo(hits=2, misses=4, evictions=2, maxsize=2, currsize=2)
+
+
+def test_lru_cache_disabled():
+    cache = LRUCache(len, maxsize=0)
+    assert cache("ACGT") == 4
+    assert cache("ACGT") == 4
+    assert cache.cache_info() == CacheInfo(hits=0, misses=0, evictions=0, maxsize=0, currsize=0)
+
+
+def test_lru_cache_skips_long_keys():
+    cache = LRUCache(len, maxsize=2, max_key_length=3)
+    assert cache("ACGT") == 4
+    assert cache("ACG") == 3
+    assert cache.cache_info() == CacheInfo(hits=0, misses=1, evictions=0, maxsize=2, currsize=1)
+
+
+def test_lru_cache_set_maxsize():
+    cache = LRUCache(len, maxsize=3)
+    for key in ["A", "AC", "ACG"]:
+        cache(key)
+    cache.set_maxsize(1)
+    assert cache.cache_info() == CacheInfo(hits=0, misses=3, evictions=2, maxsize=1, currsize=1)
+    cache.cache_clear()
+    assert cache.cache_info() == CacheInfo(hits=0, misses=0, evictions=0, maxsize=1, currsize=0)
+    with pytest.raises(ValueError):
+        cache.set_maxsize(-1)
@@ -1,10 +1,19 @@
 import pytest
+from src.cstag.reference import Reference
 from src.cstag.call import (
     parse_cigar,
     parse_md,
     join_cigar,
     trim_clips,
+    clip_cigar,
+    call_cache_info,
+    set_call_cache_size,
+    iterate_cs_operations,
+    iterate_cs_operations_with_reference,
+    generate_cs_long,
+    generate_cs_short,
     call,
+    call_many,
 )
 
 ###########################################################
@@ -79,6 +88,129 @@ def test_trim_clips(cigar, seq, expected_cigar, expected_seq):
     assert new_seq == expected_seq
 
 
+@pytest.mark.parametrize(
+    "cigar, expected",
+    [
+        ("5S10M3S", ("10M", 5, 3)),
+        ("10M", ("10M", 0, 0)),
+        ("5H10M5H", ("10M", 0, 0)),
+        ("5S10M5H", ("10M", 5, 0)),
+    ],
+)
+def test_clip_cigar(cigar, expected):
+    assert clip_cigar(cigar) == expected
+
+
+###########################################################
+# Cache the parsed CIGAR and MD
+###########################################################
+
+
+def test_call_cache():
+    set_call_cache_size(4096)
+    for _ in range(3):
+        call("3S5M", "0C4", "NNNACGTA")
+    info = call_cache_info()
+    assert info["clip"].hits >= 2
+    assert info["md"].hits >= 2
+    set_call_cache_size(0)
+    assert call("3S5M", "0C4", "NNNACGTA") == "*ca:4"
+    assert call_cache_info()["md"].currsize == 0
+    set_call_cache_size(4096)
+
+
+def test_call_cache_skips_long_strings():
+    set_call_cache_size(4096)
+    cigar = "1M" * 81
+    md = "1A" * 40 + "1"
+    seq = "C" * 81
+    before = call_cache_info()
+    call(cigar, md, seq)
+    after = call_cache_info()
+    assert after["cigar"].currsize == before["cigar"].currsize
+    assert after["md"].currsize == before["md"].currsize
+
+
+###########################################################
+# Walk the CIGAR and MD runs together
+###########################################################
+
+
+def test_iterate_cs_operations():
+    cigar, md, seq = "8M2D4M2I3N1M", "2A5^AG7", "ACGTACGTACGTACG"
+    expected = [
+        ("=", 2, 0),
+        ("*", "A", 2),
+        ("=", 5, 3),
+        ("-", "AG", 8),
+        ("=", 4, 8),
+        ("+", 2, 12),
+        ("~", 3, 14),
+        ("=", 1, 14),
+    ]
+    assert list(iterate_cs_operations(cigar, md, seq)) == expected
+
+
+@pytest.fixture
+def reference(tmp_path):
+    path_fasta = tmp_path / "reference.fa"
+    path_fasta.write_text(">chr1\nAAACCCGGGT\nACGTACGTAC\nGTACGTACGT\n")
+    (tmp_path / "reference.fa.fai").write_text("chr1\t30\t6\t10\t11\n")
+    with Reference(path_fasta) as reference:
+        yield reference
+
+
+def test_iterate_cs_operations_with_reference(reference):
+    cigar, seq = "4M2D3M2I3N1M", "ACATGTAGGA"
+    expected = [
+        ("=", 2, 0),
+        ("*", "G", 2),
+        ("=", 1, 3),
+        ("-", "AC", 4),
+        ("=", 3, 4),
+        ("+", 2, 7),
+        ("~", 3, 9),
+        ("=", 1, 9),
+    ]
+    assert list(iterate_cs_operations_with_reference(cigar, seq, reference, "chr1", 11)) == expected
+
+
+###########################################################
+# Generate cs tag in long and short format
+###########################################################
+
+
+@pytest.mark.parametrize(
+    "cigar, md, seq, expected",
+    [
+        ("3M2M", "5", "ACGTA", "=ACGTA"),
+        ("5M", "1C0C2", "AGTTA", "=A*cg*ct=TA"),
+        ("2M1D3M", "2^A0C2", "ACGTA", "=AC-a*cg=TA"),
+        ("10M", "10", "ACGTA", "=ACGTA"),
+    ],
+)
+def test_generate_cs_long(cigar, md, seq, expected):
+    assert generate_cs_long(cigar, md, seq) == expected
+
+
+def test_generate_cs_long_long_read():
+    seq = "ACGT" * 25_000
+    assert generate_cs_long("100000M", "100000", seq) == f"={seq}"
+
+
+@pytest.mark.parametrize(
+    "cigar, md, seq, expected",
+    [
+        ("3M2M", "5", "ACGTA", ":5"),
+        ("5M", "1C0C2", "AGTTA", ":1*cg*ct:2"),
+        ("2M1D3M", "2^A0C2", "ACGTA", ":2-a*cg:2"),
+        ("100000M", "100000", "ACGT" * 25_000, ":100000"),
+    ],
+)
+def test_generate_cs_short(cigar, md, seq, expected):
+    assert generate_cs_short(cigar, md, seq) == expected
+
+
 ###########################################################
 # main
 ###########################################################
@@ -127,3 +259,48 @@ def test_generate_cs_tag_long_form(cigar, md, seq, expected):
 def test_generate_cs_tag_short_form(cigar, md, seq, expected):
     result = call(cigar, md, seq, long=False)
     assert result == expected
+
+
+@pytest.mark.parametrize(
+    "cigar, md, seq, pos, expected",
+    [
+        ("8M2D4M2I3N1M", None, "ACATACGTGTACTTC", 11, "=AC*ga=TACGT-ac=GTAC+tt~nn3nn=C"),
+        ("3S4M2D3M", None, "NNNACATGTA", 11, "=AC*ga=T-ac=GTA"),
+        ("4M", None, "acat", 1, "=a*ac=a*ct"),
+        # Extended CIGAR operations
+        ("2=1X1=2D3=", None, "ACATGTA", 11, "=AC*ga=T-ac=GTA"),
+        ("2=1X1=2D3=", "2G1^AC3", "ACATGTA", 11, "=AC*ga=T-ac=GTA"),
+    ],
+)
+def test_call_with_reference(reference, cigar, md, seq, pos, expected):
+    if md is None:
+        assert call(cigar, md, seq, long=True, reference=reference, chrom="chr1", pos=pos) == expected
+    else:
+        assert call(cigar, md, seq, long=True) == expected
+
+
+def test_call_without_md_and_reference():
+    with pytest.raises(ValueError):
+        call("5M", None, "ACGTA")
+
+
+###########################################################
+# Batch
+###########################################################
+
+CIGARS = ["8M2D4M2I", "5M", "5M", "5M1I3M", "5M1D4M", "3S5M", "8M2D4M2I3N1M"]
+MDS = ["8^AG6", "5", "3C1", "9", "5^A4", "5", "2A5^AG7"]
+SEQS = ["ACGTACGTACGTAC", "ACGTA", "ACGTG", "ACGTAGCTA", "ACGTGGCTA", "NNNACGTA", "ACGTACGTACGTACG"]
+
+
+@pytest.mark.parametrize("long", [True, False])
+@pytest.mark.parametrize("workers, chunksize", [(1, 1000), (2, 1000), (2, 2)])
+def test_call_many(long, workers, chunksize):
+    expected = [call(cigar, md, seq, long=long) for cigar, md, seq in zip(CIGARS, MDS, SEQS)]
+    result = call_many(iter(CIGARS), iter(MDS), iter(SEQS), long=long, workers=workers, chunksize=chunksize)
+    assert list(result) == expected
+
+
+def test_call_many_different_lengths():
+    with pytest.raises(ValueError):
+        list(call_many(CIGARS, MDS, SEQS[:-1], workers=1))
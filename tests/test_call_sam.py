@@ -0,0 +1,62 @@
+import io
+
+import pytest
+from src.cstag.call_sam import extract_md, add_cs_tag, call_sam, write_sam
+from src.cstag.reference import Reference
+
+HEADER = "@SQ\tSN:chr1\tLN:100\n"
+RECORD = "read1\t0\tchr1\t1\t60\t8M2D4M2I3N1M\t*\t0\t0\tACGTACGTACGTACG\tIIIIIIIIIIIIIII\tNM:i:5\tMD:Z:2A5^AG7\tAS:i:10\n"
+
+
+@pytest.mark.parametrize(
+    "tags, expected",
+    [
+        ("IIIII\tNM:i:1\tMD:Z:3C1\tAS:i:10", "3C1"),
+        ("IIIII\tMD:Z:3C1", "3C1"),
+        ("IIIII\tNM:i:1", None),
+    ],
+)
+def test_extract_md(tags, expected):
+    assert extract_md(tags) == expected
+
+
+@pytest.mark.parametrize(
+    "line, long, expected",
+    [
+        (HEADER, False, HEADER),
+        (RECORD, False, RECORD[:-1] + "\tcs:Z::2*ag:5-ag:4+ac~nn3nn:1\n"),
+        (RECORD, True, RECORD[:-1] + "\tcs:Z:=AC*ag=TACGT-ag=ACGT+ac~nn3nn=G\n"),
+        # MD at the end of the record
+        ("r\t0\tchr1\t1\t60\t5M\t*\t0\t0\tACGTG\tIIIII\tMD:Z:3C1\r\n", False, "r\t0\tchr1\t1\t60\t5M\t*\t0\t0\tACGTG\tIIIII\tMD:Z:3C1\tcs:Z::3*ct:1\r\n"),
+        # Unmapped, no SEQ, no MD, and already tagged records are passed through
+        ("r\t4\t*\t0\t0\t*\t*\t0\t0\tACGTG\tIIIII\n", False, "r\t4\t*\t0\t0\t*\t*\t0\t0\tACGTG\tIIIII\n"),
+        ("r\t256\tchr1\t1\t60\t5M\t*\t0\t0\t*\t*\tMD:Z:5\n", False, "r\t256\tchr1\t1\t60\t5M\t*\t0\t0\t*\t*\tMD:Z:5\n"),
+        ("r\t0\tchr1\t1\t60\t5M\t*\t0\t0\tACGTG\tIIIII\n", False, "r\t0\tchr1\t1\t60\t5M\t*\t0\t0\tACGTG\tIIIII\n"),
+        ("r\t0\tchr1\t1\t60\t5M\t*\t0\t0\tACGTG\tIIIII\tcs:Z::5\tMD:Z:5\n", False, "r\t0\tchr1\t1\t60\t5M\t*\t0\t0\tACGTG\tIIIII\tcs:Z::5\tMD:Z:5\n"),
+    ],
+)
+def test_add_cs_tag(line, long, expected):
+    assert add_cs_tag(line, long=long) == expected
+
+
+def test_call_sam():
+    sam = io.StringIO(HEADER + RECORD)
+    assert list(call_sam(sam)) == [HEADER, RECORD[:-1] + "\tcs:Z::2*ag:5-ag:4+ac~nn3nn:1\n"]
+
+
+@pytest.mark.parametrize("buffer_lines", [1, 2, 10000])
+def test_write_sam(buffer_lines):
+    sam = io.StringIO(HEADER + RECORD * 3)
+    output = io.StringIO()
+    write_sam(sam, output, long=True, buffer_lines=buffer_lines)
+    expected = HEADER + (RECORD[:-1] + "\tcs:Z:=AC*ag=TACGT-ag=ACGT+ac~nn3nn=G\n") * 3
+    assert output.getvalue() == expected
+
+
+def test_call_sam_with_reference(tmp_path):
+    path_fasta = tmp_path / "reference.fa"
+    path_fasta.write_text(">chr1\nAAACCCGGGT\n")
+    (tmp_path / "reference.fa.fai").write_text("chr1\t10\t6\t10\t11\n")
+    sam = ["r\t0\tchr1\t3\t60\t4M\t*\t0\t0\tACTC\tIIII\n"]
+    with Reference(path_fasta) as reference:
+        assert list(call_sam(sam, reference=reference)) == ["r\t0\tchr1\t3\t60\t4M\t*\t0\t0\tACTC\tIIII\tcs:Z::2*ct:1\n"]
@@ -1,8 +1,16 @@
+import pytest
+from src.cstag.utils.tokenizer import split_tokens
 from src.cstag.consensus import (
     split_cs_tags,
     normalize_read_lengths,
     get_consensus,
+    count_states,
     consensus,
+    consensus_blocks,
+    consensus_groups,
+    adaptive_consensus,
+    count_positions,
+    ConsensusBuilder,
 )
 
 
@@ -58,6 +66,18 @@ def test_get_consensus():
     assert get_consensus(cs_tags) == "=ACGT"
 
 
+def test_count_states():
+    columns = count_states([["A", "C"], ["C", "*gt"], [None, "C"]], [1, 2, 1])
+    assert columns == {1: {"A": 1}, 2: {"C": 3}, 3: {"*gt": 1}}
+
+
+def test_count_states_keeps_order_of_first_appearance_across_batches():
+    cs_tags = [["A", "*cg"]] * 300 + [["A", "-c"]] * 300
+    assert list(count_states(cs_tags, [1] * 600)[2]) == ["*cg", "-c"]
+    assert get_consensus(cs_tags) == "=A*cg-c"
+    assert get_consensus(cs_tags[::-1]) == "=A-c*cg"
+
+
 ###########################################################
 # main
 ###########################################################
@@ -114,3 +134,244 @@ def test_positions_more_than_one():
     ]
     POS = [101, 101, 102, 102, 101]
     assert consensus(CSTAG, POS) == "=AC*gt=T"
+
+
+def test_consensus_non_contiguous():
+    with pytest.raises(ValueError) as e:
+        consensus(["=ACGT", "=ACGT"], [1, 5_000_001])
+    assert "consensus_blocks" in str(e.value)
+
+
+###########################################################
+# consensus_blocks
+###########################################################
+
+
+def test_consensus_blocks():
+    CSTAG = ["=ACGT", "=AC*gt=T", "=AC*gt=T", "=CC", "=GG"]
+    POS = [1, 1, 1, 5_000_001, 5_000_003]
+    assert consensus_blocks(CSTAG, POS) == [(1, "=AC*gt=T"), (5_000_001, "=CCGG")]
+    assert consensus_blocks(CSTAG, POS, prefix=True) == [(1, "cs:Z:=AC*gt=T"), (5_000_001, "cs:Z:=CCGG")]
+
+
+def test_consensus_blocks_keeps_covered_positions_only():
+    columns = count_states(split_cs_tags(["=ACGT", "=ACGT"]), [1, 5_000_001])
+    assert sorted(columns) == [1, 2, 3, 4, 5_000_001, 5_000_002, 5_000_003, 5_000_004]
+
+
+def test_consensus_blocks_contiguous():
+    CSTAG = ["=ACGT", "=AC*gt=T", "=C*gt=T", "=C*gt=T", "=ACT+ccc=T"]
+    POS = [1, 1, 2, 2, 1]
+    assert consensus_blocks(CSTAG, POS) == [(1, consensus(CSTAG, POS))]
+
+
+###########################################################
+# Target regions
+###########################################################
+
+
+def test_consensus_regions():
+    CSTAG = ["=ACGT", "=AC*gt=T", "=C*gt=T", "=C*gt=T", "=ACT+ccc=T"]
+    POS = [1, 1, 2, 2, 1]
+    assert consensus(CSTAG, POS, regions=[(3, 4)]) == "*gt=T"
+    assert consensus(CSTAG, POS, regions=[(2, 2), (3, 4)]) == "=C*gt=T"
+    assert consensus(CSTAG, POS, regions=[(100, 200)]) == ""
+    assert consensus([":4", ":2*gt:1"], [1, 1], regions=[(2, 3)]) == ":1*gt"
+
+
+def test_consensus_blocks_regions(tmp_path):
+    CSTAG = ["=ACGT", "=AC*gt=T", "=AC*gt=T", "=CCGG", "=GG"]
+    POS = [1, 1, 1, 5_000_001, 5_000_003]
+    bed = tmp_path / "targets.bed"
+    bed.write_text("chr1\t2\t3\nchr1\t5000002\t5000003\n")
+    assert consensus_blocks(CSTAG, POS, regions=bed) == [(3, "*gt"), (5_000_003, "=G")]
+    assert consensus_blocks(CSTAG, POS, regions=[(10, 20)]) == []
+
+
+def test_consensus_regions_on_several_chromosomes():
+    with pytest.raises(ValueError):
+        consensus(["=ACGT"], [1], regions=[("chr1", 1, 2), ("chr2", 1, 2)])
+
+
+###########################################################
+# ConsensusBuilder
+###########################################################
+
+
+CSTAGS = ["=ACGT", "=AC*gt=T", "=C*gt=T", "=C*gt=T", "=ACT+ccc=T"] * 100
+POSITIONS = [1, 1, 2, 2, 1] * 100
+
+
+def test_consensus_builder_add():
+    builder = ConsensusBuilder()
+    for cs_tag, pos in zip(CSTAGS, POSITIONS):
+        builder.add(cs_tag, pos)
+    assert builder.finalize() == consensus(CSTAGS, POSITIONS) == "=AC*gt=T"
+    assert builder.finalize(prefix=True) == "cs:Z:=AC*gt=T"
+
+
+def test_consensus_builder_merge_and_serialize():
+    builders = [ConsensusBuilder() for _ in range(3)]
+    for i, (cs_tag, pos) in enumerate(zip(CSTAGS, POSITIONS)):
+        builders[i * 3 // len(CSTAGS)].add(cs_tag, pos)
+    builder = ConsensusBuilder.from_bytes(builders[0].to_bytes())
+    builder.merge(ConsensusBuilder.from_bytes(builders[1].to_bytes()))
+    builder.merge(builders[2])
+    assert builder.columns == ConsensusBuilder.from_bytes(builder.to_bytes()).columns
+    assert builder.finalize() == consensus(CSTAGS, POSITIONS)
+
+
+def test_consensus_builder_keeps_tie_order_of_consensus():
+    builder, other = ConsensusBuilder(), ConsensusBuilder()
+    builder.add("=A*cg", 1)
+    other.add("=A-c", 1)
+    builder.merge(other)
+    assert builder.finalize() == consensus(["=A*cg", "=A-c"], [1, 1]) == "=A*cg-c"
+
+
+def test_consensus_builder_blocks():
+    builder = ConsensusBuilder()
+    builder.add("=ACGT", 1)
+    builder.add("=ACGT", 5_000_001)
+    assert builder.finalize_blocks() == [(1, "=ACGT"), (5_000_001, "=ACGT")]
+    with pytest.raises(ValueError):
+        builder.finalize()
+
+
+def test_consensus_builder_errors():
+    with pytest.raises(ValueError):
+        ConsensusBuilder().finalize()
+    with pytest.raises(ValueError):
+        builder = ConsensusBuilder()
+        builder.add("=ACGT", 1)
+        builder.add(":4", 1)
+
+
+def test_consensus_builder_keeps_format_when_serialized():
+    builder = ConsensusBuilder()
+    builder.add("=ACGT", 1)
+    builder = ConsensusBuilder.from_bytes(builder.to_bytes())
+    assert builder.format == "long"
+    with pytest.raises(ValueError):
+        builder.add(":4", 1)
+    other = ConsensusBuilder()
+    other.add(":4", 1)
+    with pytest.raises(ValueError):
+        builder.merge(ConsensusBuilder.from_bytes(other.to_bytes()))
+
+
+def test_consensus_builder_format_is_set_by_the_first_tag_with_matches():
+    builder = ConsensusBuilder()
+    builder.add("*ag", 1)
+    builder.add("=A", 2)
+    with pytest.raises(ValueError):
+        builder.add(":1", 1)
+
+
+###########################################################
+# consensus_groups
+###########################################################
+
+
+GROUPS = {
+    "UMI1": (["=ACGT", "=AC*gt=T", "=AC*gt=T"], [1, 1, 1]),
+    "UMI2": (["=CGT"], [2]),
+    "UMI3": (["=AC-acgt=GT", "=C-acgt=GT", "=ACGT"], [1, 2, 1]),
+    **{f"single{i}": (["=ACGT"], [i + 1]) for i in range(10)},
+}
+
+
+@pytest.mark.parametrize("workers, batch_size", [(1, 1000), (2, 3), (2, 1)])
+def test_consensus_groups(workers, batch_size):
+    expected = {group: consensus(cs_tags, positions) for group, (cs_tags, positions) in GROUPS.items()}
+    assert dict(consensus_groups(GROUPS, workers=workers, batch_size=batch_size)) == expected
+
+
+def test_consensus_groups_errors():
+    with pytest.raises(ValueError):
+        dict(consensus_groups({"UMI1": (["=ACGT"], [1, 2])}, workers=1))
+    with pytest.raises(ValueError):
+        dict(consensus_groups(GROUPS, batch_size=0))
+
+
+###########################################################
+# adaptive_consensus
+###########################################################
+
+
+@pytest.mark.parametrize(
+    "cs_tag, expected",
+    [
+        ("=ACGT", 4),
+        ("=NACNNT", 4),
+        ("=AC-acgt=GT", 8),
+        ("=AC-acgt+tt=GT", 5),
+        ("+aa=AC~gt10ag*ag=T", 5),
+        (":2-acgt+tt:2", 5),
+    ],
+)
+def test_count_positions(cs_tag, expected):
+    assert count_positions(split_tokens(cs_tag)) == expected == len(split_cs_tags([cs_tag])[0])
+
+
+def test_adaptive_consensus_is_exact_by_default():
+    CSTAG = ["=ACGT", "=AC*gt=T", "=C*gt=T", "=C*gt=T", "=ACT+ccc=T"] * 100
+    POS = [1, 1, 2, 2, 1] * 100
+    cs_consensus, early_stopped = adaptive_consensus(CSTAG, POS)
+    assert cs_consensus == consensus(CSTAG, POS)
+    assert early_stopped == [2, 4]
+
+
+def test_adaptive_consensus_min_margin():
+    CSTAG = ["=ACGT"] * 300 + ["=AC*gt=T"] * 400
+    POS = [1] * 700
+    assert consensus(CSTAG, POS) == "=AC*gt=T"
+    assert adaptive_consensus(CSTAG, POS, min_margin=100) == ("=ACGT", [1, 2, 3, 4])
+    assert adaptive_consensus(CSTAG, POS, min_margin=1000) == ("=AC*gt=T", [1, 2, 4])
+
+
+def test_adaptive_consensus_errors():
+    with pytest.raises(ValueError):
+        adaptive_consensus(["=ACGT"], [1, 2])
+    with pytest.raises(ValueError):
+        adaptive_consensus(["=ACGT"], [1], min_margin=0)
+
+
+@pytest.mark.parametrize("min_margin", [None, 10])
+def test_adaptive_consensus_validates_reads_over_settled_positions(min_margin):
+    with pytest.raises(ValueError):
+        adaptive_consensus(["=ACGT"] * 300 + ["=AC!!"], [1] * 301, min_margin=min_margin)
+
+
+###########################################################
+# short format
+###########################################################
+
+
+def test_split_cs_tags_short_format():
+    assert split_cs_tags([":2*gt:1+ccc:1"]) == [["=", "=", "*gt", "=+ccc", "="]]
+
+
+def test_consensus_short_format():
+    cs_tags = [":4", ":2*gt:1", ":1*gt:1", ":1*gt:1", ":3+ccc:1"]
+    positions = [1, 1, 2, 2, 1]
+    assert consensus(cs_tags, positions) == ":2*gt:1"
+    assert consensus(cs_tags, positions, prefix=True) == "cs:Z::2*gt:1"
+    assert consensus_blocks([":2", ":2"], [1, 10]) == [(1, ":2"), (10, ":2")]
+    assert adaptive_consensus(cs_tags * 100, positions * 100)[0] == ":2*gt:1"
+
+
+def test_consensus_short_format_tie():
+    assert consensus([":4", ":2*gt:1"], [1, 1]) == ":2*gt:1"
+
+
+def test_consensus_mixed_formats():
+    with pytest.raises(ValueError):
+        consensus(["=ACGT", ":4"], [1, 1])
+    with pytest.raises(ValueError):
+        adaptive_consensus(["=ACGT", ":4"], [1, 1])
+    builder, other = ConsensusBuilder(), ConsensusBuilder()
+    builder.add("=ACGT", 1)
+    other.add(":4", 1)
+    with pytest.raises(ValueError):
+        builder.merge(other)
@@ -0,0 +1,140 @@
+import random
+
+import pytest
+from src.cstag import CsIndex, split
+
+
+def brute_force_alignment(cs_tag: str, pos: int = 0, softclip: int = 0) -> list[tuple[int | None, int | None]]:
+    """(reference position, query offset) of each base, walking the cs tag base by base"""
+    alignment = []
+    ref_pos, query_offset = pos, softclip
+    for cs in split(cs_tag):
+        op = cs[0]
+        if op in "=:*":
+            length = int(cs[1:]) if op == ":" else 1 if op == "*" else len(cs) - 1
+            for _ in range(length):
+                alignment.append((ref_pos, query_offset))
+                ref_pos += 1
+                query_offset += 1
+        elif op == "+":
+            for _ in range(len(cs) - 1):
+                alignment.append((None, query_offset))
+                query_offset += 1
+        else:
+            length = len(cs) - 1 if op == "-" else int(cs[3:-2])
+            for _ in range(length):
+                alignment.append((ref_pos, None))
+                ref_pos += 1
+    return alignment
+
+
+def random_cs_tag(rng: random.Random, n_ops: int) -> str:
+    cs_tag = []
+    match_op = rng.choice("=:")
+    for _ in range(n_ops):
+        op = rng.choice(match_op + "*+-~")
+        if op == "=":
+            cs_tag.append("=" + "".join(rng.choices("ACGTN", k=rng.randint(1, 5))))
+        elif op == ":":
+            cs_tag.append(f":{rng.randint(1, 5)}")
+        elif op == "*":
+            cs_tag.append("*ac")
+        elif op == "~":
+            cs_tag.append(f"~gt{rng.randint(1, 5)}ag")
+        else:
+            cs_tag.append(op + "".join(rng.choices("acgt", k=rng.randint(1, 3))))
+    return "".join(cs_tag)
+
+
+@pytest.mark.parametrize(
+    "cs_tag, pos, cigar",
+    [
+        ("=ACGT", 0, None),
+        ("=AC*gt=T-gg=C+tt=A", 1, None),
+        (":2*gt:1-gg:1+tt:1", 100, "3S9M"),
+        ("+ac=ACGT-cc~gt5ag=T+gg", 10, "4S6M2I"),
+        ("-acgt*ag:3+t", 1, None),
+    ],
+)
+def test_liftover_matches_brute_force(cs_tag, pos, cigar):
+    index = CsIndex(cs_tag, pos, cigar)
+    softclip = 4 if cigar == "4S6M2I" else 3 if cigar == "3S9M" else 0
+    alignment = brute_force_alignment(cs_tag, pos, softclip)
+    ref_to_query = {ref_pos: query_offset for ref_pos, query_offset in alignment if ref_pos is not None}
+    query_to_ref = {query_offset: ref_pos for ref_pos, query_offset in alignment if query_offset is not None}
+    assert (index.ref_start, index.ref_end) == (pos, pos + len(ref_to_query))
+    assert (index.query_start, index.query_end) == (softclip, softclip + len(query_to_ref))
+    assert [index.ref_to_query(ref_pos) for ref_pos in ref_to_query] == list(ref_to_query.values())
+    assert [index.query_to_ref(query_offset) for query_offset in query_to_ref] == list(query_to_ref.values())
+
+
+def test_liftover_random_tags():
+    rng = random.Random(1)
+    for _ in range(200):
+        cs_tag = random_cs_tag(rng, rng.randint(1, 20))
+        index = CsIndex(cs_tag)
+        alignment = brute_force_alignment(cs_tag, pos=1)
+        for ref_pos, query_offset in alignment:
+            if ref_pos is not None:
+                assert index.ref_to_query(ref_pos) == query_offset
+            if query_offset is not None:
+                assert index.query_to_ref(query_offset) == ref_pos
+
+
+def test_default_pos_is_1_based():
+    index = CsIndex("=AC*gt=T")
+    assert index.ref_span() == (1, 5)
+    assert index.ref_to_query(1) == 0
+
+
+def test_len():
+    assert len(CsIndex("=AC*gt=T-gg=C+tt=A")) == 7
+
+
+@pytest.mark.parametrize(
+    "method, value",
+    [("ref_to_query", 0), ("ref_to_query", 9), ("query_to_ref", -1), ("query_to_ref", 8)],
+)
+def test_out_of_range(method, value):
+    index = CsIndex("=AC*gt=T-gg=C+tt=A", pos=1)
+    with pytest.raises(ValueError) as e:
+        getattr(index, method)(value)
+    assert "out of the alignment" in str(e.value)
+
+
+@pytest.mark.parametrize(
+    "query_start, query_end, expected",
+    [
+        (None, None, (1, 9)),
+        (0, 3, (1, 4)),
+        (2, 4, (3, 5)),
+        (3, 5, (4, 8)),  # spans the deleted bases
+        (5, 7, (8, 8)),  # inside the insertion
+        (4, 7, (7, 8)),
+        (5, 8, (8, 9)),
+    ],
+)
+def test_ref_span(query_start, query_end, expected):
+    # Query: A C T T C T T A, reference: A C G T G G C A
+    index = CsIndex("=AC*gt=T-gg=C+tt=A", pos=1)
+    assert index.ref_span(query_start, query_end) == expected
+
+
+@pytest.mark.parametrize("query_start, query_end", [(3, 3), (0, 9), (-1, 2)])
+def test_ref_span_invalid(query_start, query_end):
+    with pytest.raises(ValueError):
+        CsIndex("=AC*gt=T-gg=C+tt=A").ref_span(query_start, query_end)
+
+
+def test_many():
+    index = CsIndex(":2*gt:1-gg:1+tt:1", pos=1)
+    ref_positions = [8, 1, 4, 5, 6]
+    query_offsets = [7, 0, 5, 6, 2]
+    assert index.ref_to_query_many(ref_positions) == [index.ref_to_query(p) for p in ref_positions]
+    assert index.query_to_ref_many(query_offsets) == [index.query_to_ref(q) for q in query_offsets]
+    assert index.ref_to_query_many([]) == []
+
+
+def test_invalid_cs_tag():
+    with pytest.raises(ValueError):
+        CsIndex("=ACGT*")
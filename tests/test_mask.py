@@ -81,3 +81,77 @@ def test_error_threshold_45():
     with pytest.raises(Exception) as e:
         _ = cstag.mask(CSTAG, CIGAR, QUAL, THRESHOLD)
         assert str(e.value) == "Error: threshold must be within a range between 0 to 40"
+
+
+###########################################################
+# mask_many
+###########################################################
+
+CSTAGS = ["=ACGT*ac+gg-cc=T", "=ACGT", "=ACGT~gt10ca=T", "=AC*ag=T"]
+CIGARS = ["5M2I2D1M", "4M", "4M10N1M", "2S4M"]
+QUALS = ["AA!!!!AA", "!!AA", "AA!!A", "!!!!!!"]
+
+
+def test_mask_many():
+    expected = [cstag.mask(cs, cigar, qual) for cs, cigar, qual in zip(CSTAGS, CIGARS, QUALS)]
+    assert list(cstag.mask_many(CSTAGS, CIGARS, QUALS)) == expected
+
+
+def test_mask_many_threshold_per_read():
+    thresholds = [0, 40, 15, 5]
+    expected = [cstag.mask(*record) for record in zip(CSTAGS, CIGARS, QUALS, thresholds)]
+    assert list(cstag.mask_many(iter(CSTAGS), iter(CIGARS), iter(QUALS), iter(thresholds))) == expected
+
+
+def test_mask_many_prefix():
+    assert list(cstag.mask_many(CSTAGS[:1], CIGARS[:1], QUALS[:1], prefix=True)) == ["cs:Z:=ACNN*an+ng-cc=T"]
+
+
+@pytest.mark.parametrize(
+    "cs_tags, cigars, quals, threshold",
+    [
+        (CSTAGS, CIGARS, QUALS[:-1], 10),
+        (CSTAGS, CIGARS, QUALS, [10, 10]),
+        (CSTAGS, CIGARS, QUALS, 45),
+        ([":4"], ["4M"], ["AAAA"], 10),
+    ],
+)
+def test_mask_many_errors(cs_tags, cigars, quals, threshold):
+    with pytest.raises(ValueError):
+        list(cstag.mask_many(cs_tags, cigars, quals, threshold))
+
+
+###########################################################
+# short format
+###########################################################
+
+
+def test_mask_short_format():
+    assert cstag.mask(":4*ac+gg-cc:1", "5M2I2D1M", "AA!!!!AA", seq="ACGTCGGT") == ":2*gn*tn*an+ng-cc:1"
+
+
+def test_mask_short_format_softclip():
+    assert cstag.mask(":4", "2S4M", "!!A!AA", seq="TTACGT") == ":1*cn:2"
+
+
+def test_mask_short_format_without_low_quality():
+    assert cstag.mask(":4", "4M", "AAAA", seq="ACGT") == ":4"
+
+
+def test_mask_short_format_same_bases_as_long_format():
+    cs_short, cigar, qual, seq = ":4*ac+gg-cc:1", "5M2I2D1M", "A!A!!!A!", "ACGTCGGT"
+    cs_masked = cstag.mask(cs_short, cigar, qual, seq=seq)
+    cs_long = cstag.lengthen(cs_short, cigar, seq)
+    assert cstag.to_sequence(cs_masked, seq) == cstag.to_sequence(cstag.mask(cs_long, cigar, qual))
+
+
+def test_mask_short_format_without_seq():
+    with pytest.raises(ValueError):
+        cstag.mask(":4", "4M", "!!!!")
+
+
+def test_mask_many_short_format():
+    cs_tags = [":4*ac+gg-cc:1", ":4"]
+    quals = ["AA!!!!AA", "!!AA"]
+    seqs = ["ACGTCGGT", "ACGT"]
+    assert list(cstag.mask_many(cs_tags, ["5M2I2D1M", "4M"], quals, seqs=seqs)) == [":2*gn*tn*an+ng-cc:1", "*an*cn:2"]
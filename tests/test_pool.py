@@ -0,0 +1,39 @@
+import pytest
+from src.cstag.utils.pool import imap_batches, iterate_largest_first_batches, map_largest_first
+
+
+def sum_batch(batch, offset=0):
+    return sum(batch) + offset
+
+
+def double_batch(batch, factor=2):
+    return [x * factor for x in batch]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_imap_batches_keeps_the_order_of_the_batches(workers):
+    batches = ([i, i + 1] for i in range(0, 20, 2))
+    assert list(imap_batches(sum_batch, batches, workers, 100)) == [2 * i + 101 for i in range(0, 20, 2)]
+
+
+def test_imap_batches_single_batch():
+    assert list(imap_batches(sum_batch, [[1, 2, 3]], 4)) == [6]
+
+
+def test_iterate_largest_first_batches():
+    assert list(iterate_largest_first_batches([1, 3, 2], 3)) == [[1], [2, 0]]
+    assert list(iterate_largest_first_batches([], 3)) == []
+
+
+@pytest.mark.parametrize("workers, batch_size", [(1, 1000), (2, 1000), (2, 3), (2, 1)])
+def test_map_largest_first(workers, batch_size):
+    items = [5, 1, 4, 2, 3]
+    results = list(map_largest_first(double_batch, items, items, batch_size, workers, 3))
+    assert sorted(results) == [(i, x * 3) for i, x in enumerate(items)]
+    if workers == 1:
+        assert [i for i, _ in results] == list(range(len(items)))
+
+
+def test_map_largest_first_invalid_batch_size():
+    with pytest.raises(ValueError):
+        list(map_largest_first(double_batch, [1], [1], 0, 1))
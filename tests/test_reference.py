@@ -0,0 +1,43 @@
+import pytest
+from src.cstag.reference import FaiRecord, read_fai, Reference
+
+REFERENCE = {"chr1": "ACGTACGTACGTAC", "chr2": "GGGGCCCCAA"}
+
+
+@pytest.fixture
+def path_fasta(tmp_path):
+    """FASTA with 4 bases per line and its .fai index"""
+    path_fasta = tmp_path / "reference.fa"
+    fai = []
+    with open(path_fasta, "w") as f:
+        for name, sequence in REFERENCE.items():
+            f.write(f">{name} description\n")
+            offset = f.tell()
+            for i in range(0, len(sequence), 4):
+                f.write(sequence[i : i + 4] + "\n")
+            fai.append(f"{name}\t{len(sequence)}\t{offset}\t4\t5\n")
+    (tmp_path / "reference.fa.fai").write_text("".join(fai))
+    return path_fasta
+
+
+def test_read_fai(path_fasta):
+    fai = read_fai(f"{path_fasta}.fai")
+    assert fai["chr1"] == FaiRecord(length=14, offset=18, line_bases=4, line_width=5)
+    assert fai["chr2"].length == 10
+
+
+@pytest.mark.parametrize(
+    "chrom, start, end",
+    [("chr1", 0, 14), ("chr1", 0, 4), ("chr1", 3, 9), ("chr1", 4, 8), ("chr1", 13, 14), ("chr2", 2, 10), ("chr2", 5, 5)],
+)
+def test_fetch(path_fasta, chrom, start, end):
+    with Reference(path_fasta) as reference:
+        assert reference.fetch(chrom, start, end) == REFERENCE[chrom][start:end]
+
+
+def test_fetch_error(path_fasta):
+    with Reference(path_fasta) as reference:
+        with pytest.raises(ValueError):
+            reference.fetch("chr3", 0, 1)
+        with pytest.raises(ValueError):
+            reference.fetch("chr1", 10, 15)
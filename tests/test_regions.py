@@ -0,0 +1,43 @@
+import pytest
+from src.cstag.utils.regions import RegionIndex, read_bed
+
+
+def test_read_bed(tmp_path):
+    bed = tmp_path / "targets.bed"
+    bed.write_text("track name=targets\n# comment\nchr1\t9\t20\tamplicon1\n\nchr2 0 5\n")
+    assert read_bed(bed) == [("chr1", 10, 20), ("chr2", 1, 5)]
+    assert RegionIndex(str(bed)).chroms == ["chr1", "chr2"]
+
+
+def test_region_index_merges_overlapping_and_adjacent_regions():
+    regions = RegionIndex([("chr1", 30, 40), ("chr1", 10, 20), ("chr1", 21, 25), ("chr1", 35, 50), ("chr1", 60, 60)])
+    assert list(regions.iter_regions_from("chr1", 1)) == [(10, 25), (30, 50), (60, 60)]
+    assert list(regions.iter_regions_from("chr1", 26)) == [(30, 50), (60, 60)]
+    assert list(regions.iter_regions_from("chr1", 61)) == []
+    assert list(regions.iter_regions_from("chr2", 1)) == []
+
+
+@pytest.mark.parametrize(
+    "start, end, expected",
+    [(1, 9, False), (1, 10, True), (25, 29, True), (26, 29, False), (51, 59, False), (45, 100, True), (61, 100, False)],
+)
+def test_region_index_overlaps(start, end, expected):
+    regions = RegionIndex([("chr1", 10, 25), ("chr1", 30, 50), ("chr1", 60, 60)])
+    assert regions.overlaps("chr1", start, end) is expected
+    assert regions.overlaps("chr2", start, end) is False
+
+
+def test_region_index_without_chromosomes():
+    regions = RegionIndex([(10, 20), (1, 5)])
+    assert regions.chroms == [None]
+    assert regions.contains(None, 5)
+    assert not regions.contains(None, 6)
+
+
+def test_region_index_converts_chromosomes_to_str():
+    assert RegionIndex([(1, 10, 20)]).contains("1", 15)
+
+
+def test_region_index_invalid():
+    with pytest.raises(ValueError):
+        RegionIndex([("chr1", 20, 10)])
@@ -0,0 +1,120 @@
+import random
+
+import pytest
+from src.cstag import slice as slice_cs, split
+from src.cstag.slice import iterate_slices
+
+
+def to_reference(cs_tag: str) -> str:
+    """Reference bases of a cs tag in the long format, with `N` for the intron"""
+    reference = []
+    for cs in split(cs_tag):
+        if cs[0] == "=" or cs[0] == "-":
+            reference.append(cs[1:].upper())
+        elif cs[0] == "*":
+            reference.append(cs[1].upper())
+        elif cs[0] == "~":
+            reference.append("N" * int(cs[3:-2]))
+    return "".join(reference)
+
+
+@pytest.mark.parametrize(
+    "cs_tag, start, end, pos, expected",
+    [
+        # Whole tag
+        ("=ACGT*ag=CGT", 1, 8, 1, "=ACGT*ag=CGT"),
+        ("=ACGT*ag=CGT", -5, 100, 1, "=ACGT*ag=CGT"),
+        # Trimmed matches
+        ("=ACGT*ag=CGT", 2, 3, 1, "=CG"),
+        ("=ACGT*ag=CGT", 5, 5, 1, "*ag"),
+        ("=ACGT*ag=CGT", 104, 106, 100, "*ag=CG"),
+        # Short format
+        (":4*ag:3", 2, 7, 1, ":3*ag:2"),
+        ("cs:Z::4*ag:3", 8, 8, 1, ":1"),
+        # Deletions crossing the interval
+        ("=AC-ggg=T", 2, 4, 1, "=C-gg"),
+        ("=AC-ggg=T", 4, 6, 1, "-gg=T"),
+        ("=AC-ggg=T", 4, 4, 1, "-g"),
+        # Insertions between two bases of the interval are kept
+        ("=AC+tt=GT", 2, 3, 1, "=C+tt=G"),
+        ("=AC+tt=GT", 3, 4, 1, "=GT"),
+        ("=AC+tt=GT", 1, 2, 1, "=AC"),
+        ("+tt=ACGT+aa", 0, 5, 1, "+tt=ACGT+aa"),
+        ("+tt=ACGT+aa", 1, 4, 1, "=ACGT"),
+        # Splices
+        ("=A~gt10ag=C", 1, 12, 1, "=A~gt10ag=C"),
+        ("=A~gt10ag=C", 5, 12, 1, "~nn7nn=C"),
+        ("=A~gt10ag=C", 1, 3, 1, "=A~nn2nn"),
+        ("=A~gt10ag=C", 4, 5, 1, "~nn2nn"),
+    ],
+)
+def test_slice(cs_tag, start, end, pos, expected):
+    assert slice_cs(cs_tag, start, end, pos) == expected
+
+
+@pytest.mark.parametrize("start, end", [(10, 20), (-5, 0)])
+def test_slice_outside_the_alignment(start, end):
+    assert slice_cs("=ACGT*ag=CGT", start, end) == ""
+    assert slice_cs("=ACGT*ag=CGT", start, end, prefix=True) == ""
+
+
+def test_slice_prefix():
+    assert slice_cs("cs:Z:=ACGT*ag=CGT", 2, 3, prefix=True) == "cs:Z:=CG"
+
+
+def test_slice_bytes():
+    assert slice_cs(b"=ACGT*ag=CGT", 2, 3) == b"=CG"
+
+
+@pytest.mark.parametrize(
+    "cs_tag, start, end, pos",
+    [
+        ("=ACGT*", 1, 2, 1),
+        ("=AC*g=GT", 1, 4, 1),
+        ("=AC=:2", 1, 4, 1),
+        ("=ACGT", 3, 2, 1),
+        ("=ACGT", 1, 2, 0),
+    ],
+)
+def test_slice_invalid(cs_tag, start, end, pos):
+    with pytest.raises(ValueError):
+        slice_cs(cs_tag, start, end, pos)
+
+
+def test_slice_does_not_validate_after_the_interval():
+    assert slice_cs("=ACGT*ag=CG!!", 2, 3) == "=CG"
+
+
+def test_slice_reference_bases():
+    rng = random.Random(1)
+    for _ in range(200):
+        cs_tag = []
+        for _ in range(rng.randint(1, 20)):
+            op = rng.choice("=*+-~")
+            if op == "=":
+                cs_tag.append("=" + "".join(rng.choices("ACGT", k=rng.randint(1, 5))))
+            elif op == "*":
+                cs_tag.append("*ac")
+            elif op == "~":
+                cs_tag.append(f"~gt{rng.randint(1, 5)}ag")
+            else:
+                cs_tag.append(op + "".join(rng.choices("acgt", k=rng.randint(1, 3))))
+        cs_tag = "".join(cs_tag)
+        reference = to_reference(cs_tag)
+        if not reference:
+            continue
+        pos = rng.randint(1, 100)
+        start = rng.randint(pos, pos + len(reference) - 1)
+        end = rng.randint(start, pos + len(reference) - 1)
+        assert to_reference(slice_cs(cs_tag, start, end, pos)) == reference[start - pos : end - pos + 1]
+
+
+def test_iterate_slices():
+    cs_tag = "=ACGT*ag=CGT-aaa=C~gt10ag:3"
+    intervals = [(1, 2), (4, 5), (7, 12), (15, 20), (30, 40), (50, 60)]
+    expected = [(start, end, slice_cs(cs_tag, start, end)) for start, end in intervals]
+    assert list(iterate_slices(cs_tag, intervals)) == [e for e in expected if e[2]]
+
+
+def test_iterate_slices_splice_across_intervals():
+    assert list(iterate_slices(":1~gt10ag:1", [(2, 3), (5, 20)], pos=1)) == [(2, 3, "~nn2nn"), (5, 20, "~nn7nn:1")]
@@ -1,4 +1,6 @@
 import pytest
+import sys
+from src.cstag import iter_split
 from src.cstag.split import split
 
 
@@ -32,3 +34,30 @@ from src.cstag.split import split
 )
 def test_split(input_str, prefix, expected_output):
     assert split(input_str, prefix) == expected_output
+
+
+@pytest.mark.parametrize(
+    "cs_tag",
+    ["", "cs:Z:", ":4*ag:3", "cs:Z:=ACGT*ac+gg-cc=T", "=AC*ag+t-ccc~gt1ac=AC", "=ACGT*ac+gg-cc=T" * 100],
+)
+def test_iter_split(cs_tag):
+    assert list(iter_split(cs_tag)) == split(cs_tag)
+    assert [cs_tag[start:end] for start, end in iter_split(cs_tag, spans=True)] == split(cs_tag)
+
+
+def test_iter_split_in_chunks(monkeypatch):
+    monkeypatch.setattr(sys.modules["cstag.utils.tokenizer"], "TOKEN_CHUNK_SIZE", 7)
+    cs_tag = "=ACGT*ac+gg-cc=T~gt10ag:12" * 10
+    assert list(iter_split(cs_tag)) == split(cs_tag)
+
+
+def test_iter_split_bytes():
+    buffer = memoryview(b"cs:Z::4*ag:3")
+    assert list(iter_split(buffer)) == [b":4", b"*ag", b":3"]
+    assert list(iter_split(buffer, spans=True)) == [(5, 7), (7, 10), (10, 12)]
+
+
+def test_iter_split_is_lazy():
+    tokens = iter_split("=ACGT*ac" * 100000)
+    assert next(tokens) == "=ACGT"
+    assert next(tokens) == "*ac"
@@ -1,18 +1,24 @@
 from pathlib import Path
 from src.cstag.split import split
-from src.cstag.to_html import append_mark_to_n, to_html
+from src.cstag.to_html import process_cs_tag, to_html
 
 
-def test_append_mark_to_n():
-    assert append_mark_to_n("=NACGT") == "@N=ACGT"
-    assert append_mark_to_n("=NNNACGT") == "@NNN=ACGT"
-    assert append_mark_to_n("=ACGTNNN") == "=ACGT@NNN"
-    assert append_mark_to_n("=ACGTNNNACGT") == "=ACGT@NNN=ACGT"
-    assert append_mark_to_n("") == ""
-    assert append_mark_to_n("=N") == "@N"
-    assert append_mark_to_n("=ACGT") == "=ACGT"
-    assert append_mark_to_n("=ANA") == "=A@N=A"
-    assert append_mark_to_n("=NAN") == "@N=A@N"
+def test_process_cs_tag_marks_n():
+    unknown = "<span class='Unknown'>{}</span>"
+    assert process_cs_tag("=NACGT") == f"<p class='p_seq'>{unknown.format('N')}ACGT</p>"
+    assert process_cs_tag("=NNNACGT") == f"<p class='p_seq'>{unknown.format('NNN')}ACGT</p>"
+    assert process_cs_tag("=ACGTNNN") == f"<p class='p_seq'>ACGT{unknown.format('NNN')}</p>"
+    assert process_cs_tag("=ACGTNNNACGT") == f"<p class='p_seq'>ACGT{unknown.format('NNN')}ACGT</p>"
+    assert process_cs_tag("") == "<p class='p_seq'></p>"
+    assert process_cs_tag("=N") == f"<p class='p_seq'>{unknown.format('N')}</p>"
+    assert process_cs_tag("=ACGT") == "<p class='p_seq'>ACGT</p>"
+    assert process_cs_tag("=ANA") == f"<p class='p_seq'>A{unknown.format('N')}A</p>"
+    assert process_cs_tag("=NAN") == f"<p class='p_seq'>{unknown.format('N')}A{unknown.format('N')}</p>"
+
+
+def test_process_cs_tag_merges_substitutions():
+    assert process_cs_tag("=A*ag*tc=T") == "<p class='p_seq'>A<span class='Sub'>GC</span>T</p>"
+    assert process_cs_tag("*ag*tc") == "<p class='p_seq'><span class='Sub'>GC</span></p>"
 
 
 def test_split_cstag():
@@ -126,3 +132,12 @@ def test_html_N_within_insertions():
     test = [h for h in cs_html.split("\n") if h.count("<p class='p_seq'>")][0]
     answer = "<p class='p_seq'>T<span class='Ins'>ACGT</span><span class='Unknown'>NNN</span><span class='Ins'>ACGT</span>G</p>"
     assert test == answer
+
+
+def test_html_short_format():
+    cs_html = to_html(":2+ggg:1-acgt*at", "Example", seq="ACGGGTT")
+    assert cs_html == to_html("=AC+ggg=T-acgt*at", "Example")
+
+
+def test_html_short_format_softclip():
+    assert to_html(":2*at", seq="GGACT", cigar="2S3M") == to_html("=AC*at")
@@ -1,3 +1,4 @@
+import pytest
 from src.cstag import to_sequence
 
 
@@ -17,3 +18,14 @@ def test_to_sequence_edge_cases():
     assert to_sequence("cs:Z:+a") == "A"
     assert to_sequence("cs:Z:*ag") == "G"
     assert to_sequence("cs:Z:~gt10ag") == ""
+
+
+def test_to_sequence_short_format():
+    assert to_sequence(":2*gt:1-gg:1+tt:1", "ACTTCTTA") == "ACTTCTTA"
+    assert to_sequence("cs:Z::4", "acgt") == "ACGT"
+    assert to_sequence(":2*ag", "TTACG", "2S3M") == "ACG"
+
+
+def test_to_sequence_short_format_without_seq():
+    with pytest.raises(ValueError):
+        to_sequence(":4")
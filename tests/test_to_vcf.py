@@ -1,21 +1,32 @@
 from __future__ import annotations
 
+import io
+
+import pytest
+from src.cstag import lengthen, to_vcf
 from src.cstag.to_vcf import (
     CsInfo,
     Vcf,
     VcfInfo,
     chrom_sort_key,
-    find_ref_for_insertion,
-    find_ref_for_deletion,
     get_variant_annotations,
     get_pos_end,
+    get_pos_end_bound,
     format_cs_tags,
     group_by_chrom,
     group_by_overlapping_intervals,
+    iter_match_runs,
+    count_runs_covering,
     call_reference_depth,
+    call_vcf_records,
     add_vcf_fields,
     process_cs_tag,
     process_cs_tags,
+    expand_anchor_bases,
+    iter_vcf,
+    write_vcf,
+    iterate_sorted_vcf_records,
+    VCF_HEADER,
 )
 
 ###########################################################
@@ -23,18 +34,23 @@ from src.cstag.to_vcf import (
 ###########################################################
 
 
-def test_find_ref_for_insertion():
-    assert find_ref_for_insertion(["=ACGT", "*ga", "+a"], 0) is None
-    assert find_ref_for_insertion(["=ACGT", "*ga", "+a"], 1) == "T"
-    assert find_ref_for_insertion(["=ACGT", "*ga", "+a"], 2) == "G"
-    assert find_ref_for_insertion(["=AC", "=GT", "-g", "+a"], 3) == "G"
+def test_get_variant_annotations_insertion_anchor():
+    assert get_variant_annotations(["=ACGT", "*ga", "+a"], 1) == [Vcf(pos=5, ref="G", alt="A"), Vcf(pos=5, ref="G", alt="GA")]
+    assert get_variant_annotations(["=ACGT", "+a"], 1) == [Vcf(pos=4, ref="T", alt="TA")]
+    assert get_variant_annotations(["=AC", "=GT", "-g", "+a"], 1) == [
+        Vcf(pos=4, ref="TG", alt="T"),
+        Vcf(pos=5, ref="G", alt="GA"),
+    ]
+    with pytest.raises(TypeError):
+        get_variant_annotations(["+a", "=ACGT"], 1)
 
 
-def test_find_ref_for_deletion():
-    assert find_ref_for_deletion(["=AC", "-g"], 1) == "CG"
-    assert find_ref_for_deletion(["=ACGT", "*ga", "-a"], 2) == "GA"
-    assert find_ref_for_deletion(["=ACGT", "*ga", "-ac"], 2) == "GAC"
-    assert find_ref_for_deletion(["=AC", "=GT", "+a", "-a"], 3) == "TA"
+def test_get_variant_annotations_deletion_anchor():
+    assert get_variant_annotations(["=AC", "-g"], 1) == [Vcf(pos=2, ref="CG", alt="C")]
+    assert get_variant_annotations(["=ACGT", "*ga", "-a"], 1)[1] == Vcf(pos=5, ref="GA", alt="G")
+    assert get_variant_annotations(["=ACGT", "*ga", "-ac"], 1)[1] == Vcf(pos=5, ref="GAC", alt="G")
+    assert get_variant_annotations(["=AC", "=GT", "+a", "-a"], 1)[1] == Vcf(pos=4, ref="TA", alt="T")
+    assert get_variant_annotations(["-ac", "=GT"], 1) == [Vcf(pos=0, ref="AC", alt="A")]
 
 
 def test_get_variant_annotations():
@@ -55,7 +71,7 @@ def test_get_variant_annotations():
     ]
     assert get_variant_annotations(["=AC", "-a", "=AC", "-aa"], 1) == [
         Vcf(None, 2, "CA", "C", info=default_info),
-        Vcf(None, 4, "CAA", "C", info=default_info),
+        Vcf(None, 5, "CAA", "C", info=default_info),
     ]
 
     # combinations
@@ -158,6 +174,23 @@ def test_group_by_overlapping_intervals():
     assert group_by_overlapping_intervals(cs_tags_input) == expected_output
 
 
+def test_group_by_overlapping_intervals_chained():
+    # The third interval overlaps only the first one, which ends after the second one
+    cs_tags_input = [
+        CsInfo(cs_tag="=A", pos_start=1, pos_end=100),
+        CsInfo(cs_tag="=A", pos_start=10, pos_end=20),
+        CsInfo(cs_tag="=A", pos_start=50, pos_end=150),
+        CsInfo(cs_tag="=A", pos_start=150, pos_end=160),
+        CsInfo(cs_tag="=A", pos_start=161, pos_end=170),
+    ]
+    assert group_by_overlapping_intervals(cs_tags_input[::-1]) == [cs_tags_input[:4], cs_tags_input[4:]]
+    assert group_by_overlapping_intervals(iter(cs_tags_input), presorted=True) == [cs_tags_input[:4], cs_tags_input[4:]]
+
+
+def test_group_by_overlapping_intervals_empty():
+    assert group_by_overlapping_intervals([]) == []
+
+
 ###########################################################
 # Add VCF info
 ###########################################################
@@ -179,6 +212,72 @@ def test_call_reference_depth():
     assert result == expected_output, f"Expected {expected_output}, but got {result}"
 
 
+@pytest.mark.parametrize(
+    "cs_tag_split, expected",
+    [
+        (["=ACGT"], [(0, 4)]),
+        ([":4", "*ag", ":2"], [(0, 4), (5, 7)]),
+        # The base before an insertion is not a match
+        (["=AC", "+tt", "=GT"], [(0, 1), (2, 4)]),
+        (["+tt", "=GT"], [(0, 2)]),
+        # Deleted bases and splices take their reference positions
+        (["=AC", "-gg", "=T"], [(0, 2), (4, 5)]),
+        (["=AC", "-gg", "+t", "=T"], [(0, 2), (4, 5)]),
+        (["=A", "~gt10ag", "=C"], [(0, 1), (11, 12)]),
+        # `N` is not a match
+        (["=ANNCG"], [(0, 1), (3, 5)]),
+        (["=NAC"], [(1, 3)]),
+        (["=AC", ":2"], [(0, 4)]),
+        # A zero-length match makes no run
+        ([":0", "*ag", ":3"], [(1, 4)]),
+    ],
+)
+def test_iter_match_runs(cs_tag_split, expected):
+    assert list(iter_match_runs(cs_tag_split)) == expected
+
+
+def test_count_runs_covering():
+    runs = [(0, 4), (2, 6), (5, 9), (3, 4)]
+    windows = [(3, 4), (2, 4), (3, 6), (5, 6), (8, 10), (0, 1)]
+    assert count_runs_covering(runs, windows) == [3, 2, 1, 2, 0, 1]
+    assert count_runs_covering([], windows) == [0] * len(windows)
+    # Runs and windows at offset 0
+    assert count_runs_covering([(0, 0), (0, 1)], [(0, 1), (0, 0)]) == [1, 2]
+
+
+def test_to_vcf_zero_length_match_at_first_position():
+    vcf = to_vcf([":0*ag:3", ":4"], ["chr1", "chr1"], [1, 1])
+    assert vcf.split("\n")[-1] == "chr1\t1\t.\tA\tG\t.\t.\tDP=2;RD=1;AD=1;VAF=0.5"
+
+
+def test_call_reference_depth_short_format():
+    variant_annotations = [Vcf(pos=3, ref="G", alt="T"), Vcf(pos=2, ref="CGT", alt="C")]
+    cs_tags_list = [":2*gt:1", ":4", "=ACGT"]
+    positions_list = [1, 1, 1]
+    assert call_reference_depth(variant_annotations, cs_tags_list, positions_list) == {("G", 3): 2, ("CGT", 2): 2}
+
+
+def test_call_reference_depth_after_deletion():
+    # The substitution is at the 5th reference base of both reads, after the deleted bases of the second read
+    variant_annotations = [Vcf(pos=2, ref="CGT", alt="C"), Vcf(pos=5, ref="A", alt="T")]
+    cs_tags_list = ["=ACGTACGT", "=AC-gt*at=CGT"]
+    positions_list = [1, 1]
+    assert call_reference_depth(variant_annotations, cs_tags_list, positions_list) == {("CGT", 2): 1, ("A", 5): 1}
+
+
+@pytest.mark.parametrize(
+    "cs_tags, seqs",
+    [
+        ([":8", ":2-gt:2*gt:1"], ["ACGTACGT", "ACACTT"]),
+        ([":8", ":2-gt:1+aa:1*gt:1", ":3-gt*ag:2"], ["ACGTACGT", "ACAAACTT", "ACGGCG"]),
+    ],
+)
+def test_to_vcf_short_format_equals_long_format(cs_tags, seqs):
+    cs_tags_long = [lengthen(cs_tag, f"{len(seq)}M", seq) for cs_tag, seq in zip(cs_tags, seqs)]
+    expected = to_vcf(cs_tags_long, ["chr1"] * len(cs_tags), [1] * len(cs_tags))
+    assert to_vcf(cs_tags, ["chr1"] * len(cs_tags), [1] * len(cs_tags), seqs=seqs) == expected
+
+
 def test_add_vcf_fields():
     sample_variant_annotations = [
         Vcf(chrom=None, pos=1, ref="A", alt="T", info=VcfInfo(dp=None, rd=None, ad=None, vaf=None)),
@@ -214,7 +313,7 @@ def test_process_cs_tag():
 #CHROM	POS	ID	REF	ALT	QUAL	FILTER	INFO
 chr1	3	.	G	T	.	.	.
 chr1	4	.	TGG	T	.	.	.
-chr1	5	.	C	CTT	.	.	."""
+chr1	7	.	C	CTT	.	.	."""
     assert process_cs_tag(cs_tag1, chrom1, pos1) == expected_output1
 
     cs_tag2 = "=AC*ga"
@@ -253,3 +352,249 @@ def test_process_cs_tags_with_splice():
     positions = [2, 2, 3, 10, 100, 5]
     expected_output = """##fileformat=VCFv4.2\n##INFO=<ID=DP,Number=1,Type=Integer,Description="Total Depth">\n##INFO=<ID=RD,Number=1,Type=Integer,Description="Depth of Ref allele">\n##INFO=<ID=AD,Number=1,Type=Integer,Description="Depth of Alt allele">\n##INFO=<ID=VAF,Number=1,Type=Float,Description="Variant allele frequency (AD/DP)">\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\nchr1\t4\t.\tG\tT\t.\t.\tDP=3;RD=1;AD=2;VAF=0.667\nchr2\t102\t.\tG\tT\t.\t.\tDP=1;RD=0;AD=1;VAF=1.0"""
     assert process_cs_tags(cs_tags, chroms, positions) == expected_output
+
+
+###########################################################
+# short format
+###########################################################
+
+
+def test_expand_anchor_bases():
+    assert list(expand_anchor_bases([":4", "*ag", ":3"], None)) == [":4", "*ag", ":3"]
+    assert list(expand_anchor_bases([":2", "*gt", ":1", "-gg", ":1", "+tt", ":1"], "ACTTCTTA")) == [
+        ":2", "*gt", "=T", "-gg", "=C", "+tt", ":1"
+    ]
+    assert list(expand_anchor_bases([":3", "+tt"], "GGACGTT", 2)) == [":2", "=G", "+tt"]
+
+
+def test_expand_anchor_bases_without_seq():
+    with pytest.raises(ValueError):
+        list(expand_anchor_bases([":3", "+tt"], None))
+
+
+def test_process_cs_tag_short_format():
+    cs_tag_long = "=AC*gt=T-gg=C+tt=A"
+    cs_tag_short = ":2*gt:1-gg:1+tt:1"
+    assert process_cs_tag(cs_tag_short, "chr1", 1, "ACTTCTTA") == process_cs_tag(cs_tag_long, "chr1", 1)
+    assert process_cs_tag(cs_tag_short, "chr1", 1, "GGACTTCTTA", "2S8M") == process_cs_tag(cs_tag_long, "chr1", 1)
+
+
+def test_process_cs_tags_short_format():
+    cs_tags = [":4", ":2*gt:1", ":1*gt:1", ":4", ":2*gt:1"]
+    chroms = ["chr1", "chr1", "chr1", "chr2", "chr2"]
+    positions = [2, 2, 3, 10, 100]
+    cs_tags_long = ["=ACGT", "=AC*gt=T", "=C*gt=T", "=ACGT", "=AC*gt=T"]
+    assert process_cs_tags(cs_tags, chroms, positions) == process_cs_tags(cs_tags_long, chroms, positions)
+
+
+def test_process_cs_tags_short_format_indels():
+    cs_tags = [":2-gg:2", ":6", ":1+ac:3"]
+    seqs = ["ACTA", "ACGGTA", "CACGGT"]
+    positions = [1, 1, 2]
+    cs_tags_long = ["=AC-gg=TA", "=ACGGTA", "=C+ac=GGT"]
+    chroms = ["chr1"] * 3
+    assert process_cs_tags(cs_tags, chroms, positions, seqs) == process_cs_tags(cs_tags_long, chroms, positions)
+
+
+###########################################################
+# Stream
+###########################################################
+
+STREAM_RECORDS = [
+    ("=ACGT", "chr1", 2),
+    ("=AC*gt=T", "chr1", 2),
+    ("=C*gt=T", "chr1", 3),
+    ("=AC-gg=T+aa=A", "chr1", 3),
+    ("=GT+aa=CA", "chr1", 5),
+    ("=AC~gt10ag=T", "chr1", 7),
+    ("=ACGT", "chr2", 10),
+    ("=AC*gt=T", "chr2", 100),
+    ("=C*gt=T", "chr2", 101),
+]
+
+
+@pytest.mark.parametrize("flush_variants", [1, 2, 10000])
+def test_iter_vcf(monkeypatch, flush_variants):
+    monkeypatch.setattr("src.cstag.to_vcf.FLUSH_VARIANTS", flush_variants)
+    cs_tags, chroms, positions = map(list, zip(*STREAM_RECORDS))
+    expected = process_cs_tags(cs_tags, chroms, positions)
+    assert "".join(iter_vcf(iter(STREAM_RECORDS))) == expected + "\n"
+
+
+def test_iter_vcf_short_format():
+    records = [(":2-gg:2", "chr1", 1, "ACTA", None), (":6", "chr1", 1, "ACGGTA", None), (":1+ac:3", "chr1", 2, "TTCACGGT", "2S6M")]
+    expected = process_cs_tags(["=AC-gg=TA", "=ACGGTA", "=C+ac=GGT"], ["chr1"] * 3, [1, 1, 2])
+    assert "".join(iter_vcf(records)) == expected + "\n"
+
+
+def test_iter_vcf_empty():
+    assert "".join(iter_vcf([])) == VCF_HEADER + "\n"
+
+
+@pytest.mark.parametrize(
+    "records",
+    [
+        [("=ACGT", "chr1", 10), ("=ACGT", "chr1", 9)],
+        [("=ACGT", "chr1", 10), ("=ACGT", "chr2", 1), ("=ACGT", "chr1", 20)],
+        [("=ACGT", "chr1", 0)],
+        [("=ACGT*", "chr1", 1)],
+    ],
+)
+def test_iter_vcf_invalid(records):
+    with pytest.raises(ValueError):
+        list(iter_vcf(records))
+
+
+def test_write_vcf():
+    output = io.StringIO()
+    write_vcf(STREAM_RECORDS, output, buffer_lines=2)
+    assert output.getvalue() == "".join(iter_vcf(STREAM_RECORDS))
+
+
+###########################################################
+# Parallel
+###########################################################
+
+
+@pytest.mark.parametrize("workers, batch_size", [(2, 1), (2, 3), (None, 1000)])
+def test_process_cs_tags_workers(workers, batch_size):
+    cs_tags, chroms, positions = map(list, zip(*STREAM_RECORDS))
+    expected = process_cs_tags(cs_tags, chroms, positions)
+    assert process_cs_tags(cs_tags, chroms, positions, workers=workers, batch_size=batch_size) == expected
+
+
+def test_process_cs_tags_invalid_batch_size():
+    with pytest.raises(ValueError):
+        process_cs_tags(["=ACGT"], ["chr1"], [1], batch_size=0)
+
+
+###########################################################
+# Out-of-core
+###########################################################
+
+
+@pytest.mark.parametrize("max_memory, merge_fan_in", [(1, 64), (1, 2), (1000, 2), (10**9, 64)])
+def test_process_cs_tags_max_memory(monkeypatch, max_memory, merge_fan_in):
+    monkeypatch.setattr("src.cstag.to_vcf.MERGE_FAN_IN", merge_fan_in)
+    cs_tags, chroms, positions = map(list, zip(*STREAM_RECORDS))
+    expected = process_cs_tags(cs_tags, chroms, positions)
+    assert process_cs_tags(cs_tags, chroms, positions, max_memory=max_memory) == expected
+
+
+def test_iterate_sorted_vcf_records_keeps_the_order_of_ties():
+    variants = [
+        Vcf(chrom="chr2", pos=5, ref="A", alt="G"),
+        Vcf(chrom="chr1", pos=9, ref="C", alt="T"),
+        Vcf(chrom="chr2", pos=5, ref="A", alt="AT"),
+        Vcf(chrom="chr1", pos=9, ref="C", alt="A"),
+        Vcf(chrom="chr10", pos=1, ref="G", alt="C"),
+    ]
+    lines = list(iterate_sorted_vcf_records(variants, max_memory=1))
+    assert [line.split("\t")[4] for line in lines] == ["T", "A", "G", "AT", "C"]
+
+
+def test_process_cs_tags_invalid_max_memory():
+    with pytest.raises(ValueError):
+        process_cs_tags(["=AC*gt=T"], ["chr1"], [1], max_memory=0)
+
+
+###########################################################
+# Filters
+###########################################################
+
+
+def filter_vcf_records(vcf: str, min_ad: int, min_dp: int, min_vaf: float) -> str:
+    lines = []
+    for line in vcf.split("\n"):
+        if not line.startswith("#"):
+            info = dict(field.split("=") for field in line.split("\t")[7].split(";"))
+            if int(info["AD"]) < min_ad or int(info["DP"]) < min_dp or float(info["VAF"]) < min_vaf:
+                continue
+        lines.append(line)
+    return "\n".join(lines)
+
+
+@pytest.mark.parametrize(
+    "min_ad, min_dp, min_vaf", [(1, 1, 0.0), (2, 1, 0.0), (1, 3, 0.0), (1, 1, 0.5), (2, 3, 0.5), (3, 1, 0.0)]
+)
+def test_process_cs_tags_thresholds(min_ad, min_dp, min_vaf):
+    cs_tags, chroms, positions = map(list, zip(*STREAM_RECORDS))
+    expected = filter_vcf_records(process_cs_tags(cs_tags, chroms, positions), min_ad, min_dp, min_vaf)
+    assert process_cs_tags(cs_tags, chroms, positions, min_ad=min_ad, min_dp=min_dp, min_vaf=min_vaf) == expected
+
+
+def test_call_vcf_records_skips_the_reference_depth(monkeypatch):
+    def fail(*args):
+        raise AssertionError("call_reference_depth should not be called")
+
+    monkeypatch.setattr("src.cstag.to_vcf.call_reference_depth", fail)
+    variant_annotations = [Vcf(pos=4, ref="G", alt="T"), Vcf(pos=5, ref="T", alt="A")]
+    cs_infos = [CsInfo("=AC*gt*ta", 2, 5), CsInfo("=ACGT", 2, 5)]
+    assert call_vcf_records(variant_annotations, cs_infos, "chr1", min_ad=2) == []
+    assert call_vcf_records(variant_annotations, cs_infos, "chr1", min_dp=4) == []
+
+
+def test_call_reference_depth_ref_alleles():
+    variant_annotations = [Vcf(pos=4, ref="G", alt="T"), Vcf(pos=4, ref="G", alt="A"), Vcf(pos=5, ref="T", alt="A")]
+    cs_tags_list = ["=AC*gt*ta", "=ACGT", "=AC*ga=T"]
+    positions_list = [2, 2, 2]
+    # The reference depth still counts each variant sharing the REF allele at a position
+    assert call_reference_depth(variant_annotations, cs_tags_list, positions_list, {("G", 4)}) == {("G", 4): 2}
+
+
+###########################################################
+# Target regions
+###########################################################
+
+
+def filter_vcf_regions(vcf: str, regions: list[tuple[str, int, int]]) -> str:
+    lines = []
+    for line in vcf.split("\n"):
+        if not line.startswith("#"):
+            chrom, pos = line.split("\t")[:2]
+            if not any(chrom == c and start <= int(pos) <= end for c, start, end in regions):
+                continue
+        lines.append(line)
+    return "\n".join(lines)
+
+
+@pytest.mark.parametrize(
+    "regions",
+    [[("chr1", 1, 1000)], [("chr1", 4, 4)], [("chr1", 5, 6), ("chr2", 102, 102)], [("chr2", 1, 100)], [("chr3", 1, 100)]],
+)
+def test_to_vcf_regions(regions):
+    cs_tags, chroms, positions = map(list, zip(*STREAM_RECORDS))
+    expected = filter_vcf_regions(to_vcf(cs_tags, chroms, positions), regions)
+    assert to_vcf(cs_tags, chroms, positions, regions=regions) == expected
+    assert to_vcf(cs_tags, chroms, positions, regions=regions, workers=2, batch_size=1) == expected
+
+
+def test_to_vcf_regions_single_cs_tag():
+    vcf = to_vcf("=AC*gt=T-gg=C+tt=A", "chr1", 1, regions=[("chr1", 4, 5)])
+    assert vcf.split("\n")[2:] == ["chr1\t4\t.\tTGG\tT\t.\t.\t."]
+
+
+@pytest.mark.parametrize("cs_tag, pos", [("=ACGT*ag=C", 10), (":4*ag:1", 10), ("=AC~gt10ag=T", 1), ("cs:Z:-acg=T", 5)])
+def test_get_pos_end_bound(cs_tag, pos):
+    assert get_pos_end_bound(cs_tag, pos) >= get_pos_end(cs_tag, pos)
+
+
+def test_to_vcf_regions_skip_cs_tags_outside_without_validating_them():
+    cs_tags, chroms, positions = ["=AC*gt=T", "=AC!!"], ["chr1", "chr1"], [1, 100]
+    assert to_vcf(cs_tags, chroms, positions, regions=[("chr1", 1, 10)]) == to_vcf(cs_tags[:1], chroms[:1], positions[:1])
+    with pytest.raises(ValueError):
+        to_vcf(cs_tags, chroms, positions, regions=[("chr1", 1, 100)])
+
+
+def test_to_vcf_regions_without_chromosome():
+    with pytest.raises(ValueError):
+        to_vcf(["=AC*gt=T"], ["chr1"], [1], regions=[(1, 10)])
+    with pytest.raises(ValueError):
+        to_vcf("=AC*gt=T", "chr1", 1, regions=[("chr1", 1, 10), (20, 30)])
+
+
+def test_to_vcf_regions_bed(tmp_path):
+    bed = tmp_path / "targets.bed"
+    bed.write_text("chr1\t3\t4\n")
+    cs_tags, chroms, positions = map(list, zip(*STREAM_RECORDS))
+    assert to_vcf(cs_tags, chroms, positions, regions=bed) == to_vcf(cs_tags, chroms, positions, regions=[("chr1", 4, 4)])
@@ -5,6 +5,8 @@ from src.cstag.utils.validator import (
     validate_long_format,
     validate_threshold,
     validate_pos,
+    validate_seq,
+    validate_same_format,
 )
 
 
@@ -111,3 +113,20 @@ def test_validate_pos():
 
     with pytest.raises(ValueError, match=r"pos must be a positive integer, but got -1"):
         validate_pos(-1)
+
+
+def test_validate_seq():
+    validate_seq("=ACGT", None)
+    validate_seq("cs:Z:=ACGT", None)
+    validate_seq(":4", "ACGT")
+    with pytest.raises(ValueError):
+        validate_seq(":4", None)
+    with pytest.raises(ValueError):
+        validate_seq("cs:Z::4", None)
+
+
+def test_validate_same_format():
+    validate_same_format(["=ACGT", "cs:Z:=AC*ag"])
+    validate_same_format([":4", "cs:Z::2*ag"])
+    with pytest.raises(ValueError):
+        validate_same_format(["=ACGT", ":4"])